@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+import os
+import sys
+import logging
+from glob import glob
+
+## PROJECT LIBS
+from sonet.scheduler import Scheduler, wiki_job
+
+
+def latest_dump(dataset, lang, type_):
+    """
+    Returns the most recent dump of type type_ of the lang wiki in dataset
+    or in its lang directory (None if there's none)
+    """
+    pattern = '%swiki-*-%s.xml.*' % (lang, type_)
+    files = glob(os.path.join(dataset, pattern)) + glob(
+        os.path.join(dataset, lang, pattern))
+    ## the date is the only difference between the names
+    return max(files, key=os.path.basename) if files else None
+
+
+def main():
+    import optparse
+    import shlex
+
+    p = optparse.OptionParser(
+        usage="usage: %prog [options] file [file ...]\n"
+              "       %prog [options] -d DATASET lang [lang ...]",
+        description='Make the graph, the rich graph and the analysis of '
+        'many wikis (files are dumps or graphs) with utpedits2graph.py, '
+        'graph_enrich.py and graph_analysis.py, running more wikis at the '
+        'same time, the largest first. Steps whose outputs are newer than '
+        'their inputs are skipped, so an interrupted run can be restarted.')
+    p.add_option('-v', action="store_true", dest="verbose", default=False,
+                 help="Verbose output")
+    p.add_option('-d', '--dataset', action="store", dest="dataset",
+                 default=None, metavar="DIR",
+                 help="Arguments are languages: analyse the most recent dump "
+                      "of each one in DIR or in DIR/LANG")
+    p.add_option('-t', '--type', action="store", dest="type",
+                 default="stub-meta-history",
+                 help="Type of the dumps used with --dataset "
+                      "(default: %default)")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+                 default=None, metavar="N",
+                 help="Run at most N wikis at the same time (default: the "
+                      "number of cores)")
+    p.add_option('-m', '--memory', action="store", dest="memory",
+                 type="int", default=None, metavar="MB",
+                 help="Memory available to the wikis running at the same "
+                      "time (default: the physical memory)")
+    p.add_option('-f', '--memory-factor', action="store",
+                 dest="memory_factor", type="float", default=10.,
+                 help="Estimate the memory needed by a wiki as this factor "
+                      "times the size of its file (default: %default)")
+    p.add_option('-s', '--status', action="store", dest="status",
+                 default="analyse_wikis.json", metavar="FILE",
+                 help="Save the status of every step in FILE "
+                      "(default: %default)")
+    p.add_option('--graph-options', action="store", dest="graph_options",
+                 default="", metavar="OPTIONS",
+                 help="Options of utpedits2graph.py")
+    p.add_option('--enrich-options', action="store", dest="enrich_options",
+                 default="", metavar="OPTIONS",
+                 help="Options of graph_enrich.py")
+    p.add_option('--analysis-options', action="store",
+                 dest="analysis_options",
+                 default="--group -der --distance --power-law",
+                 metavar="OPTIONS",
+                 help="Options of graph_analysis.py, whose output is saved "
+                      "in LANGwiki-DATE-TYPE-analysis.txt (default: "
+                      "%default)")
+    opts, args = p.parse_args()
+
+    if not args:
+        p.error("Give me some files, please ;-)")
+
+    logging.basicConfig(stream=sys.stderr,
+                        level=logging.DEBUG if opts.verbose else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+
+    files = args
+    if opts.dataset:
+        files = []
+        for lang in args:
+            fn = latest_dump(opts.dataset, lang, opts.type)
+            if fn is None:
+                logging.error('No %s dump of %swiki in %s', opts.type, lang,
+                              opts.dataset)
+                continue
+            files.append(fn)
+
+    jobs = [wiki_job(fn, graph_options=shlex.split(opts.graph_options),
+                     enrich_options=shlex.split(opts.enrich_options),
+                     analysis_options=shlex.split(opts.analysis_options))
+            for fn in files]
+
+    memory = opts.memory * 1024 * 1024 if opts.memory else None
+    scheduler = Scheduler(opts.status, processes=opts.jobs, memory=memory,
+                          memory_factor=opts.memory_factor)
+    failed = scheduler.run(jobs)
+    if failed:
+        logging.error('Failed: %s', ', '.join(sorted(failed)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent to analyse a random graph with the metric sets of the analysis,
+centrality and hist targets of the Makefile: loading the graph for every set
+(before) and with graph_analysis.batch() (after).
+
+Run it from the root of the repository:
+    python benchmarks/batch_analysis.py [-n NODES] [-m EDGES]
+"""
+
+import os
+import shutil
+import tempfile
+
+from common import timed, print_speedup, random_graph
+
+from graph_analysis import Analysis, analyse, batch, create_option_parser
+
+METRIC_SETS = ('--group -der --distance', '--group -c all', '-c all')
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=3000, help="Number of nodes (default: %default)")
+    p.add_option('-m', '--edges', action="store", dest="edges", type="int",
+                 default=15000, help="Number of edges (default: %default)")
+    opts, _ = p.parse_args()
+
+    d = tempfile.mkdtemp()
+    try:
+        fn = os.path.join(d, 'vecwiki-20100307-stub-meta-history.pickle')
+        random_graph(opts.nodes, opts.edges, roles=True,
+                     usernames=True).write_pickle(fn)
+        op = create_option_parser()
+        metric_sets = [op.parse_args(m.split())[0] for m in METRIC_SETS]
+
+        before_time, before = timed(
+            lambda: [list(analyse(Analysis(fn), options).lines())
+                     for options in metric_sets])
+        after_time, after = timed(
+            lambda: [list(results.lines())
+                     for _, _, results in batch([fn], metric_sets)])
+    finally:
+        shutil.rmtree(d)
+
+    assert before == after
+    print_speedup(before_time, after_time)
+
+
+if __name__ == "__main__":
+    main()
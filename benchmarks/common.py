@@ -0,0 +1,121 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Helpers of the benchmarks: timing, peak memory and synthetic graphs.
+
+The benchmarks are run from the root of the repository, e.g.
+    python benchmarks/timeline.py --help
+and import this module first: it makes the repository importable.
+"""
+
+import os
+import sys
+import random
+import resource
+from time import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+TEST_DUMP = os.path.join(ROOT, 'tests', 'utpedits2graph',
+                         'vecwiki-20100307-stub-meta-history-TEST.xml.bz2')
+
+## range of the times of the synthetic messages
+START = 1009843200  # 2002-01-01
+END = 1267401600  # 2010-03-01
+
+## boolean vertex attributes of the synthetic users, and their frequency
+ROLES = (('bot', .01), ('sysop', .01), ('bureaucrat', .002),
+         ('steward', .001), ('founder', .0001), ('blocked', .02),
+         ('anonymous', .3))
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process, in MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def timed(f, *args, **kwargs):
+    """
+    Returns the seconds spent by f(*args, **kwargs) and its result
+    """
+    start = time()
+    result = f(*args, **kwargs)
+    return time() - start, result
+
+
+def print_speedup(before, after, what=''):
+    """
+    Prints the seconds before and after and their ratio
+    """
+    if what:
+        what = ' (%s)' % (what, )
+    print 'before: %.2f s%s' % (before, what)
+    print 'after: %.2f s%s' % (after, what)
+    print 'Speedup: %.1fx' % (before / max(after, 1e-6), )
+
+
+def random_graph(nodes, edges, roles=False, usernames=False):
+    """
+    A directed Erdos-Renyi graph with random weights (1 to 20), the ROLES of
+    the vertices if roles and their usernames if usernames
+    """
+    import igraph as ig
+
+    random.seed(0)  # igraph uses the random module
+    g = ig.Graph.Erdos_Renyi(n=nodes, m=edges, directed=True)
+    if roles:
+        for attr, p in ROLES:
+            g.vs[attr] = [random.random() < p for _ in xrange(nodes)]
+    if usernames:
+        g.vs['username'] = ['User %d' % (i, ) for i in xrange(nodes)]
+    if edges:
+        g.es['weight'] = [random.randint(1, 20) for _ in xrange(edges)]
+    return g
+
+
+def temporal_graph(edges, nodes, messages=False):
+    """
+    A graph like the ones of utpedits2graph, with (about) edges edges among
+    nodes nodes, every one with 1 to 20 messages: the timestamp attribute is
+    a sonet.timeline.Timeline, or a list of mwlib.Message if messages (like
+    the graphs of older versions)
+    """
+    import igraph as ig
+
+    rnd = random.Random(0)
+    pairs = set((rnd.randrange(nodes), rnd.randrange(nodes))
+                for _ in xrange(edges))
+    g = ig.Graph(n=nodes, directed=True)
+    g.add_edges(list(pairs))
+    if messages:
+        from datetime import datetime
+        from sonet.mediawiki import Message
+
+        utc = datetime.utcfromtimestamp
+        g.es['timestamp'] = [
+            [Message(utc(rnd.randrange(START, END)), not rnd.randrange(50))
+             for _ in xrange(rnd.randint(1, 20))] for _ in pairs]
+    else:
+        from sonet.timeline import Timeline
+
+        g.es['timestamp'] = [
+            Timeline(sorted(rnd.randrange(START, END)
+                            for _ in xrange(rnd.randint(1, 20))))
+            for _ in pairs]
+    g.es['weight'] = [len(ts) for ts in g.es['timestamp']]
+    return g
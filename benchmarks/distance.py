@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent and peak memory used to compute the average distance of a
+random graph: with the dense blocks of 1000 sources of older versions of
+sonet.graph.Graph.averageDistance() (before), with sonet.distance (exact,
+after) and estimated from random sources with 1% accuracy. The peak memory
+can only grow: the exact value is computed first.
+
+Run it from the root of the repository:
+    python benchmarks/distance.py [-n NODES] [-m EDGES] [-j JOBS]
+"""
+
+import numpy
+
+from common import timed, peak_rss, random_graph
+
+from sonet import distance
+
+
+def dense_average_distance(g):
+    """
+    Graph.averageDistance() before sonet.distance
+    """
+    dSum = 0.
+    step = 1000
+    n = len(g.vs)
+    for i in range(0, n, step):
+        uplimit = min(n, i + step)
+        aDistances = numpy.array(g.shortest_paths(range(i, uplimit)))
+        dSum += 1. * aDistances.sum() / (n - 1) / (uplimit - i)
+    return 1. * dSum / len(range(0, n, step))
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=10000, help="Number of nodes (default: %default)")
+    p.add_option('-m', '--edges', action="store", dest="edges", type="int",
+                 default=50000, help="Number of edges (default: %default)")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+                 default=1, help="Number of processes (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = random_graph(opts.nodes, opts.edges).clusters().giant()
+
+    estimate_time, e = timed(distance.estimate, g, accuracy=.01,
+                             processes=opts.jobs, seed=0)
+    print 'estimate: %.2f s (%f, [%f, %f] from %d sources), peak %d MB' % (
+        estimate_time, e.value, e.low, e.high, e.samples, peak_rss())
+
+    after_time, after = timed(distance.average_distance, g,
+                              processes=opts.jobs)
+    print 'after: %.2f s (%f), peak %d MB' % (after_time, after, peak_rss())
+
+    before_time, before = timed(dense_average_distance, g)
+    print 'before: %.2f s (%f), peak %d MB' % (before_time, before,
+                                              peak_rss())
+
+    print 'Speedup: %.1fx exact, %.1fx estimated' % (
+        before_time / after_time, before_time / estimate_time)
+
+
+if __name__ == "__main__":
+    main()
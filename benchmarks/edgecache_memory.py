@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Peak memory of the edge caches used by utpedits2graph: a synthetic history
+of User Talk Page messages is added to EdgeCache (dict of dicts of lists of
+mwlib.Message, before) and to ArrayEdgeCache (typed arrays, after), then
+flushed. Every cache is measured in a process on its own.
+
+Run it from the root of the repository:
+    python benchmarks/edgecache_memory.py [-m MESSAGES] [-u USERS]
+"""
+
+import sys
+import random
+import subprocess
+from datetime import datetime
+from time import time
+
+from common import START, peak_rss
+
+from sonet.edgecache import EdgeCache, ArrayEdgeCache
+from sonet.mediawiki import Message
+
+
+def iter_messages(messages, users):
+    """
+    Yields (receiver, sender, epoch, welcome): a few users receive most of
+    the messages, like in a real wiki
+    """
+    rnd = random.Random(0)
+    names = [u'User %d' % (i, ) for i in xrange(users)]
+    for i in xrange(messages):
+        receiver = names[int(rnd.paretovariate(1.) - 1) % users]
+        sender = names[rnd.randrange(users)]
+        yield receiver, sender, START + i * 10, not rnd.randrange(50)
+
+
+def run(cache, messages, users):
+    before = peak_rss()
+    start = time()
+    if cache == 'dict':
+        ec = EdgeCache()
+        utc = datetime.utcfromtimestamp
+        for receiver, sender, epoch, welcome in iter_messages(messages,
+                                                               users):
+            ## see utpedits2graph.HistoryPageProcessor.process_revision()
+            ec.add(receiver, {sender: [Message(utc(epoch), welcome)]})
+    else:
+        ec = ArrayEdgeCache()
+        for receiver, sender, epoch, welcome in iter_messages(messages,
+                                                               users):
+            ec.add_message(receiver, sender, epoch, welcome)
+    ec.flush()
+    elapsed, peak = time() - start, peak_rss() - before
+    print '%s\t%d\t%.1f\t%.1f' % (cache, len(ec.edges), elapsed, peak)
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(
+        usage="usage: %prog [options]")
+    p.add_option('-m', '--messages', action="store", dest="messages",
+                 type="int", default=2000000,
+                 help="Number of messages (default: %default)")
+    p.add_option('-u', '--users', action="store", dest="users", type="int",
+                 default=100000, help="Number of users (default: %default)")
+    p.add_option('--cache', action="store", dest="cache", default=None,
+                 help=optparse.SUPPRESS_HELP)
+    opts, _ = p.parse_args()
+
+    if opts.cache:
+        run(opts.cache, opts.messages, opts.users)
+        return
+
+    print 'Messages: %d - Users: %d' % (opts.messages, opts.users)
+    print 'cache\tedges\tseconds\tpeak MB'
+    results = {}
+    for cache in ('dict', 'array'):
+        out = subprocess.check_output([sys.executable, __file__,
+                                       '--cache', cache,
+                                       '-m', str(opts.messages),
+                                       '-u', str(opts.users)])
+        line = out.strip().split('\n')[-1]
+        print line
+        results[cache] = float(line.split('\t')[-1])
+    print 'Peak memory: %.1fx lower' % (results['dict'] /
+                                        max(results['array'], 0.1), )
+
+
+if __name__ == "__main__":
+    main()
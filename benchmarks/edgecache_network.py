@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent by EdgeCache.get_network() (and by utpedits2graph.save_graph()
+setting the weights) to build the graph of a synthetic cache: one edge at a
+time with get_eid() (before) and with one assignment per attribute (after).
+
+Run it from the root of the repository:
+    python benchmarks/edgecache_network.py [-e EDGES] [-n NODES]
+"""
+
+import random
+from datetime import datetime
+from operator import itemgetter
+
+from common import timed, print_speedup
+
+import igraph as ig
+
+from sonet.edgecache import EdgeCache
+from sonet.mediawiki import Message
+
+
+def get_cache(edges, nodes):
+    """
+    A flushed EdgeCache with (about) edges edges among nodes nodes, every
+    one with 1 to 3 messages
+    """
+    rnd = random.Random(0)
+    msg = Message(datetime(2010, 1, 1), False)
+    ec = EdgeCache()
+    for _ in xrange(edges):
+        ec.add(u'User %d' % (rnd.randrange(nodes), ),
+               {u'User %d' % (rnd.randrange(nodes), ):
+                [msg] * rnd.randint(1, 3)})
+    ec.flush()
+    return ec
+
+
+def get_network_before(ec, vertex_label='username', edge_label='timestamp'):
+    g = ig.Graph(n=len(ec.nodes), directed=True)
+    g.es[edge_label] = []
+
+    g.vs[vertex_label] = [n.encode('utf-8') for n, _ in sorted(
+        ec.nodes.items(), key=itemgetter(1))]
+    ec.nodes = []
+
+    clean_edges = map(itemgetter(0, 1), ec.edges)
+    g.add_edges(clean_edges)
+    del clean_edges
+
+    for e_from, e_to, attr in ec.edges:
+        eid = g.get_eid(e_from, e_to, directed=True)
+        g.es[eid][edge_label] = attr
+    ec.edges = []
+
+    ## utpedits2graph.save_graph()
+    for e in g.es:
+        e['weight'] = len(e['timestamp'])
+    return g
+
+
+def get_network_after(ec):
+    return ec.get_network(edge_label='timestamp', weight_label='weight')
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=1000000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=100000, help="Number of nodes (default: %default)")
+    opts, _ = p.parse_args()
+
+    results = []
+    for get_network in (get_network_before, get_network_after):
+        ec = get_cache(opts.edges, opts.nodes)
+        elapsed, g = timed(get_network, ec)
+        results.append(elapsed)
+        edges = len(g.es)
+        del g, ec
+    print_speedup(results[0], results[1], '%d edges' % (edges, ))
+
+
+if __name__ == "__main__":
+    main()
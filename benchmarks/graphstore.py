@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent by sonet.graph.load() on a synthetic temporal graph (like the ones
+of utpedits2graph.py) saved as a pickle (before: with timelines made of
+lists of mwlib.Message, like older versions, and of sonet.timeline.Timeline)
+and in the binary format of sonet.graphstore (after), reading all the
+attributes or only some.
+
+Run it from the root of the repository:
+    python benchmarks/graphstore.py [-e EDGES] [-n NODES]
+"""
+
+import os
+import random
+import shutil
+import tempfile
+
+from common import timed, temporal_graph
+
+from sonet.graph import load
+from sonet.graphstore import write_graph
+
+
+def timeit(label, f, *args, **kwargs):
+    elapsed, result = timed(f, *args, **kwargs)
+    print '%s: %.2f s' % (label, elapsed)
+    return result, elapsed
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=500000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=100000, help="Number of nodes (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = temporal_graph(opts.edges, opts.nodes)
+    rnd = random.Random(0)
+    g.vs['username'] = ['User %d' % (i, ) for i in xrange(opts.nodes)]
+    g.vs['bot'] = [not rnd.randrange(100) for _ in xrange(opts.nodes)]
+    tmp = tempfile.mkdtemp()
+    try:
+        messages = os.path.join(tmp, 'messages.pickle')
+        pickled = os.path.join(tmp, 'graph.pickle')
+        binary = os.path.join(tmp, 'graph.graph')
+        timeit('write binary', write_graph, g, binary)
+        timeit('write pickle', g.write, pickled, format='pickle')
+        g.es['timestamp'] = [list(tl) for tl in g.es['timestamp']]
+        timeit('write pickle (Message)', g.write, messages, format='pickle')
+        del g
+
+        _, old = timeit('load pickle (Message)', load, messages)
+        _, before = timeit('load pickle', load, pickled)
+        _, after = timeit('load binary', load, binary)
+        _, weight = timeit('load binary (weight only)', load, binary,
+                           vertex_attributes=(), edge_attributes=('weight',))
+    finally:
+        shutil.rmtree(tmp)
+
+    print ('Load: %.1fx faster than pickle (Message), %.1fx than pickle, '
+           '%.1fx with the weights only' % (old / after, before / after,
+                                            before / weight))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent by graph_analysis.py --centrality degree on a random graph with
+the user groups: weighted degrees of every vertex and mean, standard
+deviation and top 5 of every group, with a loop over the vertices and a
+NumPy conversion per group (before) and with sonet.stats (after).
+
+Run it from the root of the repository:
+    python benchmarks/group_stats.py [-n NODES] [-m EDGES]
+"""
+
+import igraph as ig
+import numpy
+
+from common import timed, print_speedup, random_graph
+
+from sonet.graph import Graph
+
+from graph_analysis import groups
+
+
+def weighted_degree(g, type=ig.IN, remove_loops=True):
+    """
+    Graph.set_weighted_degree() before sonet.stats
+    """
+    stype = type == ig.IN and "in" or "out"
+    k = 'weighted_%sdegree' % stype
+
+    for node in g.vs:
+        if remove_loops:
+            edges = (e for e in g.adjacent(node.index, type=type)
+                     if not g.is_loop(e))
+        else:
+            edges = g.adjacent(node.index, type=type)
+
+        node[k] = sum(g.es[eid]['weight'] for eid in edges)
+
+
+def before(graph):
+    weighted_degree(graph.g, ig.IN)
+    weighted_degree(graph.g, ig.OUT)
+    result = {}
+    for cls, vs in graph.classes.iteritems():
+        for attr in ('weighted_indegree', 'weighted_outdegree'):
+            values = numpy.array(vs[attr])
+            result[cls, attr] = (
+                numpy.average(values), numpy.sqrt(numpy.var(values)),
+                sorted(values, reverse=True)[:5])
+    return result
+
+
+def after(graph):
+    graph.set_weighted_degree(ig.IN)
+    graph.set_weighted_degree(ig.OUT)
+    result = {}
+    for attr in ('weighted_indegree', 'weighted_outdegree'):
+        for cls, s in graph.group_stats(attr).iteritems():
+            result[cls, attr] = (s.mean, s.stddev, s.top.tolist())
+    return result
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=200000, help="Number of nodes (default: %default)")
+    p.add_option('-m', '--edges', action="store", dest="edges", type="int",
+                 default=1000000, help="Number of edges (default: %default)")
+    opts, _ = p.parse_args()
+
+    graph = Graph(random_graph(opts.nodes, opts.edges, roles=True))
+    for group_name, group_attr in groups.iteritems():
+        graph.defineClass(group_name, group_attr)
+
+    before_time, old = timed(before, graph)
+    after_time, new = timed(after, graph)
+
+    for key, (mean, stddev, top) in old.iteritems():
+        assert numpy.allclose((mean, stddev), new[key][:2]), key
+        assert top == new[key][2], key
+    print_speedup(before_time, after_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent by graph_analysis.py --adjacency on a random graph: adjacency
+and reciprocity matrices written as dense CSV from Graph.get_adjacency()
+with loops over the matrix (before) and from the edge list with
+sonet.matrix (after), plus the time of the sparse formats.
+
+Run it from the root of the repository:
+    python benchmarks/matrix.py [-n NODES] [-m EDGES]
+"""
+
+import os
+import shutil
+import tempfile
+from filecmp import cmp
+from time import time
+
+import igraph as ig
+
+from common import timed, print_speedup, random_graph
+
+from sonet.graph import Graph
+from sonet.matrix import FORMATS
+
+
+def write_rows(f, labels, matrix):
+    print >> f, ','.join(['', ] + labels + ['TOTAL', ])
+    for i, label in enumerate(labels):
+        msgs = matrix[i]
+        print >> f, ','.join([label, ] + [str(e) for e in msgs] +
+                             [str(sum(msgs)), ])
+    msgs = [sum([matrix[(j, i)] for j in range(len(labels))]) for i in
+            range(len(labels))]
+    print >> f, ','.join(['TOTAL', ] + [str(e) for e in msgs] +
+                         [str(sum(msgs)), ])
+
+
+def before(g, adj, rec):
+    """
+    Graph.writeAdjacencyMatrix() and Graph.writeReciprocityMatrix() before
+    sonet.matrix
+    """
+    labels = g.vs['username']
+    with open(adj, 'w') as f:
+        write_rows(f, labels, g.get_adjacency(ig.GET_ADJACENCY_BOTH,
+                                              'weight', 0))
+
+    matrix = g.get_adjacency(ig.GET_ADJACENCY_BOTH, default=0)
+    N = len(labels)
+    rmatrix_data = [N * [0] for i in xrange(N)]
+    for i in xrange(N):
+        for j in xrange(i + 1):
+            if matrix[(i, j)] and matrix[(j, i)]:
+                rmatrix_data[i][j] = rmatrix_data[j][i] = 1
+    with open(rec, 'w') as f:
+        write_rows(f, labels, ig.datatypes.Matrix(rmatrix_data))
+
+
+def after(g, adj, rec, fmt='csv'):
+    Graph(g).writeAdjacencyMatrix(adj, 'username', fmt=fmt)
+    Graph(g).writeReciprocityMatrix('username', rec, fmt=fmt)
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=2000, help="Number of nodes (default: %default)")
+    p.add_option('-m', '--edges', action="store", dest="edges", type="int",
+                 default=10000, help="Number of edges (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = random_graph(opts.nodes, opts.edges, usernames=True)
+    d = tempfile.mkdtemp()
+    try:
+        name = lambda s: os.path.join(d, s)
+
+        before_time, _ = timed(before, g, name('before-adj.csv'),
+                               name('before-rec.csv'))
+        after_time, _ = timed(after, g, name('after-adj.csv'),
+                              name('after-rec.csv'))
+
+        for m in ('adj', 'rec'):
+            assert cmp(name('before-%s.csv' % (m, )),
+                       name('after-%s.csv' % (m, )), False)
+        print_speedup(before_time, after_time)
+
+        for fmt in FORMATS[1:]:
+            start = time()
+            after(g, name('adj.' + fmt), name('rec.' + fmt), fmt)
+            print '%s: %.2f s (%d bytes)' % (
+                fmt, time() - start, os.path.getsize(name('adj.' + fmt)))
+    finally:
+        shutil.rmtree(d)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Micro-benchmark of PageProcessor.parse(): elements/second with the old
+introspection based dispatch (before) and with the precomputed dispatch
+table (after).
+
+Run it from the root of the repository:
+    python benchmarks/pageprocessor_dispatch.py [-r REPEAT]
+"""
+
+import bz2
+import inspect
+import xml.etree.cElementTree as cetree
+from cStringIO import StringIO
+
+from common import TEST_DUMP, timed, print_speedup
+
+import sonet.mediawiki as mwlib
+
+TAGS = 'page,title,revision,timestamp,contributor,username,ip,comment,id'
+
+
+class CountingPageProcessor(mwlib.PageProcessor):
+    """
+    Cheap handlers (like the ones of utpedits2graph.HistoryPageProcessor,
+    without the work) so that the dispatch overhead is what gets measured
+    """
+    _receiver = None
+    _sender = None
+    _time = None
+    _username = None
+    _ip = None
+    _id = None
+    revisions = 0
+
+    def process_title(self, elem):
+        self.delattr(("_skip", "_receiver", "_time", "_id", "_username",
+                      "_ip"))
+        a_title = elem.text.split(':')
+        if len(a_title) > 1 and a_title[0] in self.user_talk_names:
+            self._receiver = a_title[1]
+        else:
+            self._skip = True
+
+    def process_timestamp(self, elem):
+        self._time = elem.text
+        self.delattr(("_id", "_username", "_ip"))
+
+    def process_username(self, elem):
+        self._username = elem.text
+
+    def process_ip(self, elem):
+        self._ip = elem.text
+
+    def process_id(self, elem):
+        self._id = elem.text
+
+    def process_contributor(self, _):
+        self._sender = self._username or self._id or self._ip
+        self.delattr(("_id", "_username", "_ip"))
+
+    def process_revision(self, _):
+        self.revisions += 1
+        self.delattr(("_sender", "_time"))
+
+    def process_page(self, _):
+        self._skip = False
+        self.count += 1
+
+
+class LegacyPageProcessor(CountingPageProcessor):
+    """
+    CountingPageProcessor with the dispatch loop and the delattr() used
+    before the dispatch table was introduced
+    """
+    def delattr(self, attrs):
+        for attr in attrs:
+            try:
+                delattr(self, attr)
+            except AttributeError:
+                pass
+
+    def _create_gen(self, context, dfunc, tag_page):
+        for _, elem in context:
+            if elem.tag in dfunc and (elem.tag == tag_page or not self._skip):
+                yield elem
+            else:
+                elem.clear()
+
+    def parse(self, f):
+        dfunc = {}
+        tag = self.tag
+        for member_name, _ in inspect.getmembers(self):
+            if not member_name.startswith('process_'):
+                continue
+            member = self.__getattribute__(member_name)
+            if not inspect.ismethod(member):
+                continue
+            dfunc[tag[member_name[8:]]] = member
+
+        gen = self._create_gen(iter(cetree.iterparse(f)), dfunc, tag['page'])
+        for elem in gen:
+            dfunc[elem.tag](elem)
+            elem.clear()
+
+
+def load_dump(repeat):
+    """
+    Returns the test dump with its pages repeated repeat times
+    """
+    xml = bz2.BZ2File(TEST_DUMP).read()
+    start, end = xml.index('<page>'), xml.rindex('</mediawiki>')
+    return xml[:start] + xml[start:end] * repeat + xml[end:]
+
+
+def run(cls, xml, tag, names):
+    processor = cls(tag=tag, user_talk_names=names)
+    return timed(processor.parse, StringIO(xml))[0]
+
+
+def main():
+    from optparse import OptionParser
+
+    p = OptionParser(usage="usage: %prog [options]")
+    p.add_option('-r', '--repeat', action="store", dest="repeat", type="int",
+                 default=2000, help="Repeat the pages of the test dump "
+                                    "REPEAT times (default: %default)")
+    opts, _ = p.parse_args()
+
+    xml = load_dump(opts.repeat)
+    src = StringIO(xml)
+    tag = mwlib.get_tags(src, tags=TAGS)
+    translations = mwlib.get_translations(src)
+    names = (translations['User talk'], u'User talk')
+    elements = sum(1 for _ in cetree.iterparse(StringIO(xml)))
+
+    print 'Document: %d bytes, %d elements' % (len(xml), elements)
+    before = run(LegacyPageProcessor, xml, tag, names)
+    after = run(CountingPageProcessor, xml, tag, names)
+    print 'Elements/s: %.0f before, %.0f after' % (elements / before,
+                                                   elements / after)
+    print_speedup(before, after)
+
+
+if __name__ == "__main__":
+    main()
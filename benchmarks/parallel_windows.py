@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent to compute all the metrics of graph_longitudinal_analysis.py
+(degree, density, reciprocity, clusters and pagerank) of a synthetic
+temporal graph in a series of weekly windows: one window after the other
+(before) and with forked workers (after).
+
+Run it from the root of the repository:
+    python benchmarks/parallel_windows.py [-e EDGES] [-n NODES] [-w WINDOWS]
+        [-j JOBS]
+"""
+
+from datetime import datetime, timedelta
+
+from common import timed, print_speedup, temporal_graph
+
+from sonet.graph import Graph
+from sonet.sliding import iter_windows, ALL_METRICS
+
+
+def main():
+    import optparse
+    from multiprocessing import cpu_count
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=200000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=50000, help="Number of nodes (default: %default)")
+    p.add_option('-w', '--windows', action="store", dest="windows",
+                 type="int", default=100,
+                 help="Number of weekly windows (default: %default)")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+                 default=cpu_count(),
+                 help="Number of processes (default: %default)")
+    opts, _ = p.parse_args()
+
+    index = Graph(temporal_graph(opts.edges, opts.nodes)).time_index()
+    windows = [(datetime(2005, 1, 1) + timedelta(7 * i),
+                datetime(2005, 1, 1) + timedelta(7 * (i + 1)))
+               for i in xrange(opts.windows)]
+
+    before_time, before = timed(list, iter_windows(index, windows,
+                                                   ALL_METRICS))
+    after_time, after = timed(list, iter_windows(index, windows, ALL_METRICS,
+                                                 opts.jobs))
+    assert before == after
+    print_speedup(before_time, after_time)
+    print 'after: %d processes' % (opts.jobs, )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent by graph_analysis.py --group --users-role to classify the users
+of a graph with random roles: a VertexSeq.select() per group and a loop
+over the vertices for the roles (before) and with sonet.roles (after).
+
+Run it from the root of the repository:
+    python benchmarks/roles.py [-n NODES]
+"""
+
+from common import timed, print_speedup, random_graph
+
+from sonet.graph import Graph
+
+from graph_analysis import groups
+
+CLASSES = ('anonymous', 'bot', 'bureaucrat', 'sysop')
+
+
+def get_user_class(g, label, classes):
+    """
+    Graph.get_user_class() before sonet.roles
+    """
+    for n in g.vs:
+        found = False
+        attrs = n.attributes()
+        for cls in classes:
+            if attrs[cls]:
+                found = True
+                yield (n[label], cls)
+                break
+        if not found:
+            yield (n[label], 'normal user')
+
+
+def before(g):
+    classes = dict((name, g.vs.select(**attr).indices)
+                   for name, attr in groups.iteritems())
+    return classes, sorted(get_user_class(g, 'username', CLASSES))
+
+
+def after(g):
+    graph = Graph(g)
+    for name, attr in groups.iteritems():
+        graph.defineClass(name, attr)
+    classes = dict((name, vs.indices)
+                   for name, vs in graph.classes.iteritems())
+    return classes, sorted(graph.get_user_class('username', CLASSES))
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=500000, help="Number of nodes (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = random_graph(opts.nodes, 0, roles=True, usernames=True)
+
+    before_time, expected = timed(before, g)
+    after_time, result = timed(after, g)
+
+    assert result == expected
+    print_speedup(before_time, after_time)
+
+
+if __name__ == "__main__":
+    main()
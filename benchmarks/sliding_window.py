@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent to compute the statistics (nodes, edges, density, reciprocity
+and degrees) of a synthetic temporal graph in a series of weekly windows:
+with the subgraph of the view of Graph.time_slice() for every window
+(before) and with sonet.sliding.SlidingWindow (after).
+
+Run it from the root of the repository:
+    python benchmarks/sliding_window.py [-e EDGES] [-n NODES] [-w WINDOWS]
+"""
+
+from datetime import datetime, timedelta
+
+from common import timed, print_speedup, temporal_graph
+
+from sonet.graph import Graph
+from sonet.sliding import SlidingWindow
+
+
+def subgraph_stats(graph, start, end):
+    g = graph.time_slice(start, end).subgraph(graph.g)
+    return (len(g.vs), len(g.es), round(g.density(), 9),
+            round(g.reciprocity(), 9), g.maxdegree(mode='in'),
+            g.maxdegree(mode='out'))
+
+
+def sliding_stats(stats):
+    return (stats['nodes'], stats['edges'], round(stats['density'], 9),
+            round(stats['reciprocity'], 9), stats['max_indegree'],
+            stats['max_outdegree'])
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=200000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=50000, help="Number of nodes (default: %default)")
+    p.add_option('-w', '--windows', action="store", dest="windows",
+                 type="int", default=200,
+                 help="Number of weekly windows (default: %default)")
+    opts, _ = p.parse_args()
+
+    graph = Graph(temporal_graph(opts.edges, opts.nodes))
+    index = graph.time_index()
+    windows = [(datetime(2005, 1, 1) + timedelta(7 * i),
+                datetime(2005, 1, 1) + timedelta(7 * (i + 1)))
+               for i in xrange(opts.windows)]
+
+    before_time, before = timed(lambda: [subgraph_stats(graph, s, e)
+                                         for s, e in windows])
+    after_time, after = timed(lambda: [
+        sliding_stats(stats)
+        for _, _, stats in SlidingWindow(index).windows(windows)])
+    assert before == after
+    print_speedup(before_time, after_time)
+
+
+if __name__ == "__main__":
+    main()
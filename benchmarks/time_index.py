@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Time spent to compute the weights of the edges of a synthetic temporal
+graph in a series of time windows: with Graph.time_slice_subgraph() on a
+copy of the graph for every window (before) and with the views of
+Graph.time_slice() (after).
+
+Run it from the root of the repository:
+    python benchmarks/time_index.py [-e EDGES] [-n NODES] [-w WINDOWS]
+"""
+
+from datetime import datetime, timedelta
+
+from common import timed, print_speedup, temporal_graph
+
+from sonet.graph import Graph
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=200000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=50000, help="Number of nodes (default: %default)")
+    p.add_option('-w', '--windows', action="store", dest="windows",
+                 type="int", default=20,
+                 help="Number of windows (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = temporal_graph(opts.edges, opts.nodes)
+    windows = [(datetime(2005, 1, 1) + timedelta(30 * i),
+                datetime(2005, 1, 1) + timedelta(30 * (i + 1)))
+               for i in xrange(opts.windows)]
+
+    def before():
+        weights = []
+        for s, e in windows:
+            graph = Graph(g.copy())
+            graph.time_slice_subgraph(start=s, end=e)
+            weights.append(sum(graph.g.es['weight']))
+        return weights
+
+    def after():
+        graph = Graph(g)
+        index_time, _ = timed(graph.time_index)
+        return index_time, [int(graph.time_slice(s, e).weights.sum())
+                            for s, e in windows]
+
+    before_time, before_weights = timed(before)
+    after_time, (index_time, after_weights) = timed(after)
+    assert before_weights == after_weights
+    print_speedup(before_time, after_time)
+    print 'index: %.2f s' % (index_time, )
+
+
+if __name__ == "__main__":
+    main()
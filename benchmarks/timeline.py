@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Size of the pickled graph and time spent by Graph.time_slice_subgraph() on
+a synthetic temporal graph, with the timestamp attribute of the edges made
+of lists of mwlib.Message (before) and of sonet.timeline.Timeline (after).
+
+Run it from the root of the repository:
+    python benchmarks/timeline.py [-e EDGES] [-n NODES]
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+from common import timed, temporal_graph
+
+import igraph as ig
+
+from sonet.graph import Graph
+from sonet.timeline import Timeline
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options]")
+    p.add_option('-e', '--edges', action="store", dest="edges", type="int",
+                 default=200000, help="Number of edges (default: %default)")
+    p.add_option('-n', '--nodes', action="store", dest="nodes", type="int",
+                 default=50000, help="Number of nodes (default: %default)")
+    opts, _ = p.parse_args()
+
+    g = temporal_graph(opts.edges, opts.nodes, messages=True)
+    start, end = datetime(2006, 1, 1), datetime(2007, 1, 1)
+    fn = tempfile.mktemp(suffix='.pickle')
+    results = {}
+    try:
+        for name in ('before', 'after'):
+            if name == 'after':
+                g.es['timestamp'] = [Timeline.from_messages(msgs)
+                                     for msgs in g.es['timestamp']]
+            write, _ = timed(g.write, fn, format='pickle')
+            size = os.path.getsize(fn) / 1024. / 1024.
+            load, graph = timed(lambda: Graph(ig.load(fn)))
+            time_slice, _ = timed(graph.time_slice_subgraph, start=start,
+                                  end=end)
+            results[name] = (size, time_slice)
+            print ('%s: %.1f MB - write %.1f s - load %.1f s - '
+                   'time_slice_subgraph %.1f s (%d edges left)' % (
+                       name, size, write, load, time_slice,
+                       len(graph.g.es)))
+            del graph
+    finally:
+        if os.path.exists(fn):
+            os.remove(fn)
+
+    print 'Pickle: %.1fx smaller - time_slice_subgraph: %.1fx faster' % (
+        results['before'][0] / results['after'][0],
+        results['before'][1] / results['after'][1])
+
+
+if __name__ == "__main__":
+    main()
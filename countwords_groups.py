@@ -180,11 +180,10 @@ def get_class(g, cls):
     if cls == 'all':
         users = g.g.vs
     elif cls == 'normal user':
-        users = g.g.vs.select(**{'bot_ne': True, 'anonymous_ne': True,
-                                 'sysop_ne': True,
-                                 'bureaucrat_ne': True})
+        users = g.select({'bot_ne': True, 'anonymous_ne': True,
+                          'sysop_ne': True, 'bureaucrat_ne': True})
     else:
-        users = g.g.vs.select(**{cls: True})
+        users = g.select({cls: True})
     return users
 
 
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+import os
+import sys
+import logging
+
+## PROJECT LIBS
+from sonet.lib import find_open_for_this_file
+from sonet.mediawiki.pageindex import iter_index, write_index, \
+     index_filename
+from sonet.bz2blocks import build_block_table, write_block_table, \
+     block_table_filename
+from sonet.timr import Timr
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options] dumpfile",
+                              description='Index the pages of a dump (title, '
+                              'namespace, offset, length and number of '
+                              'revisions) in a sidecar file next to the dump.')
+    p.add_option('-v', action="store_true", dest="verbose", default=False,
+                 help="Verbose output (like timings)")
+    p.add_option('-o', '--output', action="store", dest="output",
+                 default=None, help="Index file (default: DUMPFILE.idx.gz)")
+    p.add_option('-b', '--blocks', action="store_true", dest="blocks",
+                 default=False, help="Write the block table of a bzip2 dump "
+                 "too (DUMPFILE.blocks.gz), making it seekable")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+                 default=1, help="Processes decompressing bzip2 blocks "
+                 "(default: %default)")
+    opts, files = p.parse_args()
+
+    if len(files) != 1:
+        p.error("Wrong number of arguments")
+    if not os.path.exists(files[0]):
+        p.error("Dump file does not exist (%s)" % (files[0],))
+    if opts.verbose:
+        logging.basicConfig(stream=sys.stderr,
+                            level=logging.DEBUG,
+                            format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%Y-%m-%d %H:%M:%S')
+
+    xml = files[0]
+    output = opts.output or index_filename(xml)
+
+    if opts.blocks:
+        if not xml.endswith('.bz2'):
+            p.error("Block tables are supported for bzip2 dumps only")
+        with Timr('Building block table'):
+            blocks = build_block_table(xml, processes=opts.jobs)
+        write_block_table(block_table_filename(xml), blocks)
+        logging.info('%d bzip2 blocks', len(blocks))
+
+    deflate, _ = find_open_for_this_file(xml)
+    src = deflate(xml)
+
+    with Timr('Indexing'):
+        counter = write_index(output, iter_index(src))
+    src.close()
+
+    logging.info('%d pages indexed in %s', counter, output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+import os
+import sys
+import logging
+
+## PROJECT LIBS
+from sonet.lib import find_open_for_this_file
+from sonet.chunked import convert, zstandard, CHUNK_PAGES
+from sonet.timr import Timr
+
+
+def get_output(fn, codec):
+    """
+    >>> get_output('/tmp/itwiki-20100218-pages-meta-history.xml.bz2', 'zst')
+    '/tmp/itwiki-20100218-pages-meta-history.xml.zst'
+    """
+    return fn[:fn.rindex('.')] + '.' + codec
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options] dumpfile",
+                              description='Recompress a dump in chunks of '
+                              'pages compressed independently (and write its '
+                              'page index), to read it faster and in '
+                              'parallel. The chunked dump is still a valid '
+                              'gzip (zstd) file.')
+    p.add_option('-v', action="store_true", dest="verbose", default=False,
+                 help="Verbose output (like timings)")
+    p.add_option('-c', '--codec', action="store", dest="codec",
+                 default='zst' if zstandard else 'gz',
+                 help="Compression: gz or zst (default: %default)")
+    p.add_option('-p', '--pages', action="store", dest="pages", type="int",
+                 default=CHUNK_PAGES,
+                 help="Pages in every chunk (default: %default)")
+    p.add_option('-o', '--output', action="store", dest="output",
+                 default=None, help="Chunked dump (default: DUMPFILE with "
+                 "the extension of the codec)")
+    opts, files = p.parse_args()
+
+    if len(files) != 1:
+        p.error("Wrong number of arguments")
+    if not os.path.exists(files[0]):
+        p.error("Dump file does not exist (%s)" % (files[0],))
+    if opts.codec not in ('gz', 'zst'):
+        p.error("Unknown codec: %s" % (opts.codec,))
+    if opts.codec == 'zst' and not zstandard:
+        p.error("zstd requires zstandard")
+    if opts.verbose:
+        logging.basicConfig(stream=sys.stderr,
+                            level=logging.DEBUG,
+                            format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%Y-%m-%d %H:%M:%S')
+
+    xml = files[0]
+    output = opts.output or get_output(xml, opts.codec)
+    if not output.endswith('.' + opts.codec):
+        p.error("The output file must end with .%s" % (opts.codec,))
+    if os.path.abspath(output) == os.path.abspath(xml):
+        p.error("The output file can't be the dump file")
+
+    deflate, _ = find_open_for_this_file(xml)
+    src = deflate(xml)
+
+    with Timr('Recompressing'):
+        convert(src, output, opts.pages)
+    src.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+import os
+import sys
+import logging
+
+## PROJECT LIBS
+import sonet.mediawiki as mwlib
+from sonet.lib import open_dump
+from sonet.revisiontable import RevisionExtractorPageProcessor, \
+     write_revision_table, revision_table_dirname, TAGS
+from sonet.timr import Timr
+
+
+def main():
+    import optparse
+
+    p = optparse.OptionParser(usage="usage: %prog [options] dumpfile",
+                              description='Extract the metadata of the '
+                              'revisions of a (stub) dump in a columnar, '
+                              'memory-mappable table (see '
+                              'sonet.revisiontable.RevisionTable).')
+    p.add_option('-v', action="store_true", dest="verbose", default=False,
+                 help="Verbose output (like timings)")
+    p.add_option('-o', '--output', action="store", dest="output",
+                 default=None, help="Output directory (default: "
+                 "DUMPFILE.revisions)")
+    opts, files = p.parse_args()
+
+    if len(files) != 1:
+        p.error("Wrong number of arguments")
+    if not os.path.exists(files[0]):
+        p.error("Dump file does not exist (%s)" % (files[0],))
+    if opts.verbose:
+        logging.basicConfig(stream=sys.stderr,
+                            level=logging.DEBUG,
+                            format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%Y-%m-%d %H:%M:%S')
+
+    xml = files[0]
+    output = opts.output or revision_table_dirname(xml)
+
+    src = open_dump(xml)
+    tag = mwlib.get_tags(src, tags=TAGS)
+    namespaces = dict((name.decode('utf-8'), int(key))
+                      for key, name in mwlib.get_namespaces(src))
+
+    processor = RevisionExtractorPageProcessor(tag=tag, namespaces=namespaces)
+    with Timr('Extracting'):
+        processor.start(src)
+    src.close()
+
+    with Timr('Saving'):
+        write_revision_table(output, processor)
+
+
+if __name__ == "__main__":
+    main()
@@ -189,20 +189,13 @@ def main():
     threshold = float(files[2])
 
     lang, _, _ = explode_dump_filename(xml)
-    deflate, _lineno = lib.find_open_for_this_file(xml)
 
-    if _lineno:
-        src = deflate(xml, 51)  # Read first 51 lines to extract namespaces
-    else:
-        src = deflate(xml)
+    src = lib.open_dump(xml)
 
     translation = get_translations(src)
     tag = get_tags(src, tags='page,title,revision,' + \
                    'minor,timestamp,redirect,ip,username')
 
-    src.close()
-    src = deflate(xml)
-
     processor = HistoryEventsPageProcessor(tag=tag, lang=lang)
     processor.talkns = translation['Talk']
     processor.threshold = threshold
@@ -222,19 +222,13 @@ def main():
     dumps_checker(xml)
 
     lang, _, _ = explode_dump_filename(xml)
-    deflate, _lineno = lib.find_open_for_this_file(xml)
 
-    if _lineno:
-        src = deflate(xml, 51)
-    else:
-        src = deflate(xml)
+    src = lib.open_dump(xml)
 
     translation = get_translations(src)
     tag = get_tags(src,
                    tags="page,redirect,timestamp,ip,"
                         "contributor,title,username")
-    src.close()
-    src = deflate(xml)
 
     out = open(output, "w")
     processor = GenderPageProcessor(tag=tag, lang=lang,
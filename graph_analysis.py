@@ -23,12 +23,16 @@ import logging
 ## PROJECT
 from sonet.tablr import Tablr
 from sonet.timr import Timr
-from sonet import mediawiki as mwlib, graph as sg
+from sonet import mediawiki as mwlib, graph as sg, distance
 
 logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 
 ## GLOBAL VARIABLES
 
+## file extensions of the --matrix-format formats
+MATRIX_EXTENSIONS = {'csv': 'csv', 'coo': 'coo.csv', 'mtx': 'mtx',
+                     'npz': 'npz'}
+
 groups = {
     'all': {},
     'bot': {'bot': True},
@@ -68,7 +72,8 @@ def create_option_parser():
     from optparse import OptionParser, OptionGroup
     from sonet.lib import SonetOption
 
-    op = OptionParser('%prog [options] graph', option_class=SonetOption)
+    op = OptionParser('%prog [options] graph [graph ...]',
+                      option_class=SonetOption)
 
     time_group = OptionGroup(op, 'Time related options')
     time_group.add_option('-S', '--start', action="store", dest='start',
@@ -80,6 +85,30 @@ def create_option_parser():
                           )
     op.add_option_group(time_group)
 
+    distance_group = OptionGroup(op, 'Distance and efficiency options',
+        'With any of --samples, --accuracy and --time-budget, they are '
+        'estimated from the shortest paths of random sources')
+    distance_group.add_option('-j', '--jobs', action="store", dest="jobs",
+                              type="int", default=1, metavar="N",
+                              help="Number of processes computing the "
+                              "shortest paths (default: %default)")
+    distance_group.add_option('--samples', action="store", dest="samples",
+                              type="int", default=None, metavar="N",
+                              help="Use at most N sources")
+    distance_group.add_option('--accuracy', action="store", dest="accuracy",
+                              type="float", default=None, metavar="ACC",
+                              help="Stop when the confidence interval is "
+                              "within ACC times the estimate (e.g. 0.01)")
+    distance_group.add_option('--time-budget', action="store",
+                              dest="time_budget", type="float", default=None,
+                              metavar="SECONDS",
+                              help="Stop after SECONDS seconds")
+    distance_group.add_option('--confidence', action="store",
+                              dest="confidence", type="float", default=.95,
+                              help="Level of the confidence interval "
+                              "(default: %default)")
+    op.add_option_group(distance_group)
+
     op.add_option('--save-db', action="store_true", dest="as_table",
         help="Save output on a DB")
     op.add_option('--group', action="store_true", dest="group",
@@ -107,107 +136,246 @@ def create_option_parser():
     op.add_option('-w', '--power-law', action="store_true", dest="power_law")
     op.add_option('-a', '--adjacency', action="store_true", dest="adjacency",
         help="Write the adjacency matrix of the giant component to a file")
+    op.add_option('--matrix-format', action="store", dest="matrix_format",
+        type="choice", choices=MATRIX_EXTENSIONS.keys(), default='csv',
+        help="Format of the matrices written by --adjacency: csv (dense, "
+             "with totals), coo (coordinate list), mtx (Matrix Market) or "
+             "npz (CSR, readable with scipy.sparse.load_npz) [default: "
+             "%default]")
     op.add_option('--users-role', action="store_true", dest="users_role",
         help="Write a list users-role to a file")
+    op.add_option('-m', '--metrics', action="append", dest="metric_sets",
+        metavar="OPTIONS",
+        help="Analyse the graphs with these options (e.g. \"--group -der "
+             "--distance\") on top of the other ones: repeat it to analyse "
+             "every graph, loaded once, with more sets of options")
 
     return op
 
 
-def main():
-    op = create_option_parser()
-
-    (options, args) = op.parse_args()
-
-    if len(args) != 1:
-        print "Insert one (and only one) file to process\n"
-        op.print_help()
-        sys.exit(2)
-
-    fn = args[0]
-    lang, date, type_ = mwlib.explode_dump_filename(fn)
-
-    g = sg.load(fn)
-    g.time_slice_subgraph(start=options.start, end=options.end)
-    g.invert_edge_attr('weight', 'length')
+class Results(object):
+    """
+    Output of the analysis of a graph: values of the graph (group is None)
+    and of the groups of users, in the order they're computed, and names of
+    the files written
+
+    >>> r = Results()
+    >>> r.add('nodes number', 3, '%d')
+    >>> r.add('density', .5, '%.2f', group='bot')
+    >>> r.add('density interval', '[0.40, 0.60]', table=False)
+    >>> r.get('density', 'bot')
+    0.5
+    >>> for line in r.lines():
+    ...     print line
+     * nodes number: 3
+     * bot : density : 0.50
+     * density interval: [0.40, 0.60]
+    >>> list(r.lines(table=False))
+    [' * density interval: [0.40, 0.60]']
+    """
+
+    def __init__(self):
+        self.items = []
+        self.files = []
+
+    def add(self, name, value, fmt='%s', group=None, table=True):
+        """
+        Adds the value called name: fmt is a format string or a function
+        returning value as a string. table is False if the value has no
+        column in the tables saved by sonet.tablr.Tablr (--save-db).
+        """
+        text = fmt(value) if callable(fmt) else fmt % (value, )
+        self.items.append((group, name, value, text, table))
+
+    def get(self, name, group=None):
+        for item in self.items:
+            if item[:2] == (group, name):
+                return item[2]
+        raise KeyError(name if group is None else (group, name))
+
+    def lines(self, table=None):
+        """
+        Yields the lines printed by graph_analysis (and read by
+        sonet.tablr.Tablr): only the ones of the values with (table=True)
+        or without (table=False) a column in the tables if table isn't None
+        """
+        for group, name, _, text, in_table in self.items:
+            if table is not None and in_table != table:
+                continue
+            if group is None:
+                yield " * %s: %s" % (name, text)
+            else:
+                yield " * %s : %s : %s" % (group, name, text)
+
+
+class Analysis(object):
+    """
+    A graph loaded (and sliced in time) once, to be analysed with one or more
+    sets of options (see analyse()): the intermediates shared by the metrics
+    (giant component, degrees, centralities) are computed the first time
+    they're needed
+    """
+
+    def __init__(self, fn, start=None, end=None):
+        self.fn = fn
+        self.lang, self.date, _ = mwlib.explode_dump_filename(fn)
+        self.g = sg.load(fn)
+        self.g.time_slice_subgraph(start=start, end=end)
+        self.g.invert_edge_attr('weight', 'length')
+        self._cache = {}
+
+    def once(self, key, compute):
+        """
+        Returns compute(), called only the first time key is asked for
+        """
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = compute()
+            return value
+
+    def define_groups(self, all_groups=True):
+        """
+        Defines the classes of the users: every group in groups or 'all' only
+        """
+        if all_groups:
+            for group_name, group_attr in groups.iteritems():
+                if group_name not in self.g.classes:
+                    self.g.defineClass(group_name, group_attr)
+        elif 'all' not in self.g.classes:
+            self.g.defineClass('all', {})
+
+    def clusters(self):
+        return self.once('clusters', self.g.g.clusters)
+
+    def giant(self):
+        return self.once('giant', lambda: self.clusters().giant())
+
+    def degrees(self):
+        """
+        Sets the (not weighted) indegree and outdegree of the vertices
+        """
+        def compute():
+            self.g.g.vs['indegree'] = self.g.g.degree(type=ig.IN)
+            self.g.g.vs['outdegree'] = self.g.g.degree(type=ig.OUT)
+        self.once('degrees', compute)
+
+    def weighted_degree(self, type=ig.IN):
+        self.once(('weighted_degree', type),
+                  lambda: self.g.set_weighted_degree(type=type))
+
+
+def needs_groups(options):
+    return options.group or options.users_role or options.histogram
+
+
+def get_centralities(centrality):
+    """
+    Returns the list of centralities in the value of --centrality. Raises
+    ValueError if one is unknown.
+
+    >>> get_centralities('pagerank,degree')
+    ['pagerank', 'degree']
+    """
+    if not centrality:
+        return []
+    centralities = centrality.split(',')
+    if 'all' in centralities:
+        centralities = 'betweenness,pagerank,degree'.split(',')
+
+    if set(centralities).difference(
+        'betweenness,pagerank,degree'.split(',')):
+        raise ValueError('Unknown centrality: %s' % (centrality, ))
+    return centralities
+
+
+def analyse(a, options):
+    """
+    Computes the metrics asked for in options (see create_option_parser())
+    on the Analysis a: returns their Results
+    """
+    g = a.g
+    lang, date = a.lang, a.date
+    results = Results()
 
     vn = len(g.g.vs)  # number of vertexes
     en = len(g.g.es)  # number of edges
 
     timr = Timr()
 
-    if options.as_table:
-        tablr = Tablr()
-        tablr.start(1024 * 32, lang)
-
-    if options.group or options.users_role or options.histogram:
-        for group_name, group_attr in groups.iteritems():
-            g.defineClass(group_name, group_attr)
-            print ' * %s : nodes number : %d' % (group_name,
-                                                 len(g.classes[group_name]))
-    else:
-        g.defineClass('all', {})
+    group = needs_groups(options)
+    a.define_groups(group)
+    if group:
+        for group_name in groups:
+            results.add('nodes number', len(g.classes[group_name]), '%d',
+                        group=group_name)
+    classes = [cls for cls in g.classes if group or cls == 'all']
 
-    print " * filename: %s" % (fn,)
-    print " * lang: %s" % (lang,)
-    print " * date: %s" % (date,)
+    results.add('filename', a.fn)
+    results.add('lang', lang)
+    results.add('date', date)
 
     if options.details:
         with Timr("details"):
-            print " * nodes number: %d" % (vn,)
-            print " * edges number: %d" % (en,)
+            results.add('nodes number', vn, '%d')
+            results.add('edges number', en, '%d')
 
             nodes_with_outdegree = len(g.g.vs.select(_outdegree_ge=1))
             nodes_with_indegree = len(g.g.vs.select(_indegree_ge=1))
             self_loop_edges = len([edge for edge in g.g.es \
                                    if edge.target == edge.source])
 
-            print " * nodes with out edges number: %d (%6f%%)" % (
-                nodes_with_outdegree, 100. * nodes_with_outdegree / vn)
-            print " * nodes with in edges number: %d (%6f%%)" % (
-                nodes_with_indegree, 100. * nodes_with_indegree / vn)
-            print " * max weights on edges : %s" % top(g.g.es['weight'])
+            percentage = lambda n: '%d (%6f%%)' % (n, 100. * n / vn)
+            results.add('nodes with out edges number', nodes_with_outdegree,
+                        percentage)
+            results.add('nodes with in edges number', nodes_with_indegree,
+                        percentage)
+            results.add('max weights on edges',
+                        sorted(g.g.es['weight'], reverse=True)[:5], top)
 
-            print " * self-loop edges: %d" % self_loop_edges
+            results.add('self-loop edges', self_loop_edges, '%d')
             #print " * diameter : %6f" % g.g.diameter(weights='length')
             #print " * average weight : %6f" % numpy.average(g.g.es['weight'])
 
     if options.density or options.reciprocity:
         with Timr('density&reciprocity'):
-            for cls, vs in g.classes.iteritems():
+            for cls in classes:
+                vs = g.classes[cls]
                 if not len(vs) > 1:
                     continue
 
                 subgraph = vs.subgraph()
 
-                print " * %s : density : %.10f" % (cls, subgraph.density())
-                print " * %s : reciprocity : %.10f" % (cls,
-                                                       subgraph.reciprocity())
+                results.add('density', subgraph.density(), '%.10f',
+                            group=cls)
+                results.add('reciprocity', subgraph.reciprocity(), '%.10f',
+                            group=cls)
 
     if options.degree:
         with Timr('degree'):
-            g.g.vs['indegree'] = g.g.degree(type=ig.IN)
-            g.g.vs['outdegree'] = g.g.degree(type=ig.OUT)
+            a.degrees()
+            in_stats = g.group_stats('indegree')
+            out_stats = g.group_stats('outdegree')
 
-            for cls, vs in g.classes.iteritems():
-                if not vs:
+            for cls in classes:
+                if not g.classes[cls]:
                     continue
 
-                ind = numpy.array(vs['indegree'])
-                outd = numpy.array(vs['outdegree'])
+                ind, outd = in_stats[cls], out_stats[cls]
 
-                print " * %s : mean IN degree (no weights): %f" % (
-                    cls, numpy.average(ind))
-                print " * %s : mean OUT degree (no weights): %f" % (
-                    cls, numpy.average(outd))
-                print " * %s : max IN degrees (no weights): %s" % (cls,
-                                                                   top(ind))
-                print " * %s : max OUT degrees (no weights): %s" % (cls,
-                                                                    top(outd))
+                results.add('mean IN degree (no weights)', ind.mean, '%f',
+                            group=cls)
+                results.add('mean OUT degree (no weights)', outd.mean, '%f',
+                            group=cls)
+                results.add('max IN degrees (no weights)', ind.top, top,
+                            group=cls)
+                results.add('max OUT degrees (no weights)', outd.top, top,
+                            group=cls)
 
-                print " * %s : stddev IN degree (no weights): %f" % (
-                    cls, numpy.sqrt(numpy.var(ind)))
-                print " * %s : stddev OUT degree (no weights): %f" % (
-                    cls, numpy.sqrt(numpy.var(outd)))
+                results.add('stddev IN degree (no weights)', ind.stddev,
+                            '%f', group=cls)
+                results.add('stddev OUT degree (no weights)', outd.stddev,
+                            '%f', group=cls)
 
     if options.transitivity:
         ##print " * transitivity: %f" % (nx.transitivity(g), )
@@ -215,114 +383,142 @@ def main():
 
     if options.summary:
         # don't use with --as-table
-        print " * summary: %s" % (g.g.summary(), )
+        results.add('summary', g.g.summary())
 
     if options.distance:
         with Timr('split clusters'):
-            vc = g.g.clusters()
-            size_clusters = vc.sizes()
-            giant = vc.giant()
+            size_clusters = a.clusters().sizes()
+            giant = a.giant()
 
-            print " * length of 5 max clusters: %s" % top(size_clusters)
+            results.add('length of 5 max clusters',
+                        sorted(size_clusters, reverse=True)[:5], top)
             #print " * #node in 5 max clusters/#all nodes: %s" % top(
             #    [1.*cluster_len/vn for cluster_len in size_clusters])
 
+    sampled = any(v is not None for v in (options.samples, options.accuracy,
+                                          options.time_budget))
+    estimate = lambda graph, statistic, weight: distance.estimate(
+        graph, statistic, weight, samples=options.samples,
+        accuracy=options.accuracy, time_budget=options.time_budget,
+        confidence=options.confidence, processes=options.jobs)
+
+    def add_estimate(label, e):
+        results.add(label, e.value, '%f')
+        results.add("%s (%g%% confidence interval)" % (
+            label, options.confidence * 100), (e.low, e.high, e.samples),
+            lambda v: "[%f, %f] from %d sources" % v, table=False)
+
     if options.distance:
         with Timr('distance'):
-            gg = sg.Graph(giant)
-            print " * average distance in the giant component: %f" % \
-                  gg.averageDistance(weight='length')
-            print " * average hops in the giant component: %f" % \
-                  gg.averageDistance()
+            if sampled:
+                add_estimate("average distance in the giant component",
+                             estimate(giant, 'distance', 'length'))
+                add_estimate("average hops in the giant component",
+                             estimate(giant, 'distance', None))
+            else:
+                gg = sg.Graph(giant)
+                results.add("average distance in the giant component",
+                            gg.averageDistance(weight='length',
+                                               processes=options.jobs),
+                            '%f')
+                results.add("average hops in the giant component",
+                            gg.averageDistance(processes=options.jobs),
+                            '%f')
 
             #print "Average distance 2: %f" % giant.average_path_length(True,
             #                                                           False)
 
     if options.efficiency:
         with Timr('efficiency'):
-            print " * efficiency: %f" % g.efficiency(weight='length')
+            if sampled:
+                add_estimate("efficiency",
+                             estimate(g.g, 'efficiency', 'length'))
+            else:
+                results.add("efficiency", g.efficiency(
+                    weight='length', processes=options.jobs), '%f')
 
     ##TODO: compute for centrality only if "all" or "degree"
     if (options.plot or options.histogram or options.power_law or
         options.centrality):
         with Timr('set weighted indegree'):
-            g.set_weighted_degree()
+            a.weighted_degree()
 
     if options.centrality:
         timr.start('centrality')
-        centralities = options.centrality.split(',')
-        if 'all' in centralities:
-            centralities = 'betweenness,pagerank,degree'.split(',')
-
-        if set(centralities).difference(
-            'betweenness,pagerank,degree'.split(',')):
-            logging.error('Unknown centrality')
-            sys.exit(0)
+        centralities = get_centralities(options.centrality)
 
         if "betweenness" in centralities:
-            print >> sys.stderr, "betweenness"
-            g.g.vs['bw'] = g.g.betweenness(weights='length', directed=True)
+            def betweenness():
+                print >> sys.stderr, "betweenness"
+                g.g.vs['bw'] = g.g.betweenness(weights='length',
+                                               directed=True)
+            a.once('bw', betweenness)
 
         #g.g.vs['ev'] = g.g.evcent(weights='weight') # eigenvector centrality
 
         if 'pagerank' in centralities:
-            print >> sys.stderr, "pagerank"
-            g.g.vs['pr'] = g.g.pagerank(weights='weight')  # pagerank
+            def pagerank():
+                print >> sys.stderr, "pagerank"
+                g.g.vs['pr'] = g.g.pagerank(weights='weight')  # pagerank
+            a.once('pr', pagerank)
 
         if 'degree' in centralities:
             print >> sys.stderr, "outdegree"
-            g.set_weighted_degree(type=ig.OUT)
+            a.weighted_degree(type=ig.OUT)
         #total_weights = sum(g.g.es['weight'])
         max_edges = vn * (vn - 1)
 
-        for cls, vs in g.classes.iteritems():
-            if not vs:
+        if "betweenness" in centralities:
+            bw_stats = g.group_stats(numpy.array(g.g.vs['bw']) / max_edges)
+        if 'pagerank' in centralities:
+            pr_stats = g.group_stats('pr')
+        if 'degree' in centralities:
+            wi_stats = g.group_stats('weighted_indegree')
+            wo_stats = g.group_stats('weighted_outdegree')
+
+        for cls in classes:
+            if not g.classes[cls]:
                 continue
 
             if "betweenness" in centralities:
-                norm_betweenness = numpy.array(g.classes[cls]['bw']) \
-                                   / max_edges
-                print " * %s : average betweenness : %.10f" % (
-                    cls, numpy.average(norm_betweenness))
-                print " * %s : stddev betweenness : %.10f" % (
-                    cls, numpy.sqrt(numpy.var(norm_betweenness)))
-                print " * %s : max betweenness: %s" % (
-                    cls, top(numpy.array(g.classes[cls]['bw']) / max_edges))
+                bw = bw_stats[cls]
+                results.add('average betweenness', bw.mean, '%.10f',
+                            group=cls)
+                results.add('stddev betweenness', bw.stddev, '%.10f',
+                            group=cls)
+                results.add('max betweenness', bw.top, top, group=cls)
 
             #print " * Average eigenvector centrality : %6f" % numpy.average(
             #    g.vs['ev'])
             if 'pagerank' in centralities:
-                print " * %s : average pagerank : %.10f" % (
-                    cls, numpy.average(g.classes[cls]['pr']))
-                print " * %s : stddev pagerank : %.10f" % (
-                    cls, numpy.sqrt(numpy.var(g.classes[cls]['pr'])))
-                print " * %s : max pagerank: %s" % (
-                    cls, top(g.classes[cls]['pr']))
+                pr = pr_stats[cls]
+                results.add('average pagerank', pr.mean, '%.10f', group=cls)
+                results.add('stddev pagerank', pr.stddev, '%.10f', group=cls)
+                results.add('max pagerank', pr.top, top, group=cls)
 
             if 'degree' in centralities:
-                wi = g.classes[cls]['weighted_indegree']
-                print " * %s : average IN degree centrality (weighted): %.10f" % (
-                    cls, numpy.average(wi))
-                print " * %s : stddev IN degree centrality (weighted): %.10f" % (
-                    cls, numpy.sqrt(numpy.var(wi)))
-                print " * %s : max IN degrees centrality (weighted): %s" % (
-                    cls, top(wi))
-                del wi
-
-                wo = g.classes[cls]['weighted_outdegree']
-                print " * %s : average OUT degree centrality (weighted) : %.10f" %\
-                      (cls, numpy.average(wo))
-                print " * %s : stddev OUT degree centrality (weighted) : %.10f" % \
-                      (cls, numpy.sqrt(numpy.var(wo)))
-                print " * %s : max OUT degrees centrality (weighted): %s" % (
-                    cls, top(wo))
-                del wo
+                wi = wi_stats[cls]
+                results.add('average IN degree centrality (weighted)',
+                            wi.mean, '%.10f', group=cls)
+                results.add('stddev IN degree centrality (weighted)',
+                            wi.stddev, '%.10f', group=cls)
+                results.add('max IN degrees centrality (weighted)',
+                            wi.top, top, group=cls)
+
+                wo = wo_stats[cls]
+                results.add('average OUT degree centrality (weighted)',
+                            wo.mean, '%.10f', group=cls)
+                results.add('stddev OUT degree centrality (weighted)',
+                            wo.stddev, '%.10f', group=cls)
+                results.add('max OUT degrees centrality (weighted)',
+                            wo.top, top, group=cls)
 
         timr.stop('centrality')
 
     if options.power_law:
         with Timr('power law'):
-            for cls, vs in g.classes.iteritems():
+            for cls in classes:
+                vs = g.classes[cls]
                 if not vs:
                     continue
 
@@ -330,8 +526,10 @@ def main():
 
                 try:
                     alpha_exp = ig.statistics.power_law_fit(indegrees, xmin=6)
-                    print " * %s : alpha exp IN degree distribution : %10f " %\
-                          (cls, alpha_exp)
+                    ## igraph >= 0.6 returns a FittedPowerLaw
+                    alpha_exp = getattr(alpha_exp, 'alpha', alpha_exp)
+                    results.add('alpha exp IN degree distribution',
+                                alpha_exp, '%10f', group=cls)
                 except ValueError:
                     print >> sys.stderr,\
                           " * %s : alpha exp IN degree distribution : ERROR" %\
@@ -342,9 +540,9 @@ def main():
                                                 in degrees if degree]
         all_list = []
 
-        nogrp_indegrees = g.g.vs.select(sysop_ne=True, bureaucrat_ne=True,
-                                        steward_ne=True, founder_ne=True,
-                                        bot_ne=True)['weighted_indegree']
+        nogrp_indegrees = g.select({'sysop_ne': True, 'bureaucrat_ne': True,
+                                    'steward_ne': True, 'founder_ne': True,
+                                    'bot_ne': True})['weighted_indegree']
         all_list += list_with_index(nogrp_indegrees, 1)
 
         sysops_indegrees = g.classes['sysop']['weighted_indegree']
@@ -365,7 +563,9 @@ def main():
         if options.gnuplot:
             f = open('hist.dat', 'w')
         else:
-            f = open('%swiki-%s-hist.dat' % (lang, date), 'w')
+            destHist = '%swiki-%s-hist.dat' % (lang, date)
+            f = open(destHist, 'w')
+            results.files.append(destHist)
 
         all_list.sort(reverse=True)
 
@@ -384,8 +584,10 @@ def main():
         process = Popen3('gnuplot hist.gnuplot')
         process.wait()
 
-        os.rename('hist.png', '%swiki-%s-hist.png' % (lang, date))
-        os.rename('hist.dat', '%swiki-%s-hist.dat' % (lang, date))
+        for ext in ('png', 'dat'):
+            dest = '%swiki-%s-hist.%s' % (lang, date, ext)
+            os.rename('hist.' + ext, dest)
+            results.files.append(dest)
 
     if options.plot:
         ## TODO: evaluate if this can be done with
@@ -401,17 +603,17 @@ def main():
             #g.g.write_graphml('itwiki-20100729-stub-meta-history_in10_out1.graphml')
             #print len(g.g.vs), len(g.g.es)
 
-            bots = g.g.vs.select(bot=True)
+            bots = g.select({'bot': True})
             bots['color'] = ('purple',) * len(bots)
             logging.debug('bots: ok')
 
-            anonyms = g.g.vs.select(anonymous=True)
+            anonyms = g.select({'anonymous': True})
             anonyms['color'] = ('blue',) * len(anonyms)
 
-            sysops = g.g.vs.select(sysop=True)
+            sysops = g.select({'sysop': True})
             sysops['color'] = ('yellow',) * len(sysops)
 
-            bur_sysops = g.g.vs.select(bureaucrat=True, sysop=True)
+            bur_sysops = g.select({'bureaucrat': True, 'sysop': True})
             bur_sysops['color'] = ('orange',) * len(bur_sysops)
 
             g.g.vs['size'] = [math.sqrt(v['weighted_indegree'] + 1)*10 for v
@@ -431,22 +633,21 @@ def main():
             ig.plot(g.g, target=lang + "_weighted_edges.png", bbox=(0, 0, 4000,
                                                                   2400),
                     layout='fr', vertex_label=' ')
-
-    if options.as_table:
-        tablr.stop()
-
-        #tablr.printHeader()
-        #tablr.printData()
-        tablr.saveInDjangoModel()
+            results.files += [lang + "_general.png",
+                              lang + "_weighted_edges.png"]
 
     if options.adjacency:
-        giant = g.g.clusters().giant()
+        giant = a.giant()
         #destAdj = "%s/%swiki-%s-adj.csv" % (os.path.split(fn)[0], lang, date)
-        destAdj = "%swiki-%s-adj.csv" % (lang, date)
+        ext = MATRIX_EXTENSIONS[options.matrix_format]
+        destAdj = "%swiki-%s-adj.%s" % (lang, date, ext)
         #destRec = "%s/%swiki-%s-rec.csv" % (os.path.split(fn)[0], lang, date)
-        destRec = "%swiki-%s-rec.csv" % (lang, date)
-        sg.Graph(giant).writeAdjacencyMatrix(destAdj, 'username')
-        sg.Graph(giant).writeReciprocityMatrix('username', destRec)
+        destRec = "%swiki-%s-rec.%s" % (lang, date, ext)
+        sg.Graph(giant).writeAdjacencyMatrix(destAdj, 'username',
+                                             fmt=options.matrix_format)
+        sg.Graph(giant).writeReciprocityMatrix('username', destRec,
+                                               fmt=options.matrix_format)
+        results.files += [destAdj, destRec]
 
     if options.users_role:
         l = g.get_user_class('username', ('anonymous', 'bot', 'bureaucrat',
@@ -457,6 +658,7 @@ def main():
         with open(destUR, 'w') as f:
             for username, role in sorted(l):
                 print >> f, "%s,%s" % (username, role)
+        results.files.append(destUR)
 
         from random import shuffle
         #destCls = "%s/%swiki-%s-%%s.csv" % (os.path.split(fn)[0], lang, date)
@@ -470,6 +672,90 @@ def main():
                           ("%s,http://vec.wikipedia.org/w/index.php?title=" + \
                           "Discussion_utente:%s&action=history&offset=" + \
                           "20100000000001") % (username, username)
+            results.files.append(destCls % cls)
+
+    return results
+
+
+def batch(fns, metric_sets, start=None, end=None):
+    """
+    Analyses every graph in fns with every set of options in metric_sets
+    (see analyse()): a graph is loaded once and the metric sets share its
+    intermediates. Yields fn, options, Results.
+    """
+    for fn in fns:
+        with Timr('load %s' % (fn, )):
+            a = Analysis(fn, start, end)
+        ## all the metric sets see the groups in the same order
+        a.define_groups(any(needs_groups(options)
+                            for options in metric_sets))
+        for options in metric_sets:
+            yield fn, options, analyse(a, options)
+        del a
+
+
+def main():
+    import copy
+    import shlex
+
+    op = create_option_parser()
+
+    (options, args) = op.parse_args()
+
+    if not args:
+        print "Insert at least one file to process\n"
+        op.print_help()
+        sys.exit(2)
+
+    ## every metric set is parsed on top of the other options
+    metrics = options.metric_sets or [None, ]
+    options.metric_sets = None
+    metric_sets = []
+    for m in metrics:
+        m_options = options
+        if m is not None:
+            m_options, m_args = op.parse_args(shlex.split(m),
+                                              copy.copy(options))
+            if m_args or m_options.metric_sets:
+                op.error("a metric set can't contain graphs or --metrics: "
+                         "%s" % (m, ))
+            if (m_options.start, m_options.end) != (options.start,
+                                                    options.end):
+                op.error("--start and --end apply to every metric set: %s" %
+                         (m, ))
+        try:
+            get_centralities(m_options.centrality)
+        except ValueError:
+            logging.error('Unknown centrality')
+            sys.exit(0)
+        if m_options.samples is not None and m_options.samples < 1:
+            op.error("--samples must be at least 1")
+        m_options.label = m
+        metric_sets.append(m_options)
+
+    for fn, m_options, results in batch(args, metric_sets, options.start,
+                                        options.end):
+        if len(args) > 1 or m_options.label is not None:
+            print "## %s: %s" % (fn, m_options.label or '')
+
+        if m_options.as_table:
+            tablr = Tablr()
+            tablr.start(1024 * 32, results.get('lang'))
+
+            for line in results.lines(table=True):
+                print line
+            tablr.stop()
+
+            #tablr.printHeader()
+            #tablr.printData()
+            tablr.saveInDjangoModel()
+
+            ## not saved: confidence intervals, ...
+            for line in results.lines(table=False):
+                print line
+        else:
+            for line in results.lines():
+                print line
 
 
 if __name__ == '__main__':
@@ -13,7 +13,8 @@
 #                                                                        #
 ##########################################################################
 
-import igraph as ig
+from sonet.graph import load
+from sonet.graphstore import is_graph_dir, write_graph
 from sonet.mediawiki import addGroupAttribute, addBlockedAttribute, isip, \
      explode_dump_filename
 
@@ -37,9 +38,9 @@ def main():
               'transwiki', 'uploader', 'ipblock-exempt', 'oversight',
               'founder', 'rollbacker', 'accountcreator', 'autoreviewer',
               'abusefilter')
-    g = ig.load(fn)
+    g = load(fn).g
     if opts.source:
-        sourceg = ig.load(opts.source)
+        sourceg = load(opts.source).g
         for destv in g.vs:
             try:
                 sourcev = sourceg.vs.select(username=destv['username'])[0]
@@ -60,7 +61,11 @@ def main():
 
     print 'ANONYMOUS USERS'
     g.vs['anonymous'] = map(isip, g.vs['username'])
-    g.write("%swiki-%s%s_rich.pickle" % (lang, date, type_), format="pickle")
+    if is_graph_dir(fn):
+        write_graph(g, "%swiki-%s%s_rich.graph" % (lang, date, type_))
+    else:
+        g.write("%swiki-%s%s_rich.pickle" % (lang, date, type_),
+                format="pickle")
 
 
 if __name__ == "__main__":
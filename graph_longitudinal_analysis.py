@@ -15,7 +15,6 @@
 
 ## SYSTEM
 import sys
-import gc
 import logging
 
 from datetime import timedelta
@@ -24,85 +23,146 @@ from math import ceil
 ## PROJECT LIBS
 from sonet.timr import Timr
 from sonet import mediawiki as mwlib, graph as sg, lib
+from sonet.graphstore import is_graph_dir, read_time_index
+from sonet.sliding import iter_windows, get_columns, ALL_METRICS
 
 
 def graph_loader(file_name):
     """
-    Loads a sonet.graph object from a pickle/graphml/... file
+    Loads a sonet.graph object from a pickle/graphml/... file (or from a
+    sonet.graphstore directory, reading only the attributes needed here)
     """
     try:
         with Timr("GRAPH LOADING"):
-            return sg.load(file_name)
+            return sg.load(file_name, vertex_attributes=('username',),
+                           edge_attributes=('timestamp', 'weight'))
     except IOError:
         logging.exception("unable to load a graph from passed file: %s",
                           file_name)
         sys.exit()
 
 
-def cumulative_analysis(fn, start, end, freq):
-
-    logging.info("running cumulative analysis")
+def index_loader(file_name):
+    """
+    Loads the sonet.timeline.TimeIndex of the edges of the graph in file_name
+    (without creating the graph, if it's a sonet.graphstore directory)
+    """
+    if is_graph_dir(file_name):
+        with Timr("TIME INDEX LOADING"):
+            return read_time_index(file_name)
+    graph = graph_loader(file_name)
+    with Timr("TIME INDEX CREATION"):
+        return graph.time_index()
 
-    graph = graph_loader(fn) ## loading graph
 
-    freq_range = int(ceil(((end - start).days + 1) / float(freq)))
-    for d in range(freq_range):
-        s, e = start, end - timedelta(d * freq)
+def cumulative_analysis(fn, start, end, freq, output):
+    """
+    Writes the stats of the windows from start to end, end - freq days, ...
+    The whole (start, end) window is sliced too (it's the last one): only
+    its messages and the users who sent or received them are counted.
+    """
 
-        if e <= s: continue
+    logging.info("running cumulative analysis")
 
-        ## processing
-        if s != start or e != end:
-            with Timr("SUBGRAPHING"):
-                process_graph(graph, s, e)
+    index = index_loader(fn) ## loading graph once
 
-        ## printing stats
-        print_graph_stats(graph.g)
-    del graph
+    ## the window only grows: walk it from the earliest end
+    freq_range = int(ceil(((end - start).days + 1) / float(freq)))
+    windows = [(start, end - timedelta(d * freq))
+               for d in reversed(range(freq_range))]
+    process_windows(index, [(s, e) for s, e in windows if e > s], output)
 
     return
 
-def time_slice_analysis(fn, start, end, freq, time_window):
+def time_slice_analysis(fn, start, end, freq, time_window, output):
 
     logging.info("running time-slice analysis")
 
-    counter = 0
+    index = index_loader(fn) ## loading graph once
 
     ## date range used for sub-graph analysis
     freq_range = int( ceil( ( (end - start).days + 1) / float(freq) ) )
+    windows = []
     for s in [start + timedelta(freq * d) for d in range(freq_range)]:
-
         d = s + timedelta(time_window)
         e = d if (d <= end) else end + timedelta(1)
+        windows.append((s, e))
 
-        graph = graph_loader(fn) ## loading graph
+    process_windows(index, windows, output)
 
-        ## processing
-        if s != start or e != end:
-            process_graph(graph, s, e)
+def process_windows(index, windows, output):
+    """
+    Writes the stats of every (start, end) window to output (a
+    StatsWriter): no subgraph of the whole graph is created
+    """
+    df = "%Y-%m-%d %H:%M"
+    for counter, (s, e, stats) in enumerate(iter_windows(
+        index, windows, output.metrics, output.jobs)):
+        logging.debug("SINCE %s TO %s", s.strftime(df), e.strftime(df))
 
         ## printing stats
-        print_graph_stats(graph.g)
-
-        ## saving memory
-        del graph.g, graph
+        print_graph_stats(stats)
+        output.write(s, e, stats)
 
         if not counter % 10:
             logging.info(counter)
-            gc.collect()
 
-def process_graph(graph, start, end):
 
-    df = "%Y-%m-%d %H:%M"
-    logging.debug("SINCE %s TO %s", start.strftime(df), end.strftime(df))
+def print_graph_stats(stats):
 
-    ## create a sub-graph on time boundaries
-    graph.time_slice_subgraph(start=start, end=end)
+    logging.debug("Nodes: %d - Edges: %d\n" % (stats['nodes'],
+                                               stats['edges']))
 
 
-def print_graph_stats(g):
+class StatsWriter(object):
+    """
+    Writes one row for every window, with the stats of the metrics: to a
+    CSV file (stdout if fn is None) or to the LongitudinalStats table
+    """
+    def __init__(self, metrics, jobs=1, fn=None, lang=None, save_db=False):
+        self.metrics, self.jobs, self.lang = metrics, jobs, lang
+        self.columns = get_columns(metrics)
+        self.table = self.connection = self.csv = None
+        if save_db:
+            from sonet.models import get_longitudinal_table
+            self.table, self.connection = get_longitudinal_table()
+            self.insert = self.table.insert()
+        else:
+            import csv
+            self.out = open(fn, 'wb') if fn else sys.stdout
+            self.csv = csv.writer(self.out)
+            self.csv.writerow(('start', 'end') + self.columns)
+
+    def write(self, start, end, stats):
+        if self.connection is not None:
+            data = dict((name, stats[name]) for name in self.columns)
+            data.update(lang=self.lang, start=start, end=end)
+            self.connection.execute(self.insert, data)
+        else:
+            self.csv.writerow([start.strftime('%Y-%m-%d'),
+                               end.strftime('%Y-%m-%d')] +
+                              [stats[name] for name in self.columns])
 
-    logging.debug("Nodes: %d - Edges: %d\n" % (len(g.vs), len(g.es)))
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        elif self.out is not sys.stdout:
+            self.out.close()
+
+
+def metrics_list(value):
+    """
+    Comma separated list of metrics (see sonet.sliding.METRICS)
+    """
+    metrics = value.split(',')
+    if 'all' in metrics:
+        return ALL_METRICS
+    unknown = set(metrics).difference(ALL_METRICS)
+    if unknown:
+        import argparse
+        raise argparse.ArgumentTypeError('Unknown metrics: %s' % (
+            ', '.join(sorted(unknown)), ))
+    return tuple(metric for metric in ALL_METRICS if metric in metrics)
 
 
 def create_option_parser():
@@ -129,6 +189,19 @@ def create_option_parser():
     p.add_argument('-c', '--cumulative',
                    help='cumulative graph analysis, fixed start date',
                    action='store_true')
+    p.add_argument('-m', '--metrics', type=metrics_list,
+                   default='degree,density,reciprocity',
+                   help='comma separated metrics computed for every window: '
+                        '%s or all (default: %%(default)s)' % (
+                            ', '.join(ALL_METRICS), ))
+    p.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                   help='number of processes computing the windows '
+                        '(default: %(default)s)')
+    p.add_argument('-o', '--output', metavar='FILE',
+                   help='CSV file with the stats of every window '
+                        '(default: stdout)')
+    p.add_argument('--save-db', action='store_true', dest='save_db',
+                   help='save the stats of every window in the database')
     ## positional arguments
     p.add_argument('file_name',
                    help="file containing the graph to be analyzed",
@@ -146,7 +219,7 @@ def main():
     args = op.parse_args()
 
     ## explode dump filename in order to obtain wiki lang, dump date and type
-    _, date_, _ = mwlib.explode_dump_filename(args.file_name)
+    lang, date_, _ = mwlib.explode_dump_filename(args.file_name)
 
     fn, start, tw = args.file_name, args.start, args.time_window
     ## if end argument is not specified, then use the dump date
@@ -158,11 +231,19 @@ def main():
         logging.info("Cumulative longitudinal analysis chosen,"
                      "hence not considering following option: frequency")
 
+    if args.jobs < 1:
+        op.error('--jobs must be positive')
+    output = StatsWriter(args.metrics, args.jobs, args.output, lang,
+                         args.save_db)
+
     with Timr("RUNNING ANALYSIS"):
-        if args.cumulative:
-            cumulative_analysis(fn, start, end, freq)
-        else:
-            time_slice_analysis(fn, start, end, freq, tw)
+        try:
+            if args.cumulative:
+                cumulative_analysis(fn, start, end, freq, output)
+            else:
+                time_slice_analysis(fn, start, end, freq, tw, output)
+        finally:
+            output.close()
 
 
 if __name__ == '__main__':
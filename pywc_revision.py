@@ -270,19 +270,13 @@ def main():
     dumps_checker(xml)
 
     lang, _, _ = explode_dump_filename(xml)
-    deflate, _lineno = lib.find_open_for_this_file(xml)
 
-    if _lineno:
-        src = deflate(xml, 51)
-    else:
-        src = deflate(xml)
+    src = lib.open_dump(xml)
 
     translation = get_translations(src)
     tag = get_tags(src, tags=('page,title,revision,timestamp,text,redirect,'
                               'contributor,username,ip'))
     namespaces = [x[1] for x in [(0, "Normal")] + mwlib.get_namespaces(src)]
-    src.close()
-    src = deflate(xml)
 
     if os.path.exists(output):
         logging.error("File %s already exists!", output)
@@ -258,23 +258,16 @@ def main():
     args = op.parse_args()
 
     lang, date_, type_ = explode_dump_filename(args.xml_fn)
-    deflate, _lineno = lib.find_open_for_this_file(args.xml_fn)
 
     dumps_checker(args, type_)
 
     logging.info('---------------------START---------------------')
 
-    if _lineno:
-        src = deflate(args.xml_fn, 51)
-    else:
-        src = deflate(args.xml_fn)
+    src = lib.open_dump(args.xml_fn)
 
     translation = get_translations(src)
     tag = get_tags(src, tags='page,title,redirect,text,username,ip,timestamp')
 
-    src.close()
-    src = deflate(args.xml_fn)
-
     output = open(args.output, 'w') if args.output else None
 
     processor = HistoryRevisionsPageProcessor(
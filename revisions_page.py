@@ -185,17 +185,11 @@ def main():
     dumps_checker(xml)
 
     lang, _, _ = explode_dump_filename(xml)
-    deflate, _lineno = lib.find_open_for_this_file(xml)
 
-    if _lineno:
-        src = deflate(xml, 51)
-    else:
-        src = deflate(xml)
+    src = lib.open_dump(xml)
 
     translation = get_translations(src)
     tag = get_tags(src, tags='page,title,revision,timestamp,text,redirect')
-    src.close()
-    src = deflate(xml)
 
     out = open(output, 'w')
     processor = HistoryRevisionsPageProcessor(tag=tag, lang=lang,
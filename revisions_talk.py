@@ -17,10 +17,12 @@ from sonet.mediawiki import HistoryPageProcessor, \
                             TextCleaner, \
                             get_translations, get_tags, \
                             explode_dump_filename, _diff_text  #, diff_text
+from sonet.mediawiki.pageindex import index_filename, read_index
 from sonet import lib
 from django.utils.encoding import smart_str
 import csv
 #import difflib
+import os
 import sys
 import logging
 import re
@@ -187,10 +189,17 @@ def main():
     p.add_option('-c', '--clean', action="store_true", dest="clean",
                  default=False,
                  help="Cleans HTML, wiki syntax, acronyms and emoticons")
+    p.add_option('-i', '--index', action="store_true", dest="index",
+                 default=False, help="Parse only the Talk and User Talk "
+                 "pages found in the page index of the dump (see "
+                 "dump_index.py)")
     opts, files = p.parse_args()
 
     if len(files) != 2:
         p.error("Wrong parameters")
+    if opts.index and not os.path.exists(index_filename(files[0])):
+        p.error("Page index does not exist (%s), create it with "
+                "dump_index.py" % (index_filename(files[0]), ))
     if opts.verbose:
         logging.basicConfig(stream=sys.stderr,
                             level=logging.DEBUG,
@@ -203,18 +212,13 @@ def main():
     dumps_checker(xml)
 
     lang, _, _ = explode_dump_filename(xml)
-    deflate, _lineno = lib.find_open_for_this_file(xml)
 
-    if _lineno:
-        src = deflate(xml, 51)
-    else:
-        src = deflate(xml)
+    ## the index seeks in the dump
+    src = lib.open_dump(xml, seek=opts.index)
 
     translation = get_translations(src)
     tag = get_tags(src, tags='page,title,revision,timestamp,text,redirect,'
                              'contributor,username,ip')
-    src.close()
-    src = deflate(xml)
 
     out = open(output, 'w')
     processor = HistoryRevisionsPageProcessor(tag=tag, lang=lang,
@@ -225,7 +229,12 @@ def main():
     processor.diff_timeout = opts.timeout
     processor.clean = opts.clean
     with Timr('Processing'):
-        processor.start(src) ## PROCESSING
+        if opts.index:
+            ## Talk and User Talk namespaces
+            processor.start(src, index=read_index(index_filename(xml)),
+                            namespaces=(1, 3))
+        else:
+            processor.start(src) ## PROCESSING
     processor.flush()
     out.close()
 
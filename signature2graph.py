@@ -16,7 +16,7 @@
 from bz2 import BZ2File
 
 ## PROJECT LIBS
-from sonet.edgecache import EdgeCache
+from sonet.edgecache import EdgeCache, SpillingEdgeCache
 import sonet.mediawiki as mwlib
 from sonet.mediawiki import PageProcessor
 from sonet import lib
@@ -93,6 +93,10 @@ def main():
                  help="Verbose output (like timings)")
     p.add_option('-s', action="store", dest="signature", default=None,
                  help="Signature in this language (e.g. sig, firma..)")
+    p.add_option('--spill', action="store", dest="spill", type="int",
+                 default=None, metavar="N",
+                 help="Keep at most N edges in memory, writing the others "
+                      "to temporary files (in $TMPDIR) merged at the end")
     opts, files = p.parse_args()
     if opts.verbose:
         import sys
@@ -131,13 +135,18 @@ def main():
         src.close()
         src = lib.BZ2FileExt(xml)
 
+    if opts.spill:
+        ecache = SpillingEdgeCache(max_size=opts.spill)
+    else:
+        ecache = EdgeCache()
+
     if opts.signature is not None:
-        processor = CurrentPageProcessor(ecache=EdgeCache(), tag=tag,
+        processor = CurrentPageProcessor(ecache=ecache, tag=tag,
                               user_talk_names=(lang_user_talk, en_user_talk),
                               search=(lang_user, en_user), lang=lang,
                               signature=opts.signature)
     else:
-        processor = CurrentPageProcessor(ecache=EdgeCache(), tag=tag,
+        processor = CurrentPageProcessor(ecache=ecache, tag=tag,
                               user_talk_names=(lang_user_talk, en_user_talk),
                               search=(lang_user, en_user), lang=lang)
 
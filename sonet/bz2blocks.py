@@ -0,0 +1,345 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Random access into bzip2 files.
+
+A bzip2 stream is made of independent blocks starting with a 48 bits magic
+number (not aligned to bytes). build_block_table() finds the blocks and
+stores, for every block, its position (in bits) in the compressed file and
+the offset and size of its data in the decompressed stream.
+
+Given the table, a single block can be decompressed wrapping its bits into a
+new bzip2 stream (header, block, end of stream marker and CRC): this is what
+BZ2SeekableFile does to seek() to any offset of the decompressed stream.
+"""
+
+import os
+import bz2
+import gzip
+import logging
+from binascii import hexlify, unhexlify
+from bisect import bisect_right
+from collections import namedtuple
+
+BLOCK_MAGIC = 0x314159265359
+EOS_MAGIC = 0x177245385090
+## any block can be decompressed with the biggest block size
+STREAM_HEADER = 'BZh9'
+READ_SIZE = 8 * 1024 * 1024
+
+BZ2Block = namedtuple('BZ2Block', 'bit_offset bit_end crc uoffset usize')
+
+
+def block_table_filename(fn):
+    """
+    >>> block_table_filename('/tmp/itwiki-20100218-pages-meta-history.xml.bz2')
+    '/tmp/itwiki-20100218-pages-meta-history.xml.bz2.blocks.gz'
+    """
+    return fn + '.blocks.gz'
+
+
+def _patterns(magic):
+    """
+    Returns, for every bit shift s, the 7 bytes containing magic starting at
+    bit s of the first byte and the masks of the first and the last byte
+    """
+    patterns = []
+    for s in xrange(8):
+        b = unhexlify('%014x' % (magic << (8 - s)))
+        patterns.append((s, b, 0xff >> s, (0xff << (8 - s)) & 0xff))
+    return patterns
+
+
+def find_magics(data, magic, start=0):
+    """
+    Returns the bit offsets of magic in the string data, found starting at
+    the byte start. Only the magics ending in data (with the 7 bytes
+    containing them) are found.
+
+    The 5 bytes always fully covered by the 48 bits of magic are searched
+    with str.find() for every bit shift, then the first and the last byte
+    are checked.
+
+    >>> data = bz2.compress('x' * 1000)
+    >>> find_magics(data, BLOCK_MAGIC), find_magics(chr(1) + data, BLOCK_MAGIC)
+    ([32], [40])
+    """
+    found = []
+    for s, b, mask0, mask6 in _patterns(magic):
+        key = b[1:6]
+        i = data.find(key, start + 1)
+        while i != -1:
+            k = i - 1
+            if k + 7 <= len(data) and \
+               ord(data[k]) & mask0 == ord(b[0]) & mask0 and \
+               ord(data[k + 6]) & mask6 == ord(b[6]) & mask6:
+                found.append(k * 8 + s)
+            i = data.find(key, i + 1)
+    return sorted(found)
+
+
+def find_magic(f, magic, read_size=READ_SIZE):
+    """
+    Yields the bit offsets of magic in the file f, in order.
+
+    >>> from StringIO import StringIO
+    >>> list(find_magic(StringIO(bz2.compress('x' * 1000)), BLOCK_MAGIC, 16))
+    [32]
+    """
+    tail, base = '', 0  # base = offset in bytes of tail in the file
+    while True:
+        block = f.read(read_size)
+        data = tail + block
+        ## a magic at the start of the tail has already been yielded
+        for offset in find_magics(data, magic, 1 if base else 0):
+            yield base * 8 + offset
+        if not block:
+            return
+        ## the magic can span over two reads
+        keep = min(len(data), 7)
+        base += len(data) - keep
+        tail = data[-keep:]
+
+
+def get_bits(data, start, end):
+    """
+    Returns the bits [start, end) of the string data as a long
+
+    >>> get_bits('\\x0f\\xf0', 4, 12) == 0xff
+    True
+    """
+    first = start // 8
+    last = (end + 7) // 8
+    n = long(hexlify(data[first:last]), 16)
+    n >>= last * 8 - end
+    return n & ((1L << (end - start)) - 1)
+
+
+def _read_bits(f, start, end):
+    """
+    Returns the bits [start, end) of the file f as a long
+    """
+    f.seek(start // 8)
+    data = f.read((end + 7) // 8 - start // 8)
+    return get_bits(data, start % 8, start % 8 + end - start)
+
+
+def decompress_bits(n, bits, crc):
+    """
+    Decompresses a single block, given as a long n of bits bits (from the
+    block magic to the end of the block) and its CRC.
+    """
+    ## end of stream: magic and combined CRC (equal to the block CRC with a
+    ## single block), then pad to a byte boundary
+    n = (((n << 48) | EOS_MAGIC) << 32) | crc
+    bits += 80
+    pad = -bits % 8
+    n <<= pad
+    bits += pad
+    return bz2.decompress(STREAM_HEADER + unhexlify('%0*x' % (bits // 4, n)))
+
+
+def decompress_block(f, block):
+    """
+    Decompresses a single block (a BZ2Block, only bit_offset, bit_end and crc
+    are used) of the bzip2 file f.
+    """
+    return decompress_bits(_read_bits(f, block.bit_offset, block.bit_end),
+                           block.bit_end - block.bit_offset, block.crc)
+
+
+def _block_size(args):
+    """
+    Size of the decompressed data of the block, None if it can't be
+    decompressed (it doesn't end where a block ends)
+    """
+    fn, block = args
+    f = open(fn, 'rb')
+    try:
+        return len(decompress_block(f, block))
+    except (IOError, ValueError):
+        return None
+    finally:
+        f.close()
+
+
+def build_block_table(fn, processes=None):
+    """
+    Returns the list of the blocks (BZ2Block) of the bzip2 file fn. Works with
+    multi-stream files too (like the ones written by lbzip2 or pbzip2).
+
+    Every block is decompressed once to know its size: with processes > 1
+    blocks are decompressed in parallel. The magics can also be found by
+    chance in the compressed data: a block that can't be decompressed is
+    extended to the next boundary (and the block starting at the false
+    magic is dropped) until it can.
+    """
+    f = open(fn, 'rb')
+    try:
+        starts = list(find_magic(f, BLOCK_MAGIC))
+        f.seek(0)
+        ends = list(find_magic(f, EOS_MAGIC))
+        logging.info('BLOCKS: %d - STREAMS: %d', len(starts), len(ends))
+
+        ## a block ends where the next block or the stream ends
+        boundaries = sorted(starts[1:] + ends)
+        blocks = []
+        for start in starts:
+            end = boundaries[bisect_right(boundaries, start)]
+            crc = int(_read_bits(f, start + 48, start + 80))
+            blocks.append(BZ2Block(start, end, crc, None, None))
+    finally:
+        f.close()
+
+    fn = os.path.abspath(fn)
+    args = [(fn, block) for block in blocks]
+    if processes > 1:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        sizes = pool.map(_block_size, args, chunksize=16)
+        pool.close()
+    else:
+        sizes = map(_block_size, args)
+
+    i = 0
+    while i < len(blocks):
+        while sizes[i] is None:
+            end = blocks[i].bit_end
+            k = bisect_right(boundaries, end)
+            if k == len(boundaries):
+                raise IOError('Invalid bzip2 block at bit %d of %s' % (
+                    blocks[i].bit_offset, fn))
+            logging.warning('False bzip2 magic at bit %d', end)
+            if i + 1 < len(blocks) and blocks[i + 1].bit_offset == end:
+                del blocks[i + 1], sizes[i + 1]
+            blocks[i] = blocks[i]._replace(bit_end=boundaries[k])
+            sizes[i] = _block_size((fn, blocks[i]))
+        i += 1
+
+    uoffset = 0
+    for i, size in enumerate(sizes):
+        blocks[i] = blocks[i]._replace(uoffset=uoffset, usize=size)
+        uoffset += size
+    return blocks
+
+
+def write_block_table(fn, blocks):
+    out = gzip.open(fn, 'wb')
+    try:
+        for block in blocks:
+            out.write('%d\t%d\t%d\t%d\t%d\n' % block)
+    finally:
+        out.close()
+
+
+def read_block_table(fn):
+    f = gzip.open(fn, 'rb')
+    try:
+        return [BZ2Block(*[int(v) for v in line.split('\t')]) for line in f]
+    finally:
+        f.close()
+
+
+class BZ2SeekableFile(object):
+    """
+    Read-only file-like object on the decompressed stream of a bzip2 file,
+    supporting seek(). Only the block containing the current position is
+    decompressed.
+
+    >>> import tempfile, os
+    >>> fd, fn = tempfile.mkstemp('.bz2')
+    >>> data = ''.join('line %d\\n' % i for i in xrange(200000))
+    >>> os.close(fd); open(fn, 'wb').write(bz2.compress(data))
+    >>> f = BZ2SeekableFile(fn, build_block_table(fn))
+    >>> len(f.blocks) > 1
+    True
+    >>> f.seek(1500000); f.readline()
+    'ne 134259\\n'
+    >>> f.read(12)
+    'line 134260\\n'
+    >>> f.seek(0); f.read() == data
+    True
+    >>> f.close(); os.remove(fn)
+    """
+    blocks = None
+    size = 0
+
+    def __init__(self, fn, blocks=None):
+        if blocks is None:
+            blocks = read_block_table(block_table_filename(fn))
+        self.blocks = blocks
+        self._offsets = [b.uoffset for b in blocks]
+        if blocks:
+            self.size = blocks[-1].uoffset + blocks[-1].usize
+        self._f = open(fn, 'rb')
+        self._block = None  # index of the block in self._data
+        self._data = ''
+        self._pos = 0
+
+    def _load(self):
+        """
+        Returns the decompressed data of the block containing the current
+        position and the position in this data
+        """
+        idx = bisect_right(self._offsets, self._pos) - 1
+        if idx != self._block:
+            self._data = self._decompress(self.blocks[idx])
+            self._block = idx
+        return self._data, self._pos - self.blocks[idx].uoffset
+
+    def _decompress(self, block):
+        return decompress_block(self._f, block)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.size
+        self._pos = max(0, offset)
+
+    def tell(self):
+        return self._pos
+
+    def read(self, size=-1):
+        chunks = []
+        while size and self._pos < self.size:
+            data, start = self._load()
+            end = len(data) if size < 0 else min(len(data), start + size)
+            chunks.append(data[start:end])
+            self._pos += end - start
+            if size > 0:
+                size -= end - start
+        return ''.join(chunks)
+
+    def readline(self):
+        chunks = []
+        while self._pos < self.size:
+            data, start = self._load()
+            end = data.find('\n', start) + 1 or len(data)
+            chunks.append(data[start:end])
+            self._pos += end - start
+            if data[end - 1] == '\n':
+                break
+        return ''.join(chunks)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        self._f.close()
+        self._data = ''
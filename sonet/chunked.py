@@ -0,0 +1,269 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Chunked dumps: a dump recompressed in chunks compressed independently, every
+one made of complete pages (the first chunk is the header of the dump, the
+last one its end).
+
+The chunks are gzip members or zstd frames, so a chunked dump is still a
+valid .gz (.zst) file. The chunk table is written in a sidecar file (see
+chunk_table_filename()) and the page index of the dump (see
+sonet.mediawiki.pageindex) is written too.
+
+Any chunk can be decompressed without reading the others: ChunkedFile can
+seek() and PageProcessor.start_parallel() sends whole chunks to its workers,
+that decompress them.
+"""
+
+import zlib
+import gzip
+import logging
+from collections import namedtuple
+
+from sonet.bz2blocks import BZ2SeekableFile
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## pages in every chunk
+CHUNK_PAGES = 1000
+
+ChunkEntry = namedtuple('ChunkEntry', 'offset length uoffset usize pages')
+
+
+def chunk_table_filename(fn):
+    """
+    >>> chunk_table_filename('/tmp/itwiki-20100218-pages-meta-history.xml.gz')
+    '/tmp/itwiki-20100218-pages-meta-history.xml.gz.chunks.gz'
+    """
+    return fn + '.chunks.gz'
+
+
+def compress(data, codec):
+    if codec == 'zst':
+        return zstandard.ZstdCompressor(level=9).compress(data)
+
+    out = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return out.compress(data) + out.flush()
+
+
+def decompress(data, codec):
+    """
+    >>> decompress(compress('<page>', 'gz'), 'gz')
+    '<page>'
+    """
+    if codec == 'zst':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def get_codec(fn):
+    """
+    >>> get_codec('/tmp/itwiki-20100218-pages-meta-history.xml.gz')
+    'gz'
+    """
+    codec = fn.split('.')[-1]
+    if codec not in ('gz', 'zst'):
+        raise ValueError('Unknown chunk compression: %s' % (fn, ))
+    if codec == 'zst' and zstandard is None:
+        raise Exception('zstd chunks require zstandard')
+    return codec
+
+
+class ChunkWriter(object):
+    """
+    Writes a chunked dump to out (a file object). Lines are written with
+    write(), end_page() has to be called after every </page>. What follows
+    the last page is written in a chunk on its own by close().
+
+    >>> from StringIO import StringIO
+    >>> out = StringIO()
+    >>> w = ChunkWriter(out, 'gz', 2)
+    >>> for line in ['<mediawiki>\\n', '<page>\\n', '</page>\\n', '</mediawiki>\\n']:
+    ...     w.write(line)
+    ...     if line == '</page>\\n': w.end_page()
+    >>> w.close()
+    >>> [c[2:] for c in w.chunks]
+    [(0, 12, 0), (12, 15, 1), (27, 13, 0)]
+    >>> data = out.getvalue()
+    >>> [decompress(data[c.offset:c.offset + c.length], 'gz')
+    ...  for c in w.chunks]
+    ['<mediawiki>\\n', '<page>\\n</page>\\n', '</mediawiki>\\n']
+    """
+    def __init__(self, out, codec='gz', pages=CHUNK_PAGES):
+        self.out = out
+        self.codec = codec
+        self.pages_per_chunk = pages
+        self.chunks = []
+        self._lines = []
+        self._pages = 0
+        self._page_end = 0  # lines up to the end of the last page
+        self._header = True
+        self._offset = 0
+        self._uoffset = 0
+
+    def write(self, line):
+        if self._header and line.lstrip().startswith('<page>'):
+            self.flush()
+            self._header = False
+        self._lines.append(line)
+
+    def end_page(self):
+        self._pages += 1
+        self._page_end = len(self._lines)
+        if self._pages >= self.pages_per_chunk:
+            self.flush()
+
+    def flush(self):
+        if not self._lines:
+            return
+        self._write(''.join(self._lines))
+        self._lines, self._pages, self._page_end = [], 0, 0
+
+    def _write(self, data):
+        compressed = compress(data, self.codec)
+        self.out.write(compressed)
+        self.chunks.append(ChunkEntry(self._offset, len(compressed),
+                                      self._uoffset, len(data), self._pages))
+        self._offset += len(compressed)
+        self._uoffset += len(data)
+
+    def close(self):
+        if self._pages:
+            tail = self._lines[self._page_end:]
+            self._lines = self._lines[:self._page_end]
+            self.flush()
+            self._lines = tail
+        self.flush()
+
+
+def _tee(lines, writer):
+    for line in lines:
+        writer.write(line)
+        yield line
+
+
+def convert(src, fn, pages=CHUNK_PAGES):
+    """
+    Recompresses the (decompressed) dump src in the chunked dump fn. Writes
+    the chunk table and the page index too. Returns the chunk table.
+    """
+    from sonet.mediawiki.pageindex import iter_index, write_index, \
+         index_filename
+
+    out = open(fn, 'wb')
+    try:
+        writer = ChunkWriter(out, get_codec(fn), pages)
+
+        def entries():
+            for entry in iter_index(_tee(src, writer)):
+                writer.end_page()
+                yield entry
+
+        counter = write_index(index_filename(fn), entries())
+        writer.close()
+    finally:
+        out.close()
+
+    write_chunk_table(chunk_table_filename(fn), writer.chunks)
+    logging.info('%d pages in %d chunks', counter, len(writer.chunks))
+    return writer.chunks
+
+
+def write_chunk_table(fn, chunks):
+    out = gzip.open(fn, 'wb')
+    try:
+        for chunk in chunks:
+            out.write('%d\t%d\t%d\t%d\t%d\n' % chunk)
+    finally:
+        out.close()
+
+
+def read_chunk_table(fn):
+    f = gzip.open(fn, 'rb')
+    try:
+        return [ChunkEntry(*[int(v) for v in line.split('\t')]) for line in f]
+    finally:
+        f.close()
+
+
+def read_chunks(fn, chunks):
+    """
+    Returns the decompressed data of the chunks (a list of ChunkEntry) of the
+    chunked dump fn.
+    """
+    codec = get_codec(fn)
+    f = open(fn, 'rb')
+    try:
+        data = []
+        for chunk in chunks:
+            f.seek(chunk.offset)
+            data.append(decompress(f.read(chunk.length), codec))
+        return ''.join(data)
+    finally:
+        f.close()
+
+
+class ChunkShard(object):
+    """
+    A shard of a chunked dump for PageProcessor.start_parallel(): the header
+    chunk and some chunks of pages, read by the worker
+    """
+    def __init__(self, fn, header, chunks):
+        self.fn = fn
+        self.header = header
+        self.chunks = chunks
+
+    def open(self):
+        from cStringIO import StringIO
+
+        return StringIO(read_chunks(self.fn, [self.header] + self.chunks) +
+                        '</mediawiki>\n')
+
+
+class ChunkedFile(BZ2SeekableFile):
+    """
+    Read-only, seekable, file-like object on the decompressed stream of a
+    chunked dump. Only the chunk containing the current position is
+    decompressed.
+    """
+    def __init__(self, fn, chunks=None):
+        if chunks is None:
+            chunks = read_chunk_table(chunk_table_filename(fn))
+        self.fn = fn
+        self.codec = get_codec(fn)
+        super(ChunkedFile, self).__init__(fn, chunks)
+
+    def _decompress(self, chunk):
+        self._f.seek(chunk.offset)
+        return decompress(self._f.read(chunk.length), self.codec)
+
+    def iter_shards(self, shard_size):
+        """
+        Yields ChunkShard made of whole chunks, at least shard_size bytes long
+        (decompressed) except the last one
+        """
+        header, group, size = self.blocks[0], [], 0
+        for chunk in self.blocks[1:]:
+            if not chunk.pages:
+                continue
+            group.append(chunk)
+            size += chunk.usize
+            if size >= shard_size:
+                yield ChunkShard(self.fn, header, group)
+                group, size = [], 0
+        if group:
+            yield ChunkShard(self.fn, header, group)
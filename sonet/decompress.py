@@ -0,0 +1,325 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+In-process decompression of dumps, without external programs.
+
+The compressed file is decompressed by a background thread (the C
+decompressors release the GIL while working) into a bounded queue of
+chunks, read by ReadAheadFile: decompression goes on while the dump is
+parsed. bzip2 blocks are independent, so they are split from the stream and
+decompressed by a pool of threads. gzip members (and xz and zstd streams)
+can't be found without decompressing what comes before them: they are
+decompressed one after the other, by the background thread only (chunked
+dumps, see sonet.chunked, have a table of their members instead).
+
+xz and zstd are supported if lzma (or backports.lzma) and zstandard are
+installed.
+"""
+
+import bz2
+import zlib
+import time
+import logging
+from Queue import Queue
+from threading import Thread, Event
+from collections import deque
+
+from sonet.bz2blocks import BLOCK_MAGIC, EOS_MAGIC, find_magics, get_bits, \
+     decompress_bits
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+## size of the compressed chunks read from the file
+READ_SIZE = 1024 * 1024
+## decompressed chunks waiting to be read
+READ_AHEAD = 64
+
+
+def _decompress_bz2_block(args):
+    data, start, end = args
+    return decompress_bits(get_bits(data, start, end), end - start,
+                           int(get_bits(data, start + 48, start + 80)))
+
+
+def iter_bz2(f, threads=None, read_size=READ_SIZE):
+    """
+    Yields the decompressed blocks of the bzip2 (single or multi stream) file
+    f. Blocks are found looking for their magic number (see
+    sonet.bz2blocks) and are decompressed by a pool of threads.
+
+    >>> from StringIO import StringIO
+    >>> data = ''.join('%d\\n' % i for i in xrange(300000))
+    >>> c = bz2.compress(data) + bz2.compress('the end')
+    >>> blocks = list(iter_bz2(StringIO(c), 2, 4096))
+    >>> len(blocks) > 2, ''.join(blocks) == data + 'the end'
+    (True, True)
+    """
+    from multiprocessing import cpu_count
+    from multiprocessing.pool import ThreadPool
+
+    threads = threads or cpu_count()
+    pool = ThreadPool(threads)
+    pending = deque()
+
+    data = ''
+    block = None  # bit offset in data of the block being read
+    scanned = 0  # bytes of data already scanned for magics
+    try:
+        while True:
+            chunk = f.read(read_size)
+            data += chunk
+            boundaries = sorted(
+                [(offset, True) for offset in
+                 find_magics(data, BLOCK_MAGIC, scanned)] +
+                [(offset, False) for offset in
+                 find_magics(data, EOS_MAGIC, scanned)])
+            ## magics starting in the last 6 bytes are found with the next
+            ## chunk
+            scanned = max(scanned, len(data) - 6)
+
+            for offset, is_block in boundaries:
+                if block is not None:
+                    first = block // 8
+                    pending.append(pool.apply_async(
+                        _decompress_bz2_block,
+                        ((data[first:(offset + 7) // 8], block % 8,
+                          offset - first * 8), )))
+                block = offset if is_block else None
+
+            while len(pending) > 2 * threads or \
+                  (pending and not chunk):
+                yield pending.popleft().get()
+            if not chunk:
+                return
+
+            ## drop what has been already sent to the pool
+            cut = scanned if block is None else block // 8
+            data = data[cut:]
+            scanned -= cut
+            if block is not None:
+                block -= cut * 8
+    finally:
+        pool.terminate()
+
+
+def iter_gzip(f, read_size=READ_SIZE):
+    """
+    Yields the decompressed data of the gzip (single or multi member) file f.
+    Members are decompressed one after the other: where a member starts is
+    known only at the end of the previous one.
+
+    >>> import gzip
+    >>> from StringIO import StringIO
+    >>> def gz(s):
+    ...     out = StringIO()
+    ...     g = gzip.GzipFile(fileobj=out, mode='wb'); g.write(s); g.close()
+    ...     return out.getvalue()
+    >>> ''.join(iter_gzip(StringIO(gz('abc') + gz('def')), 7))
+    'abcdef'
+    """
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while True:
+        chunk = f.read(read_size)
+        if not chunk:
+            break
+        while chunk:
+            yield d.decompress(chunk)
+            chunk = d.unused_data
+            if chunk:
+                ## a new member starts
+                yield d.flush()
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    yield d.flush()
+
+
+def iter_xz(f, read_size=READ_SIZE):
+    """
+    Yields the decompressed data of the xz (single or multi stream) file f
+    """
+    if lzma is None:
+        raise Exception('xz dumps require lzma (backports.lzma)')
+
+    d = lzma.LZMADecompressor()
+    while True:
+        chunk = f.read(read_size)
+        if not chunk:
+            break
+        while chunk:
+            yield d.decompress(chunk)
+            chunk = d.unused_data if d.eof else ''
+            if chunk:
+                d = lzma.LZMADecompressor()
+
+
+def iter_zstd(f, read_size=READ_SIZE):
+    """
+    Yields the decompressed data of the zstd file f
+    """
+    if zstandard is None:
+        raise Exception('zstd dumps require zstandard')
+
+    reader = zstandard.ZstdDecompressor().stream_reader(f)
+    while True:
+        chunk = reader.read(read_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _produce(chunks, queue, stop):
+    try:
+        for chunk in chunks:
+            if stop.is_set():
+                chunks.close()
+                return
+            if chunk:
+                queue.put(chunk)
+    except Exception, e:
+        logging.exception('Decompression failed')
+        queue.put(e)
+    queue.put(None)
+
+
+class ReadAheadFile(object):
+    """
+    Read-only file-like object reading the chunks yielded by chunks (a
+    generator), which is run in a background thread. At most read_ahead
+    chunks are kept in memory. fileobj (the compressed file) is closed by
+    close().
+
+    When the stream is over the throughput is logged (see throughput()).
+
+    >>> r = ReadAheadFile(c for c in ['a\\nb', 'c\\n', 'd'])
+    >>> r.readline(), r.read(2), list(r)
+    ('a\\n', 'bc', ['\\n', 'd'])
+    >>> r.bytes_read
+    6
+    """
+    bytes_read = 0
+
+    def __init__(self, chunks, read_ahead=READ_AHEAD, fileobj=None):
+        self._fileobj = fileobj
+        self._stop_event = Event()
+        self._queue = Queue(read_ahead)
+        self._chunk = ''
+        self._pos = 0
+        self._eof = False
+        self._start = time.time()
+        self._stop = None
+        self._thread = Thread(target=_produce,
+                              args=(chunks, self._queue, self._stop_event))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _next(self):
+        """
+        Moves to the next chunk. Returns False at the end of the stream.
+        """
+        if self._eof:
+            return False
+        chunk = self._queue.get()
+        if isinstance(chunk, Exception):
+            self._eof = True
+            raise IOError('Decompression failed: %s' % (chunk, ))
+        if chunk is None:
+            self._eof = True
+            self._stop = time.time()
+            logging.info('DECOMPRESSED: %d bytes - %.1f MB/s',
+                         self.bytes_read, self.throughput())
+            return False
+        self._chunk, self._pos = chunk, 0
+        return True
+
+    def read(self, size=-1):
+        chunks = []
+        while size:
+            if self._pos == len(self._chunk) and not self._next():
+                break
+            end = len(self._chunk) if size < 0 else \
+                  min(len(self._chunk), self._pos + size)
+            chunks.append(self._chunk[self._pos:end])
+            if size > 0:
+                size -= end - self._pos
+            self.bytes_read += end - self._pos
+            self._pos = end
+        return ''.join(chunks)
+
+    def readline(self):
+        chunks = []
+        while True:
+            if self._pos == len(self._chunk) and not self._next():
+                break
+            end = self._chunk.find('\n', self._pos) + 1 or len(self._chunk)
+            chunks.append(self._chunk[self._pos:end])
+            self.bytes_read += end - self._pos
+            self._pos = end
+            if self._chunk[end - 1] == '\n':
+                break
+        return ''.join(chunks)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def throughput(self):
+        """
+        Returns the decompressed MB/s until now (or until the end of the
+        stream)
+        """
+        elapsed = (self._stop or time.time()) - self._start
+        return self.bytes_read / 1048576. / max(elapsed, 1e-6)
+
+    def close(self):
+        ## stop the producer, making room in the queue if it's waiting
+        self._eof = True
+        self._stop_event.set()
+        while self._thread.is_alive():
+            while not self._queue.empty():
+                self._queue.get()
+            self._thread.join(0.01)
+        if self._fileobj is not None:
+            self._fileobj.close()
+
+
+_formats = {'bz2': iter_bz2, 'gz': iter_gzip, 'xz': iter_xz,
+            'zst': iter_zstd}
+
+
+def open_native(fn, threads=None):
+    """
+    Opens the compressed file fn (bz2, gz, xz or zst) decompressing it in
+    this process. threads is the number of threads decompressing bzip2
+    blocks.
+    """
+    ext = fn.split('.')[-1]
+    f = open(fn, 'rb')
+    if ext == 'bz2':
+        chunks = iter_bz2(f, threads)
+    else:
+        chunks = _formats[ext](f)
+    return ReadAheadFile(chunks, fileobj=f)
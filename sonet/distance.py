@@ -0,0 +1,233 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Average distance and efficiency of a graph, from the shortest paths of
+every source vertex: they're computed for a few sources at a time and
+reduced to three sums per source (distances, reachable vertices, inverse
+distances), so no distance matrix is kept.
+
+All the sources (exact mode, see all_pairs()) or a random sample of them
+(see estimate(), with a confidence interval) are used, in a process pool
+if asked for.
+"""
+
+import math
+import random
+from collections import namedtuple
+from time import time
+
+import numpy
+
+## sums of the shortest paths from a set of sources
+DistanceSums = namedtuple('DistanceSums', 'distances pairs inverse sources')
+
+## estimated value, bounds of its confidence interval, sources used
+Estimate = namedtuple('Estimate', 'value low high samples')
+
+STATISTICS = ('distance', 'efficiency')
+
+
+def source_sums(g, sources, weight=None):
+    """
+    Returns an array with a row for every source: the sum of its distances
+    to the vertices it reaches, their number and the sum of the inverse
+    distances (loops and unreachable vertices not counted)
+
+    >>> import igraph as ig
+    >>> g = ig.Graph([(0, 1), (1, 2)], directed=True)
+    >>> source_sums(g, [0, 2]).tolist()
+    [[3.0, 2.0, 1.5], [0.0, 0.0, 0.0]]
+    """
+    if weight:
+        rows = g.shortest_paths(sources, weights=weight)
+    else:
+        rows = g.shortest_paths(sources)
+    distances = numpy.array(rows, dtype=numpy.float64)
+    del rows
+    distances[numpy.arange(len(sources)), sources] = numpy.inf
+    reachable = numpy.isfinite(distances)
+    with numpy.errstate(divide='ignore'):
+        inverse = 1. / distances
+    inverse[~numpy.isfinite(inverse)] = 0.
+    return numpy.column_stack((
+        numpy.where(reachable, distances, 0.).sum(axis=1),
+        reachable.sum(axis=1), inverse.sum(axis=1)))
+
+
+## graph of the parent process, shared with its forked workers
+_shared = {}
+
+
+def _source_sums(sources):
+    return source_sums(_shared['g'], sources, _shared['weight'])
+
+
+def iter_sums(g, blocks, weight=None, processes=1):
+    """
+    Yields source_sums() for every block (a list of sources) of blocks: in
+    processes workers (forked, sharing g) if processes isn't 1, in the
+    order of the blocks.
+    """
+    if processes == 1:
+        for sources in blocks:
+            yield source_sums(g, sources, weight)
+        return
+
+    from multiprocessing import Pool
+
+    _shared.update(g=g, weight=weight)
+    pool = Pool(processes)
+    try:
+        for sums in pool.imap(_source_sums, blocks):
+            yield sums
+        pool.close()
+    finally:
+        pool.terminate()
+        _shared.clear()
+
+
+def _blocks(sources, size):
+    for i in xrange(0, len(sources), size):
+        yield sources[i:i + size]
+
+
+def all_pairs(g, weight=None, processes=1, block=16):
+    """
+    Returns the DistanceSums of the shortest paths among all the vertices of
+    g, computed block sources at a time
+
+    >>> import igraph as ig
+    >>> all_pairs(ig.Graph([(0, 1), (1, 2), (2, 0)], directed=True))
+    DistanceSums(distances=9.0, pairs=6, inverse=4.5, sources=3)
+    """
+    totals = numpy.zeros(3)
+    n = len(g.vs)
+    for sums in iter_sums(g, _blocks(range(n), block), weight, processes):
+        totals += sums.sum(axis=0)
+    return DistanceSums(float(totals[0]), int(totals[1]), float(totals[2]),
+                        n)
+
+
+def average_distance(g, weight=None, processes=1, block=16):
+    """
+    Average length of the shortest paths between two vertices (connected
+    by a path)
+    """
+    sums = all_pairs(g, weight, processes, block)
+    return sums.distances / sums.pairs if sums.pairs else 0.
+
+
+def efficiency(g, weight=None, processes=1, block=16):
+    """
+    Average of the inverse of the distances between two vertices (0 if not
+    connected)
+    """
+    n = len(g.vs)
+    if n < 2:
+        return 0.
+    return all_pairs(g, weight, processes, block).inverse / (n * (n - 1.))
+
+
+def normal_quantile(confidence):
+    """
+    z such that a standard normal variable is in [-z, z] with probability
+    confidence
+
+    >>> round(normal_quantile(.95), 4)
+    1.96
+    """
+    low, high = 0., 10.
+    while high - low > 1e-9:
+        z = (low + high) / 2
+        if math.erf(z / math.sqrt(2)) < confidence:
+            low = z
+        else:
+            high = z
+    return (low + high) / 2
+
+
+def ratio_estimate(numerators, denominators, population, z):
+    """
+    Estimate of sum(numerators) / sum(denominators) over population sources
+    from a sample of them (without replacement): ratio estimator with its
+    linearized variance and the finite population correction
+    """
+    k = len(numerators)
+    if not denominators.sum():
+        return Estimate(0., 0., 0., k)
+    value = numerators.sum() / denominators.sum()
+    if k < 2:
+        return Estimate(float(value), -numpy.inf, numpy.inf, k)
+    residuals = numerators - value * denominators
+    variance = (residuals.var(ddof=1) / k / denominators.mean() ** 2 *
+                (1. - float(k) / population))
+    half = z * math.sqrt(max(variance, 0.))
+    return Estimate(float(value), float(value - half), float(value + half), k)
+
+
+def estimate(g, statistic='distance', weight=None, samples=None,
+             accuracy=None, time_budget=None, confidence=.95, processes=1,
+             block=16, seed=None):
+    """
+    Estimates the average distance (statistic='distance') or the efficiency
+    (statistic='efficiency') of g from the shortest paths of random sources
+    (BFS, or Dijkstra if weight is given). Sources are added block at a time
+    (per process) until one of these is reached:
+
+     - samples sources;
+     - accuracy: the half width of the confidence interval is less than
+       accuracy times the estimate;
+     - time_budget seconds;
+     - all the vertices (the result is exact).
+
+    Returns an Estimate with the confidence interval of the given level.
+    """
+    if statistic not in STATISTICS:
+        raise ValueError('Unknown statistic: %s' % (statistic, ))
+    n = len(g.vs)
+    if n < 2:
+        return Estimate(0., 0., 0., n)
+
+    sources = range(n)
+    random.Random(seed).shuffle(sources)
+    if samples is not None:
+        sources = sources[:samples]
+    if processes is None:
+        from multiprocessing import cpu_count
+        processes = cpu_count()
+    ## enough sources to keep every process busy between two checks
+    step = block * processes
+    z = normal_quantile(confidence)
+    start = time()
+
+    done = []
+    result = None
+    for sums in iter_sums(g, _blocks(sources, block), weight, processes):
+        done.append(sums)
+        k = sum(len(s) for s in done)
+        if k % step and k < len(sources):
+            continue
+        sums = numpy.concatenate(done)
+        done = [sums]
+        if statistic == 'distance':
+            result = ratio_estimate(sums[:, 0], sums[:, 1], n, z)
+        else:
+            result = ratio_estimate(sums[:, 2] / (n - 1.),
+                                    numpy.ones(len(sums)), n, z)
+        if accuracy is not None and (result.high - result.low <=
+                                     2 * accuracy * abs(result.value)):
+            break
+        if time_budget is not None and time() - start >= time_budget:
+            break
+    return result
@@ -1,5 +1,15 @@
-import igraph as ig
+import os
+import heapq
 import logging
+import tempfile
+import cPickle as pickle
+from array import array
+from calendar import timegm
+
+import igraph as ig
+import numpy
+
+from sonet.timeline import from_arrays
 
 
 class EdgeCache:
@@ -97,29 +107,354 @@ class EdgeCache:
 
         del self.temp_edges
 
-    def get_network(self, vertex_label='username', edge_label='weight'):
+    def set_nodes(self, names):
         """
-        Get the resulting network and clean cached data
+        Reuses a username index (e.g. the vertices of a graph): the id of
+        names[i] is i. To be called before adding edges.
         """
-        ##TODO: replace with igraph.Graph.DictList()
-        ## see https://mulcyber.toulouse.inra.fr/scm/viewvc.php/pyrocleaner/\
-        ##       duplicat_analyze.py?root=pyrocleaner&view=markup
-        from operator import itemgetter
+        self.nodes = dict((name, i) for i, name in enumerate(names))
+
+    def partial(self):
+        """
+        Cached edges, to be merged in another EdgeCache with reduce()
+        """
+        return self.temp_edges
+
+    def reduce(self, partial):
+        for receiver, talks in partial.iteritems():
+            self.add(receiver, talks)
 
-        g = ig.Graph(n=len(self.nodes), directed=True)
-        g.es[edge_label] = []
+    def get_network(self, vertex_label='username', edge_label='weight',
+                    weight_label=None):
+        """
+        Get the resulting network and clean cached data. The attributes of the
+        edges are assigned at once, in the order of the edges. With
+        weight_label, edges get also the number of messages as weight (the
+        attribute itself if it's an int).
 
-        g.vs[vertex_label] = [n.encode('utf-8') for n, _ in sorted(
-            self.nodes.items(), key=itemgetter(1))]
+        >>> ec = EdgeCache()
+        >>> ec.add(u'me', {u'him': [1, 2], u'her': [3]})
+        >>> ec.flush()
+        >>> g = ec.get_network(edge_label='timestamp', weight_label='weight')
+        >>> sorted(zip(g.es['timestamp'], g.es['weight']))
+        [([1, 2], 2), ([3], 1)]
+        """
+        from operator import itemgetter
+
+        names = [None] * len(self.nodes)
+        for name, id_ in self.nodes.iteritems():
+            names[id_] = name.encode('utf-8')
         self.nodes = []
 
-        clean_edges = map(itemgetter(0, 1), self.edges)
-        g.add_edges(clean_edges)
-        del clean_edges
+        g = ig.Graph(n=len(names), directed=True)
+        g.vs[vertex_label] = names
+        del names
 
-        for e_from, e_to, attr in self.edges:
-            eid = g.get_eid(e_from, e_to, directed=True)
-            g.es[eid][edge_label] = attr
+        ## flush() creates one edge per (sender, recipient): the id of an
+        ## edge is its position in self.edges
+        g.add_edges(map(itemgetter(0, 1), self.edges))
+        attrs = map(itemgetter(2), self.edges)
         self.edges = []
 
+        g.es[edge_label] = attrs
+        if weight_label:
+            g.es[weight_label] = [attr if isinstance(attr, int) else len(attr)
+                                  for attr in attrs]
+
+        return g
+
+
+def _read_run(fn, run):
+    """
+    Yields the (recipient, sender, run, msgs) written by
+    SpillingEdgeCache.spill() in the file fn
+    """
+    with open(fn, 'rb') as f:
+        while True:
+            try:
+                recipient, sender, msgs = pickle.load(f)
+            except EOFError:
+                break
+            yield recipient, sender, run, msgs
+
+
+class SpillingEdgeCache(EdgeCache):
+    """
+    EdgeCache keeping at most (about) max_size messages in memory (every
+    int counts as one): when there are more, they are written to a
+    temporary file in tmpdir, sorted by (recipient, sender). flush() merges
+    these sorted runs.
+
+    >>> ec = SpillingEdgeCache(max_size=3)
+    >>> ec.add('me', {'him': 1, 'her': 3})
+    >>> ec.add('you', {'him': 3})
+    >>> ec.add('me', {'him': 2})
+    >>> len(ec.runs)
+    1
+    >>> ec.flush()
+    >>> ec.nodes
+    {'me': 0, 'you': 3, 'him': 2, 'her': 1}
+    >>> sorted(ec.edges)
+    [(1, 0, 3), (2, 0, 3), (2, 3, 3)]
+    >>> ec.runs
+    []
+    """
+    def __init__(self, max_size=10000000, tmpdir=None):
+        EdgeCache.__init__(self)
+        self.max_size = max_size
+        self.tmpdir = tmpdir
+        self.runs = []  # files written by spill()
+        self._size = 0
+
+    def add(self, user, talks):
+        """
+        user: string
+        talks: dict
+        """
+        EdgeCache.add(self, user, talks)
+        for msgs in talks.itervalues():
+            self._size += 1 if isinstance(msgs, int) else len(msgs)
+        if self._size >= self.max_size:
+            self.spill()
+
+    def spill(self):
+        """
+        Writes the cached edges to a new run and empties the cache
+        """
+        fd, fn = tempfile.mkstemp(prefix='edgecache-', suffix='.run',
+                                  dir=self.tmpdir)
+        with os.fdopen(fd, 'wb') as out:
+            for recipient in sorted(self.temp_edges):
+                talk = self.temp_edges.pop(recipient)
+                for sender in sorted(talk):
+                    pickle.dump((recipient, sender, talk[sender]), out,
+                                pickle.HIGHEST_PROTOCOL)
+        self.runs.append(fn)
+        self.temp_edges = {}
+        self._size = 0
+        logging.info('SPILLED RUN %d: %s', len(self.runs), fn)
+
+    def partial(self):
+        """
+        Cached edges and runs, to be merged in another SpillingEdgeCache with
+        reduce(): the runs are not copied
+        """
+        return (self.temp_edges, self.runs)
+
+    def reduce(self, partial):
+        temp_edges, runs = partial
+        self.runs.extend(runs)
+        EdgeCache.reduce(self, temp_edges)
+
+    def flush(self):
+        """
+        Merges the runs (and what is still cached) in nodes and edges.
+        Messages of the same edge keep the order in which they've been added.
+        """
+        if not self.runs:
+            EdgeCache.flush(self)
+            return
+        if self.temp_edges:
+            self.spill()
+
+        last = None
+        for recipient, sender, _, msgs in heapq.merge(
+            *[_read_run(fn, i) for i, fn in enumerate(self.runs)]):
+            if (recipient, sender) == last:
+                send_id, rec_id, cached = self.edges[-1]
+                if isinstance(msgs, int):
+                    self.edges[-1] = (send_id, rec_id, cached + msgs)
+                else:
+                    cached.extend(msgs)
+                continue
+            last = (recipient, sender)
+            rec_id = self.nodes.setdefault(recipient, len(self.nodes))
+            send_id = self.nodes.setdefault(sender, len(self.nodes))
+            self.edges.append((send_id, rec_id, msgs))
+        logging.info('MERGED RUNS: %d - EDGES: %d', len(self.runs),
+                     len(self.edges))
+
+        for fn in self.runs:
+            os.remove(fn)
+        self.runs = []
+        del self.temp_edges
+
+
+class ArrayEdgeCache(object):
+    """
+    Like EdgeCache, for edges made of messages (lists of mwlib.Message), but
+    with a much smaller memory footprint: usernames are interned to integer
+    ids as they arrive and every message is appended as (sender id,
+    receiver id, seconds since the epoch, welcome flag) to typed arrays.
+    Messages are grouped in edges, in bulk, by sorting them in flush().
+
+    >>> from datetime import datetime
+    >>> from sonet.mediawiki import Message
+    >>> ec = ArrayEdgeCache()
+    >>> ec.add(u'me', {u'him': [Message(datetime(2010, 1, 1), True)]})
+    >>> ec.add(u'you', {u'him': [Message(datetime(2010, 1, 2), False)]})
+    >>> ec.add_message(u'me', u'him', 1262390400, False)
+    >>> ec.nodes
+    {u'me': 0, u'you': 2, u'him': 1}
+    >>> ec.flush()
+    >>> ec.edges
+    [(1, 0, 2), (1, 2, 1)]
+    >>> g = ec.get_network(edge_label='timestamp')
+    >>> g.vs['username']
+    ['me', 'him', 'you']
+    >>> [(e.source, e.target, [m.time.day for m in e['timestamp']])
+    ...  for e in g.es]
+    [(1, 0, [1, 2]), (1, 2, [2])]
+    >>> g.es[0]['timestamp']
+    Timeline([1262304000, 1262390400], welcomes=1)
+    """
+    nodes = None  # a dict of {'username': vertex_id}
+
+    def __init__(self):
+        self.nodes = {}
+        self.names = []
+        self.senders = array('i')
+        self.receivers = array('i')
+        self.times = array('l')
+        self.welcomes = array('b')
+        self._sorted = None
+        self._edges = None
+
+    def intern(self, name):
+        """
+        Returns the id of the username name, assigning a new one if needed
+        """
+        try:
+            return self.nodes[name]
+        except KeyError:
+            id_ = self.nodes[name] = len(self.names)
+            self.names.append(name)
+            return id_
+
+    def set_nodes(self, names):
+        """
+        Reuses a username index (e.g. the vertices of a graph): the id of
+        names[i] is i. To be called before adding messages.
+        """
+        self.names = list(names)
+        self.nodes = dict((name, i) for i, name in enumerate(self.names))
+
+    def add_message(self, receiver, sender, time, welcome):
+        """
+        receiver, sender: usernames
+        time: seconds since the epoch (UTC)
+        """
+        self.receivers.append(self.intern(receiver))
+        self.senders.append(self.intern(sender))
+        self.times.append(time)
+        self.welcomes.append(welcome)
+
+    def add(self, user, talks):
+        """
+        user: string
+        talks: dict of {sender: [mwlib.Message, ...]}
+        """
+        for speaker, msgs in talks.iteritems():
+            for msg in msgs:
+                self.add_message(user, speaker,
+                                 timegm(msg.time.timetuple()), msg.welcome)
+
+    def __len__(self):
+        return len(self.times)
+
+    def partial(self):
+        """
+        Cached messages, to be merged in another ArrayEdgeCache with reduce()
+        """
+        return (self.names, self.senders, self.receivers, self.times,
+                self.welcomes)
+
+    def reduce(self, partial):
+        names, senders, receivers, times, welcomes = partial
+        ## ids of partial -> ids of this cache
+        ids = numpy.array([self.intern(name) for name in names] or [0],
+                          dtype=numpy.int32)
+        self.senders.extend(array('i', ids[numpy.frombuffer(
+            senders, dtype=numpy.int32)].tostring()))
+        self.receivers.extend(array('i', ids[numpy.frombuffer(
+            receivers, dtype=numpy.int32)].tostring()))
+        self.times.extend(times)
+        self.welcomes.extend(welcomes)
+
+    def flush(self):
+        """
+        Groups the messages in edges, sorting the messages of every edge by
+        time (stable: equal times keep the order in which they've been added)
+        """
+        order = numpy.lexsort((
+            numpy.frombuffer(self.times, dtype=numpy.dtype('l')),
+            numpy.frombuffer(self.senders, dtype=numpy.int32),
+            numpy.frombuffer(self.receivers, dtype=numpy.int32)))
+
+        ## sort one column at a time, releasing the unsorted one
+        senders = numpy.frombuffer(self.senders, dtype=numpy.int32)[order]
+        self.senders = array('i')
+        receivers = numpy.frombuffer(self.receivers, dtype=numpy.int32)[order]
+        self.receivers = array('i')
+        times = numpy.frombuffer(self.times, dtype=numpy.dtype('l'))[order]
+        self.times = array('l')
+        welcomes = numpy.frombuffer(self.welcomes, dtype=numpy.int8)[order]
+        self.welcomes = array('b')
+        del order
+
+        starts = numpy.flatnonzero((senders[1:] != senders[:-1]) |
+                                   (receivers[1:] != receivers[:-1])) + 1
+        starts = numpy.concatenate(([0], starts)) if len(senders) else starts
+        self._sorted = (times, welcomes, starts)
+        self._edges = (senders[starts], receivers[starts])
+        logging.info('FLUSHED EDGES: %d - MESSAGES: %d', len(starts),
+                     len(times))
+
+    @property
+    def edges(self):
+        """
+        Like EdgeCache.edges, with the number of messages of every edge:
+        [(sender_id, recipient_id, messages), ...]
+        """
+        if self._edges is None:
+            return []
+        times, _, starts = self._sorted
+        return zip(self._edges[0].tolist(), self._edges[1].tolist(),
+                   numpy.diff(numpy.append(starts, len(times))).tolist())
+
+    def iter_messages(self):
+        """
+        Yields the times (seconds since the epoch) and the welcome flags
+        (NumPy arrays) of the messages of every edge, in the order of edges
+        """
+        times, welcomes, starts = self._sorted
+        ends = numpy.append(starts[1:], len(times))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yield times[start:end], welcomes[start:end]
+
+    def get_network(self, vertex_label='username', edge_label='weight',
+                    weight_label=None):
+        """
+        Get the resulting network and clean cached data. The edge_label
+        attribute of edges is their sonet.timeline.Timeline, the weight_label
+        one (if given) the number of messages.
+        """
+        if self._sorted is None:
+            self.flush()
+
+        g = ig.Graph(n=len(self.names), directed=True)
+        g.vs[vertex_label] = [n.encode('utf-8') for n in self.names]
+        self.nodes, self.names = {}, []
+
+        g.add_edges(zip(*[column.tolist() for column in self._edges]))
+        times, welcomes, starts = self._sorted
+        ends = numpy.append(starts[1:], len(times))
+        if weight_label:
+            g.es[weight_label] = (ends - starts).tolist()
+
+        g.es[edge_label] = from_arrays(times, welcomes,
+                                       numpy.append(starts, len(times)))
+        del times, welcomes, starts, ends
+        self._edges, self._sorted = None, None
+
         return g
@@ -1,13 +1,25 @@
+from itertools import izip
+
 import igraph as ig
 import numpy
 
+from sonet.timeline import Timeline, TimeIndex, to_epoch, pack_timelines
+from sonet.roles import Roles
+from sonet import distance, matrix, stats
+
 
-def load(fn):
+def load(fn, vertex_attributes=None, edge_attributes=None):
     """
-    Load a graph from file with name fn.
+    Load a graph from file with name fn (or from the directory fn, see
+    sonet.graphstore: in this case only vertex_attributes and edge_attributes
+    are read, if they're not None).
 
     Returns a sonet.graph.Graph
     """
+    from sonet.graphstore import is_graph_dir, read_graph
+
+    if is_graph_dir(fn):
+        return Graph(read_graph(fn, vertex_attributes, edge_attributes))
     return Graph(ig.load(fn))
 
 
@@ -17,90 +29,114 @@ class Graph(object):
     def __init__(self, g):
         self.g = g
         self.classes = {}
+        self._class_codes = None
+        self._roles = None
+        self._time_index = {}
 
     def invert_edge_attr(self, source, dest):
         self.g.es[dest] = 1. / numpy.array(self.g.es[source])
 
-    def efficiency(self, weight=None):
+    def efficiency(self, weight=None, processes=1):
         r"""Returns the efficiency of the graph
 
         @param weight: (string) specify which attribute to use.
                        Do not specify if the graph is not weighted
+        @param processes: number of processes computing the shortest paths
         """
-        isinstance(self.g, ig.Graph)  # helper for wing
-        effSum = 0.
-        step = 100
-        n = len(self.g.vs)
-        for i in xrange(0, n, step):
-            #if not i % 100:
-            #    print 'Step:', i
-            #    print 1.*dSum*step/i
-            uplimit = min(n, i + step)
-
-            # distances from nodes in range (i, i+step) to all the other nodes
-            if weight:
-                aDistances = self.g.shortest_paths(range(i, uplimit),
-                                                   weights=weight)
-            else:
-                aDistances = self.g.shortest_paths(range(i, uplimit))
-
-            aDistances = numpy.array(aDistances)
-
-            effSum += (1. / aDistances[aDistances.nonzero()]).sum()
-
         #TODO: maybe there should be a factor of 2 somewhere (directed graph)
-        efficiency = effSum / (1. * n * (n - 1))
-        return efficiency
+        return distance.efficiency(self.g, weight, processes)
 
     def set_weighted_degree(self, type=ig.IN, remove_loops=True):
-        #TODO: improve self-loops check
         stype = type == ig.IN and "in" or "out"
         k = 'weighted_%sdegree' % stype
 
-        for node in self.g.vs:
-            if remove_loops:
-                edges = (e for e in self.g.adjacent(node.index, type=type)
-                         if not self.g.is_loop(e))
-            else:
-                edges = self.g.adjacent(node.index, type=type)
-
-            node[k] = sum(self.g.es[eid]['weight'] for eid in edges)
+        indegree, outdegree = stats.strength(self.g, 'weight',
+                                             loops=not remove_loops)
+        self.g.vs[k] = (indegree if type == ig.IN else outdegree).tolist()
 
-    def averageDistance(self, weight=None):
-        r"""Returns the average shortest path length of the graph
+    def averageDistance(self, weight=None, processes=1):
+        r"""Returns the average shortest path length of the graph (among
+        the pairs of nodes connected by a path)
 
         @param weight: (string) specify which attribute to use.
         Do not specify if the graph is not weighted
+        @param processes: number of processes computing the shortest paths
         """
-        isinstance(self.g, ig.Graph)  # helper for wing
-        dSum = 0.
-        step = 1000
-        n = len(self.g.vs)
-        for i in range(0, n, step):
-            ##if not (i+1) % 100:
-            ##    print 'Step:', i
-            ##    print 1.*dSum*step/i
-            uplimit = min(n, i + step)
-
-            # distances from nodes in range (i, i+step) to all the other nodes
-            if weight:
-                aDistances = self.g.shortest_paths(range(i, uplimit),
-                                                   weights=weight)
-            else:
-                aDistances = self.g.shortest_paths(range(i, uplimit))
-
-            aDistances = numpy.array(aDistances)
-
-            dSum += 1. * aDistances.sum() / (n - 1) / (uplimit - i)
-
-        avg_dist = 1. * dSum / len(range(0, n, step))
-        return avg_dist
+        return distance.average_distance(self.g, weight, processes)
+
+    def roles(self):
+        """
+        Returns the sonet.roles.Roles of the vertices (created once: it's
+        created again if vertices are removed by remove_if() or
+        time_slice_subgraph())
+        """
+        if self._roles is None:
+            self._roles = Roles(self.g)
+        return self._roles
+
+    def select(self, attr):
+        """
+        Returns the vertices that meet attr, keyword arguments of
+        VertexSeq.select(): conditions on boolean attributes (roles) are
+        evaluated on sonet.roles.Roles, the other ones by igraph
+
+        >>> g = Graph(ig.Graph(n=3))
+        >>> g.g.vs['bot'] = [True, False, False]
+        >>> g.select({'bot_ne': True}).indices
+        [1, 2]
+        >>> g.select({'bot_ne': True, '_degree': 0}).indices
+        [1, 2]
+        """
+        try:
+            indices = self.roles().select(attr)
+        except ValueError:
+            return self.g.vs.select(**attr)
+        return self.g.vs.select(indices)
 
     def defineClass(self, cls, attr):
         # maybe it's better to store attr only (and not the whole VertexSet)
-        self.classes[cls] = self.g.vs.select(**attr)
+        self.classes[cls] = self.select(attr)
+        self._class_codes = None
 
-    def writeAdjacencyMatrix(self, fn, label, weight='weight'):
+    def class_codes(self):
+        """
+        Returns codes, groups: the code of every vertex (the same for the
+        vertices in the same classes) and a dict class -> codes of its
+        vertices, for sonet.stats.group_stats()
+        """
+        if self._class_codes is None:
+            names = sorted(self.classes)
+            masks = numpy.zeros(len(self.g.vs), dtype=numpy.int64)
+            for bit, cls in enumerate(names):
+                masks[self.classes[cls].indices] |= 1 << bit
+            unique, codes = numpy.unique(masks, return_inverse=True)
+            groups = dict((cls, numpy.flatnonzero(unique >> bit & 1))
+                          for bit, cls in enumerate(names))
+            self._class_codes = (codes, groups)
+        return self._class_codes
+
+    def group_stats(self, values, k=5):
+        """
+        Returns a dict class -> sonet.stats.GroupStats (count, mean,
+        standard deviation and the k largest values) of values, a vertex
+        attribute name or a sequence with a value for every vertex, for every
+        class defined with defineClass()
+
+        >>> g = Graph(ig.Graph(n=4))
+        >>> g.g.vs['bot'] = [True, False, False, True]
+        >>> g.g.vs['edits'] = [10, 1, 2, 30]
+        >>> g.defineClass('all', {})
+        >>> g.defineClass('bot', {'bot': True})
+        >>> stats = g.group_stats('edits', k=1)
+        >>> stats['all'].mean, stats['bot'].mean, stats['bot'].top.tolist()
+        (10.75, 20.0, [30])
+        """
+        if isinstance(values, basestring):
+            values = self.g.vs[values]
+        codes, groups = self.class_codes()
+        return stats.group_stats(values, codes, groups, k)
+
+    def writeAdjacencyMatrix(self, fn, label, weight='weight', fmt='csv'):
         """
         writes the matrix like:
 
@@ -111,37 +147,14 @@ class Graph(object):
 
         fn: name of the file to write
         label: a node attribute to use as node label
+        fmt: 'csv' for the matrix above, 'coo', 'mtx' or 'npz' for a sparse
+             matrix (see sonet.matrix)
 
         """
-        isinstance(self.g, ig.Graph)
-        isinstance(self.g.es, ig.EdgeSeq)
-
-        matrix = self.g.get_adjacency(ig.GET_ADJACENCY_BOTH, weight, 0)
-        vs = self.g.vs
-        with open(fn, 'w') as f:
-            usernames = vs[label]
-
-            accumulate = ["", ]
-            print >> f, ','.join(['', ] + usernames + ['TOTAL', ])
-
-            for i in range(len(vs)):
-                accumulate = [usernames[i], ]
+        rows, cols, values = matrix.adjacency(self.g, weight)
+        matrix.write_matrix(fn, self.g.vs[label], rows, cols, values, fmt)
 
-                msgs = matrix[i]
-                accumulate += [str(e) for e in msgs]
-                accumulate.append(str(sum(msgs)))
-                print >> f, ','.join(accumulate)
-
-            # write TOTAL line
-            accumulate = ['TOTAL', ]
-
-            msgs = [sum([matrix[(j, i)] for j in range(len(vs))]) for i in
-                    range(len(vs))]
-            accumulate += [str(e) for e in msgs]
-            accumulate.append(str(sum(msgs)))
-            print >> f, ','.join(accumulate)
-
-    def writeReciprocityMatrix(self, label, fn=None):
+    def writeReciprocityMatrix(self, label, fn=None, fmt='csv'):
         """
         writes the matrix like:
 
@@ -153,9 +166,9 @@ class Graph(object):
         It's obviousbly a simmetric matrix. On the main diagonal are
         there self-edges.
 
-        >>> g = ig.Graph(n=3, directed=True)
+        >>> g = ig.Graph([(1, 0), (0, 1), (0, 2)], directed=True)
         >>> g.vs['name'] = ['me', 'you', 'she']
-        >>> g = Graph(g.add_edges(((1,0),(0,1),(0,2))))
+        >>> g = Graph(g)
         >>> g.writeReciprocityMatrix('name')
         ,me,you,she,TOTAL
         me,0,1,0,1
@@ -166,50 +179,12 @@ class Graph(object):
 
         fn: name of the file to write
         label: a node attribute to use as node label
+        fmt: 'csv' for the matrix above, 'coo', 'mtx' or 'npz' for a sparse
+             matrix (see sonet.matrix)
 
         """
-        isinstance(self.g, ig.Graph)
-        isinstance(self.g.es, ig.EdgeSeq)
-        isinstance(self.g.vs, ig.VertexSeq)
-
-        matrix = self.g.get_adjacency(ig.GET_ADJACENCY_BOTH, default=0)
-        vs = self.g.vs
-        N = len(vs)
-
-        # len(vs) x len(vs) matrix
-        rmatrix_data = [N * [0] for i in xrange(N)]
-        for i in xrange(N):
-            for j in xrange(i + 1):
-                if matrix[(i, j)] and matrix[(j, i)]:
-                    rmatrix_data[i][j] = rmatrix_data[j][i] = 1
-
-        if fn is None:
-            import sys
-            f = sys.stdout
-        else:
-            f = open(fn, 'w')
-
-        labels = vs[label]
-
-        print >> f, ','.join(['', ] + labels + ['TOTAL', ])
-
-        rmatrix = ig.datatypes.Matrix(rmatrix_data)
-        for i, label in enumerate(labels):
-            accumulate = [label, ]
-
-            msgs = rmatrix[i]
-            accumulate += [str(e) for e in msgs]
-            accumulate.append(str(sum(msgs)))
-            print >> f, ','.join(accumulate)
-
-        # write TOTAL line
-        accumulate = ['TOTAL', ]
-
-        msgs = [sum(rmatrix[(j, i)] for j in range(len(vs))) for i in
-                range(len(vs))]
-        accumulate += [str(e) for e in msgs]
-        accumulate.append(str(sum(msgs)))
-        print >> f, ','.join(accumulate)
+        rows, cols, values = matrix.reciprocity(self.g)
+        matrix.write_matrix(fn, self.g.vs[label], rows, cols, values, fmt)
 
     def getTopIndegree(self, lb=15, label='username'):
         self.getTopDegree(type=ig.IN, lb=lb, label=label)
@@ -225,24 +200,43 @@ class Graph(object):
             #TODO: add role
 
     def get_user_class(self, label, classes=None):
+        """
+        Yields (label, class) for every vertex: class is the first of classes
+        the vertex belongs to ('normal user' if none)
+        """
         if not classes:
             classes = self.classes.keys()
 
-        vs = self.g.vs
-        for n in vs:
-            found = False
-            attrs = n.attributes()
-            for cls in classes:
-                if attrs[cls]:
-                    found = True
-                    yield (n[label], cls)
-                    break
-            if not found:
-                yield (n[label], 'normal user')
+        return izip(self.g.vs[label], self.roles().first(classes))
 
     def remove_if(self, attrs):
         kwargs = dict([(attr + '_ne', True) for attr in attrs])
-        self.g = self.g.subgraph(self.g.vs.select(**kwargs))
+        self.g = self.g.subgraph(self.select(kwargs))
+        self._class_codes = None
+        self._roles = None
+        self._time_index = {}
+
+    def time_index(self, time_label='timestamp'):
+        """
+        Returns the sonet.timeline.TimeIndex of the time_label attribute of
+        the edges (created once: it's created again after remove_if() or
+        time_slice_subgraph(), don't change the graph otherwise)
+        """
+        try:
+            return self._time_index[time_label]
+        except KeyError:
+            pack_timelines(self.g, time_label)
+            index = self._time_index[time_label] = TimeIndex.from_graph(
+                self.g, time_label)
+            return index
+
+    def time_slice(self, start=None, end=None, time_label='timestamp'):
+        """
+        Like time_slice_subgraph(), but the graph is not changed: returns a
+        sonet.timeline.TimeSlice, a view of the messages between start and
+        end (see TimeSlice.subgraph() to create the subgraph)
+        """
+        return self.time_index(time_label).slice(start, end)
 
     def time_slice_subgraph(self, start=None, end=None,
                             time_label='timestamp', weight_label='weight',
@@ -252,29 +246,32 @@ class Graph(object):
         isinstance(g, ig.Graph)
         if start is None and end is None:
             return
-        for e in g.es:
-            e[time_label] = [m for m in e[time_label]
-                              if ((start is None or start < m.time)
-                              and (end is None or end > m.time))]
-            e[weight_label] = len(e[time_label])
+        timelines = g.es[time_label]
+        if len(timelines) and isinstance(timelines[0], Timeline):
+            start = None if start is None else to_epoch(start)
+            end = None if end is None else to_epoch(end)
+            timelines = [tl.between(start, end) for tl in timelines]
+        else:
+            ## lists of mwlib.Message (graphs saved by older versions)
+            timelines = [[m for m in msgs
+                          if ((start is None or start < m.time)
+                          and (end is None or end > m.time))]
+                         for msgs in timelines]
+        g.es[time_label] = timelines
+        g.es[weight_label] = [len(tl) for tl in timelines]
+        del timelines
+        self._time_index = {}
         if remove_empty_edges:
             kwargs = {weight_label: 0}
             g.delete_edges(**kwargs)
         if remove_isolated_nodes:
             # non_isolated vertices = g.vs.select(_degree_gt=0)
             g.delete_vertices(g.vs.select(_degree_eq=0))
+            self._class_codes = None
+            self._roles = None
 
     def set_role(self, classes):
         if not classes:
             classes = self.classes.keys()
 
-        for n in self.g.vs:
-            found = False
-            attrs = n.attributes()
-            for cls in classes:
-                if attrs[cls] == True:
-                    found = True
-                    n['role'] = cls
-                    break
-            if not found:
-                n['role'] = 'normal user'
+        self.g.vs['role'] = self.roles().first(classes).tolist()
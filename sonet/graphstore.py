@@ -0,0 +1,250 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Binary graph format: a directory (see graph_dirname()) with
+
+ - graph.json: number of vertices, direction and attribute columns;
+ - indptr.npy, indices.npy: adjacency in CSR format (the targets of the
+   edges of vertex i are indices[indptr[i]:indptr[i + 1]]), edges are saved
+   sorted by source;
+ - one or more NumPy files for every vertex and edge attribute: numbers and
+   booleans in an array, strings concatenated with their offsets, timelines
+   (see sonet.timeline) as the times of all the messages, their welcome flags
+   (packed bits) and the offsets of every edge. Attributes of other types
+   are pickled.
+
+NumPy files are memory-mapped when read: reading a graph costs the creation
+of the igraph object and of the attributes that are asked for.
+"""
+
+import os
+import json
+import cPickle as pickle
+
+import igraph as ig
+import numpy
+
+from sonet.timeline import Timeline, TimeIndex, from_arrays, to_arrays
+
+VERSION = 1
+
+
+def graph_dirname(fn):
+    """
+    Binary graph directory for a pickled graph (or a dump)
+
+    >>> graph_dirname('/tmp/itwiki-20100218-stub-meta-history.pickle')
+    '/tmp/itwiki-20100218-stub-meta-history.graph'
+    """
+    return os.path.splitext(fn)[0] + '.graph'
+
+
+def is_graph_dir(fn):
+    return os.path.isfile(os.path.join(fn, 'graph.json'))
+
+
+def get_kind(values):
+    """
+    Column type of the attribute values
+
+    >>> get_kind([1, 2]), get_kind([1, 2.]), get_kind([True]), get_kind(['a'])
+    ('int', 'float', 'bool', 'str')
+    >>> get_kind([u'a']), get_kind([1, None]), get_kind([])
+    ('unicode', 'pickle', 'pickle')
+    """
+    if not values:
+        return 'pickle'
+    types = set(type(value) for value in values)
+    if types == set([bool]):
+        return 'bool'
+    if types <= set([int, long]):
+        return 'int'
+    if types <= set([int, long, float]):
+        return 'float'
+    if types == set([str]):
+        return 'str'
+    if types == set([unicode]):
+        return 'unicode'
+    if types == set([Timeline]):
+        return 'timeline'
+    return 'pickle'
+
+
+def _save(path, name, array):
+    numpy.save(os.path.join(path, name + '.npy'), array)
+
+
+def _load(path, name, mmap_mode):
+    return numpy.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+
+
+def _offsets(lengths):
+    offsets = numpy.zeros(len(lengths) + 1, dtype=numpy.int64)
+    numpy.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def write_column(path, name, values):
+    """
+    Writes the attribute values in the files name*.npy (or name.pickle) in
+    path. Returns the kind of the column.
+    """
+    kind = get_kind(values)
+    if kind == 'int':
+        _save(path, name, numpy.array(values, dtype=numpy.int64))
+    elif kind == 'float':
+        _save(path, name, numpy.array(values, dtype=numpy.float64))
+    elif kind == 'bool':
+        _save(path, name, numpy.array(values, dtype=bool))
+    elif kind in ('str', 'unicode'):
+        if kind == 'unicode':
+            values = [value.encode('utf-8') for value in values]
+        _save(path, name + '.data', numpy.frombuffer(''.join(values) or '\0',
+                                                     dtype=numpy.uint8))
+        _save(path, name + '.offsets', _offsets([len(v) for v in values]))
+    elif kind == 'timeline':
+        times, welcomes, offsets = to_arrays(values)
+        _save(path, name + '.times', times)
+        _save(path, name + '.welcomes', numpy.packbits(welcomes))
+        _save(path, name + '.offsets', offsets)
+    else:
+        with open(os.path.join(path, name + '.pickle'), 'wb') as f:
+            pickle.dump(values, f, pickle.HIGHEST_PROTOCOL)
+    return kind
+
+
+def read_column(path, name, kind, mmap_mode='r'):
+    """
+    Reads the attribute values written by write_column()
+    """
+    if kind in ('int', 'float', 'bool'):
+        return _load(path, name, mmap_mode).tolist()
+    if kind in ('str', 'unicode'):
+        data = _load(path, name + '.data', mmap_mode).tostring()
+        offsets = _load(path, name + '.offsets', mmap_mode).tolist()
+        values = [data[start:end] for start, end in zip(offsets[:-1],
+                                                        offsets[1:])]
+        if kind == 'unicode':
+            values = [value.decode('utf-8') for value in values]
+        return values
+    if kind == 'timeline':
+        times = _load(path, name + '.times', mmap_mode)
+        welcomes = numpy.unpackbits(_load(path, name + '.welcomes',
+                                          mmap_mode))[:len(times)]
+        return from_arrays(times, welcomes,
+                           _load(path, name + '.offsets', mmap_mode))
+    with open(os.path.join(path, name + '.pickle'), 'rb') as f:
+        return pickle.load(f)
+
+
+def write_graph(g, path):
+    """
+    Saves the igraph.Graph g in the directory path
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    edges = numpy.array(g.get_edgelist(), dtype=numpy.int32).reshape(-1, 2)
+    ## stable: edges with the same source keep their order
+    order = numpy.argsort(edges[:, 0], kind='mergesort')
+    _save(path, 'indptr', _offsets(numpy.bincount(edges[:, 0],
+                                                  minlength=len(g.vs))))
+    _save(path, 'indices', edges[order, 1])
+    del edges
+
+    meta = {'version': VERSION, 'vertices': len(g.vs), 'edges': len(g.es),
+            'directed': g.is_directed(), 'vertex_attributes': [],
+            'edge_attributes': []}
+    for i, attr in enumerate(g.vs.attributes()):
+        name = 'v%d' % (i, )
+        kind = write_column(path, name, g.vs[attr])
+        meta['vertex_attributes'].append((attr, kind, name))
+    order = order.tolist()
+    for i, attr in enumerate(g.es.attributes()):
+        name = 'e%d' % (i, )
+        values = g.es[attr]
+        kind = write_column(path, name, [values[j] for j in order])
+        meta['edge_attributes'].append((attr, kind, name))
+    del order
+
+    with open(os.path.join(path, 'attributes.pickle'), 'wb') as f:
+        pickle.dump(dict((attr, g[attr]) for attr in g.attributes()), f,
+                    pickle.HIGHEST_PROTOCOL)
+    ## written last: a graph without it is incomplete
+    with open(os.path.join(path, 'graph.json'), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+def _read_meta(path):
+    with open(os.path.join(path, 'graph.json')) as f:
+        meta = json.load(f)
+    if meta['version'] > VERSION:
+        raise ValueError('Unsupported graph version: %d' % (meta['version'],))
+    return meta
+
+
+def _read_sources(path, meta, mmap_mode):
+    indptr = _load(path, 'indptr', mmap_mode)
+    return numpy.repeat(numpy.arange(meta['vertices'], dtype=numpy.int32),
+                        numpy.diff(indptr))
+
+
+def read_graph(path, vertex_attributes=None, edge_attributes=None,
+               mmap_mode='r'):
+    """
+    Returns the igraph.Graph saved by write_graph() in the directory path.
+    Only the vertex_attributes and edge_attributes (lists of names, all if
+    None) found are read.
+    """
+    meta = _read_meta(path)
+    sources = _read_sources(path, meta, mmap_mode)
+    g = ig.Graph(n=meta['vertices'],
+                 edges=zip(sources.tolist(),
+                           _load(path, 'indices', mmap_mode).tolist()),
+                 directed=meta['directed'])
+    del sources
+
+    with open(os.path.join(path, 'attributes.pickle'), 'rb') as f:
+        for attr, value in pickle.load(f).iteritems():
+            g[attr] = value
+
+    for seq, attrs, columns in ((g.vs, vertex_attributes,
+                                 meta['vertex_attributes']),
+                                (g.es, edge_attributes,
+                                 meta['edge_attributes'])):
+        for attr, kind, name in columns:
+            if attrs is None or attr in attrs:
+                seq[attr.encode('utf-8')] = read_column(path, name, kind,
+                                                        mmap_mode)
+    return g
+
+
+def read_time_index(path, time_label='timestamp', mmap_mode='r'):
+    """
+    Returns the sonet.timeline.TimeIndex of the time_label edge attribute of
+    the graph saved in the directory path, without creating the graph. Edge
+    ids are the ones of the graph returned by read_graph().
+    """
+    meta = _read_meta(path)
+    for attr, kind, name in meta['edge_attributes']:
+        if attr == time_label:
+            break
+    else:
+        raise KeyError(time_label)
+    if kind != 'timeline':
+        raise ValueError('%s is not a timeline attribute' % (time_label, ))
+    return TimeIndex(_read_sources(path, meta, mmap_mode),
+                     _load(path, 'indices', mmap_mode),
+                     _load(path, name + '.times', mmap_mode),
+                     _load(path, name + '.offsets', mmap_mode))
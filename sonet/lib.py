@@ -150,6 +150,152 @@ def SevenZipFileExt(fn, lines=None):
         return m
 
 
+def XMLFileExt(fn, lines=None):
+    """
+    Uncompressed dumps are opened as they are: they are seekable
+    """
+    return open(fn, 'rb')
+
+
+def BZ2SeekableFileExt(fn, lines=None):
+    """
+    bzip2 dumps with a block table (see sonet.bz2blocks) are seekable: only
+    the blocks that are read are decompressed
+    """
+    from sonet.bz2blocks import BZ2SeekableFile
+
+    return BZ2SeekableFile(fn)
+
+
+def ChunkedFileExt(fn, lines=None):
+    """
+    Chunked dumps (see sonet.chunked) are seekable
+    """
+    from sonet.chunked import ChunkedFile
+
+    return ChunkedFile(fn)
+
+
+def NativeFileExt(fn, lines=None):
+    """
+    Decompresses fn (bz2, gz, xz or zst) in this process with a pool of
+    threads (see sonet.decompress)
+    """
+    from sonet.decompress import open_native
+
+    src = open_native(fn)
+    if not lines:
+        return src
+    else:
+        from cStringIO import StringIO
+        m = StringIO(''.join(src.readline() for _ in xrange(lines)))
+        src.close()
+        return m
+
+
+class HeaderReplayFile(object):
+    """
+    Wraps a stream that can't be seeked (like the output of a decompressor)
+    to sniff its header and then parse it from the start without opening it
+    again.
+
+    The lines read with readline() are buffered (up to max_size bytes) and
+    seek() can go back anywhere in this buffer, so get_tags(),
+    get_namespaces() and get_translations() can be called on it. The first
+    read() or iteration beyond the buffer replays it and then streams the
+    underlying file: the buffer is dropped and seek() doesn't work anymore.
+
+    >>> from StringIO import StringIO
+    >>> f = HeaderReplayFile(StringIO('<mediawiki>\\n<siteinfo>\\n<page>\\n'))
+    >>> f.readline(), f.readline()
+    ('<mediawiki>\\n', '<siteinfo>\\n')
+    >>> f.seek(0); f.read(4)
+    '<med'
+    >>> f.read()
+    'iawiki>\\n<siteinfo>\\n<page>\\n'
+    >>> f.seek(0)
+    Traceback (most recent call last):
+    ...
+    IOError: Cannot seek: the header buffer has been replayed
+    """
+    def __init__(self, f, max_size=1024 * 1024):
+        self._f = f
+        self._buffer = ''
+        self._pos = 0
+        self._streaming = False
+        self.max_size = max_size
+
+    def _stream(self):
+        self._streaming = True
+        self._buffer = ''
+
+    def readline(self):
+        if self._streaming:
+            return self._f.readline()
+        if self._pos < len(self._buffer):
+            end = self._buffer.find('\n', self._pos) + 1 or len(self._buffer)
+            line = self._buffer[self._pos:end]
+            self._pos = end
+            if line.endswith('\n'):
+                return line
+        else:
+            line = ''
+        more = self._f.readline()
+        if len(self._buffer) + len(more) > self.max_size:
+            self._stream()
+        else:
+            self._buffer += more
+            self._pos += len(more)
+        return line + more
+
+    def read(self, size=-1):
+        if self._streaming:
+            return self._f.read(size)
+        data = self._buffer[self._pos:] if size < 0 else \
+               self._buffer[self._pos:self._pos + size]
+        self._pos += len(data)
+        if self._pos == len(self._buffer):
+            self._stream()
+            if size < 0:
+                data += self._f.read()
+            elif len(data) < size:
+                data += self._f.read(size - len(data))
+        return data
+
+    def __iter__(self):
+        while not self._streaming:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+            if self._pos == len(self._buffer):
+                self._stream()
+        for line in self._f:
+            yield line
+
+    def seek(self, offset, whence=0):
+        if self._streaming or whence or offset > len(self._buffer):
+            raise IOError('Cannot seek: the header buffer has been replayed')
+        self._pos = offset
+
+    def close(self):
+        self._buffer = ''
+        self._f.close()
+
+
+def open_dump(fn, native=None, seek=False):
+    """
+    Opens the dump fn (see find_open_for_this_file()) starting only one
+    decompressor: the returned file can be seeked back to the start after
+    reading the header, until the pages are read.
+    """
+    deflate, _lineno = find_open_for_this_file(fn, native, seek)
+    src = deflate(fn)
+    if _lineno:
+        src = HeaderReplayFile(src)
+    return src
+
+
 def ensure_dir(f):
     d = os.path.dirname(f)
     if not os.path.exists(d):
@@ -215,20 +361,51 @@ def iter_csv(filename, _hasHeader=False):
     cf.close()
 
 
-def find_open_for_this_file(fn):
+def find_open_for_this_file(fn, native=None, seek=False):
+    """
+    Returns the function opening the dump fn and True if the opened file
+    can't be seeked (so that only the first lines should be read to sniff
+    the header, see open_dump()).
+
+    native: decompress in this process (see sonet.decompress) instead of
+    using external programs. By default bzip2 dumps are decompressed in
+    process when lbzip2 is not available, xz and zstd dumps always are.
+
+    Chunked dumps (see sonet.chunked) are recognised by their sidecar files.
+    bzip2 dumps with a block table are opened with the seekable reader only
+    if seek is True (e.g. to parse some pages of the index or to resume from
+    a checkpoint): it decompresses a block at a time in a single thread,
+    lbzip2 and the native decompressors are faster on sequential reads.
+    """
+    from sonet.chunked import chunk_table_filename
+
     ext = fn.split('.')[-1]
     _lineno = False
-    if ext == 'gz':
+    if os.path.exists(chunk_table_filename(fn)):
+        deflate = ChunkedFileExt
+    elif ext == 'gz':
         #import gzip
         #deflate = gzip.GzipFile
-        deflate = GzipFileExt
+        deflate = NativeFileExt if native else GzipFileExt
         _lineno = True
     elif ext == 'bz2':
-        deflate = BZ2FileExt
+        from sonet.bz2blocks import block_table_filename
+        if seek and os.path.exists(block_table_filename(fn)):
+            deflate = BZ2SeekableFileExt
+        elif native or (native is None and not find_executable('lbzip2')):
+            deflate = NativeFileExt
+            _lineno = True
+        else:
+            deflate = BZ2FileExt
+            _lineno = True
+    elif ext in ('xz', 'zst'):
+        deflate = NativeFileExt
         _lineno = True
     elif ext == '7z':
         deflate = SevenZipFileExt
         _lineno = True
+    elif ext == 'xml':
+        deflate = XMLFileExt
     else:
         assert False, 'Wrong data file (unknown extension)'
 
@@ -0,0 +1,204 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Adjacency and reciprocity matrices of a graph, computed from its edge list
+as sparse matrices in coordinate format (rows, cols, values: sorted by row
+and column, without duplicates) and written:
+
+ - as a coordinate list (CSV: label of the row, label of the column, value);
+ - in Matrix Market format;
+ - in CSR format, in a NumPy .npz file (scipy.sparse.load_npz() reads it);
+ - as a dense CSV matrix with totals, a block of rows at a time.
+"""
+
+import numpy
+
+FORMATS = ('csv', 'coo', 'mtx', 'npz')
+
+
+def _coalesce(n, rows, cols, values):
+    """
+    Sorts the entries by row and column, summing the duplicates
+    """
+    keys = rows * n + cols
+    unique, inverse = numpy.unique(keys, return_inverse=True)
+    values = numpy.bincount(inverse, weights=values, minlength=len(unique))
+    return unique // n, unique % n, values
+
+
+def _edges(g):
+    edges = numpy.array(g.get_edgelist(), dtype=numpy.int64).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+
+def adjacency(g, weight=None):
+    """
+    Returns rows, cols, values of the adjacency matrix of g: values are the
+    sum of the weight attribute (or the number) of the edges from rows to
+    cols (both ways for undirected graphs)
+
+    >>> import igraph as ig
+    >>> g = ig.Graph([(0, 1), (1, 1), (0, 1)], directed=True)
+    >>> g.es['weight'] = [2, 1, 3]
+    >>> [a.tolist() for a in adjacency(g, 'weight')]
+    [[0, 1], [1, 1], [5, 1]]
+    """
+    rows, cols = _edges(g)
+    if weight:
+        values = numpy.array(g.es[weight])
+    else:
+        values = numpy.ones(len(rows), dtype=numpy.int64)
+    if not g.is_directed():
+        other = rows != cols
+        rows, cols = (numpy.concatenate((rows, cols[other])),
+                      numpy.concatenate((cols, rows[other])))
+        values = numpy.concatenate((values, values[other]))
+    integers = values.dtype.kind in 'iub'
+    rows, cols, values = _coalesce(len(g.vs), rows, cols, values)
+    if integers:
+        values = values.round().astype(numpy.int64)
+    return rows, cols, values
+
+
+def reciprocity(g):
+    """
+    Returns rows, cols, values of the reciprocity matrix of g: 1 if there are
+    edges from row to col and from col to row (loops are on the diagonal)
+
+    >>> import igraph as ig
+    >>> g = ig.Graph([(1, 0), (0, 1), (0, 2), (2, 2)], directed=True)
+    >>> [a.tolist() for a in reciprocity(g)]
+    [[0, 1, 2], [1, 0, 2], [1, 1, 1]]
+    """
+    n = len(g.vs)
+    rows, cols, _ = adjacency(g)
+    keys = rows * n + cols
+    mutual = numpy.in1d(keys, cols * n + rows, assume_unique=True)
+    return rows[mutual], cols[mutual], numpy.ones(mutual.sum(),
+                                                  dtype=numpy.int64)
+
+
+def totals(n, rows, cols, values):
+    """
+    Returns the totals of the rows and of the columns of the matrix
+    """
+    kind = values.dtype
+    return (numpy.bincount(rows, weights=values, minlength=n).astype(kind),
+            numpy.bincount(cols, weights=values, minlength=n).astype(kind))
+
+
+def _format(values):
+    """
+    Strings of the values, like str() on the items of the dense lists of
+    older versions (zeros are always '0')
+    """
+    if values.dtype.kind == 'f':
+        return [str(v) if v else '0' for v in values.tolist()]
+    return [str(v) for v in values.tolist()]
+
+
+def write_dense(f, labels, rows, cols, values, block=1000):
+    """
+    Writes to the file f the dense matrix with a TOTAL column and row,
+    like:
+
+    ,Bar,Foo,TOTAL
+    Bar,0,2,2
+    Foo,1,2,3
+    TOTAL,1,4,5
+
+    Only block rows at a time are dense in memory.
+    """
+    n = len(labels)
+    row_totals, col_totals = totals(n, rows, cols, values)
+    print >> f, ','.join(['', ] + labels + ['TOTAL', ])
+
+    starts = numpy.searchsorted(rows, numpy.arange(0, n + block, block))
+    for i, start in enumerate(xrange(0, n, block)):
+        end = min(n, start + block)
+        lo, hi = starts[i], starts[i + 1]
+        dense = numpy.zeros((end - start, n), dtype=values.dtype)
+        dense[rows[lo:hi] - start, cols[lo:hi]] = values[lo:hi]
+        for j, row in enumerate(dense):
+            print >> f, ','.join([labels[start + j]] + _format(row) +
+                                 _format(row_totals[start + j:start + j + 1]))
+        del dense
+
+    print >> f, ','.join(['TOTAL'] + _format(col_totals) +
+                         _format(numpy.array([values.sum()],
+                                             dtype=values.dtype)))
+
+
+def write_coo(f, labels, rows, cols, values):
+    """
+    Writes to the file f a line for every entry of the matrix: label of the
+    row, label of the column, value
+    """
+    labels = numpy.array(labels, dtype=object)
+    for row, col, value in zip(labels[rows], labels[cols],
+                               _format(values)):
+        print >> f, '%s,%s,%s' % (row, col, value)
+
+
+def write_mtx(f, n, rows, cols, values):
+    """
+    Writes to the file f the matrix in Matrix Market coordinate format
+    (indexes start from 1)
+    """
+    field = 'real' if values.dtype.kind == 'f' else 'integer'
+    print >> f, '%%%%MatrixMarket matrix coordinate %s general' % (field, )
+    print >> f, '%d %d %d' % (n, n, len(values))
+    for row, col, value in zip((rows + 1).tolist(), (cols + 1).tolist(),
+                               values.tolist()):
+        print >> f, '%d %d %r' % (row, col, value)
+
+
+def write_npz(fn, labels, rows, cols, values):
+    """
+    Saves the matrix in CSR format in the .npz file fn, with the labels of
+    the vertices
+    """
+    n = len(labels)
+    indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(rows, minlength=n), out=indptr[1:])
+    numpy.savez_compressed(fn, format='csr', shape=(n, n), indptr=indptr,
+                           indices=cols, data=values,
+                           labels=numpy.array(labels))
+
+
+def write_matrix(fn, labels, rows, cols, values, fmt='csv'):
+    """
+    Writes the matrix to the file fn (to stdout if it's None and fmt isn't
+    'npz') in fmt, one of FORMATS
+    """
+    if fmt not in FORMATS:
+        raise ValueError('Unknown matrix format: %s' % (fmt, ))
+    if fmt == 'npz':
+        write_npz(fn, labels, rows, cols, values)
+        return
+    if fn is None:
+        import sys
+        f = sys.stdout
+    else:
+        f = open(fn, 'w')
+    try:
+        if fmt == 'csv':
+            write_dense(f, labels, rows, cols, values)
+        elif fmt == 'coo':
+            write_coo(f, labels, rows, cols, values)
+        else:
+            write_mtx(f, len(labels), rows, cols, values)
+    finally:
+        if fn is not None:
+            f.close()
@@ -0,0 +1,175 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Page index of a dump: for every page it stores the offset of <page> and the
+length of the page (in bytes, in the decompressed stream), its namespace,
+its number of revisions and its title.
+
+The index is saved in a sidecar file next to the dump (see index_filename())
+as a gzipped tab separated file.
+"""
+
+import re
+import gzip
+import logging
+from collections import namedtuple
+from xml.sax.saxutils import unescape
+
+PageEntry = namedtuple('PageEntry', 'offset length ns revisions title')
+
+namespace_regex = re.compile(
+    r'<namespace key="(-?\d+)"[^>]*>([^<]*)</namespace>')
+_entities = {'&quot;': '"', '&#039;': "'"}
+
+
+def index_filename(dump):
+    """
+    >>> index_filename('/tmp/itwiki-20100218-stub-meta-history.xml.bz2')
+    '/tmp/itwiki-20100218-stub-meta-history.xml.bz2.idx.gz'
+    """
+    return dump + '.idx.gz'
+
+
+def get_namespace(title, namespaces):
+    """
+    Returns the namespace key of title. namespaces is a dict
+    {namespace name: key}.
+
+    >>> get_namespace(u'User talk:Ugo', {u'User talk': 3})
+    3
+    >>> get_namespace(u'2001: A Space Odyssey', {u'User talk': 3})
+    0
+    """
+    try:
+        return namespaces[title[:title.index(':')]]
+    except (ValueError, KeyError):
+        return 0
+
+
+def iter_index(f):
+    r"""
+    One pass over a (decompressed) dump: yields a PageEntry for every page.
+
+    The dump is scanned line by line without parsing it: MediaWiki dumps have
+    one tag per line and the text of the pages is escaped, so lines starting
+    with <page>, <title>, <ns>, <revision> or </page> are tags.
+
+    >>> from StringIO import StringIO
+    >>> xml = '''<mediawiki>
+    ...   <namespaces>
+    ...     <namespace key="0" />
+    ...     <namespace key="3">User talk</namespace>
+    ...   </namespaces>
+    ...   <page>
+    ...     <title>User talk:Me &amp; you</title>
+    ...     <revision>
+    ...     </revision>
+    ...     <revision>
+    ...     </revision>
+    ...   </page>
+    ...   <page>
+    ...     <title>Main Page</title>
+    ...     <revision>
+    ...     </revision>
+    ...   </page>
+    ... </mediawiki>'''
+    >>> for entry in iter_index(StringIO(xml)): print entry
+    PageEntry(offset=114, length=123, ns=3, revisions=2, title=u'User talk:Me & you')
+    PageEntry(offset=237, length=79, ns=0, revisions=1, title=u'Main Page')
+    """
+    namespaces = {}
+    offset, start = 0, None
+    title = ns = None
+    revisions = 0
+    for line in f:
+        s = line.lstrip()
+        if start is None:
+            if s.startswith('<page>'):
+                start, title, ns, revisions = offset, None, None, 0
+            elif s.startswith('<namespace '):
+                for key, name in namespace_regex.findall(s):
+                    namespaces[name.decode('utf-8')] = int(key)
+        elif s.startswith('<revision>'):
+            revisions += 1
+        elif s.startswith('</page>'):
+            if ns is None:
+                ns = get_namespace(title, namespaces)
+            yield PageEntry(start, offset + len(line) - start, ns, revisions,
+                            title)
+            start = None
+        elif title is None and s.startswith('<title>'):
+            title = unescape(s[7:s.index('</title>')],
+                             _entities).decode('utf-8')
+        elif ns is None and s.startswith('<ns>'):
+            ns = int(s[4:s.index('</ns>')])
+        offset += len(line)
+
+
+def write_index(fn, entries):
+    """
+    Writes the entries in a gzipped TSV file. Returns the number of entries
+    written.
+    """
+    counter = 0
+    out = gzip.open(fn, 'wb')
+    try:
+        for entry in entries:
+            out.write('%d\t%d\t%d\t%d\t%s\n' % (
+                entry.offset, entry.length, entry.ns, entry.revisions,
+                entry.title.encode('utf-8')))
+            counter += 1
+            if not counter % 100000:
+                logging.info('Indexed pages: %d', counter)
+    finally:
+        out.close()
+    return counter
+
+
+def read_index(fn):
+    """
+    Reads an index written by write_index(). Returns a list of PageEntry.
+    """
+    entries = []
+    f = gzip.open(fn, 'rb')
+    try:
+        for line in f:
+            offset, length, ns, revisions, title = line[:-1].split('\t', 4)
+            entries.append(PageEntry(int(offset), int(length), int(ns),
+                                     int(revisions), title.decode('utf-8')))
+    finally:
+        f.close()
+    return entries
+
+
+def select(entries, namespaces=None, titles=None):
+    """
+    Returns the entries in one of the namespaces (a list of keys) and with
+    one of the titles (if specified), sorted by offset.
+
+    >>> entries = [PageEntry(10, 5, 3, 1, u'User talk:Me'),
+    ...            PageEntry(0, 10, 0, 1, u'Main Page')]
+    >>> [e.title for e in select(entries, namespaces=(0, 3))]
+    [u'Main Page', u'User talk:Me']
+    >>> [e.title for e in select(entries, titles=(u'User talk:Me',))]
+    [u'User talk:Me']
+    """
+    if namespaces is not None:
+        namespaces = frozenset(namespaces)
+    if titles is not None:
+        titles = frozenset(titles)
+
+    return sorted((e for e in entries
+                   if (namespaces is None or e.ns in namespaces) and
+                      (titles is None or e.title in titles)),
+                  key=lambda e: e.offset)
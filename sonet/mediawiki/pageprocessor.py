@@ -1,8 +1,209 @@
-import xml.etree.cElementTree as etree
-#from lxml import etree
+import logging
+try:
+    from lxml import etree
+    lxml = True
+except ImportError:
+    logging.warn('lxml not available: all the tags will be parsed')
+    import xml.etree.cElementTree as etree
+    lxml = False
 from datetime import date
 from random import random
 
+## size of the shards sent to the workers by PageProcessor.start_parallel()
+SHARD_SIZE = 64 * 1024 * 1024
+## size of the blocks read from the (decompressed) dump
+READ_SIZE = 4 * 1024 * 1024
+## seconds between two checks that the workers of start_parallel() are alive
+WORKER_POLL = 1
+
+
+def iter_page_shards(f, shard_size=SHARD_SIZE, read_size=READ_SIZE):
+    r"""
+    Split a (decompressed) XML dump into well formed XML documents made of
+    complete <page> elements and at least shard_size bytes long (except the
+    last one). Every shard starts with the dump header (<mediawiki> and
+    <siteinfo>) so that it can be parsed on its own.
+
+    >>> from StringIO import StringIO
+    >>> xml = '<mediawiki><siteinfo/>\n' + \
+    ...       '<page><title>A</title></page>\n' * 3 + '</mediawiki>\n'
+    >>> shards = list(iter_page_shards(StringIO(xml), 60, 16))
+    >>> len(shards)
+    2
+    >>> print shards[1],
+    <mediawiki><siteinfo/>
+    <page><title>A</title></page>
+    </mediawiki>
+    """
+    footer = '</mediawiki>\n'
+
+    ## read the header, i.e. everything before the first <page>
+    data = ''
+    while True:
+        block = f.read(read_size)
+        data += block
+        idx = data.find('<page>')
+        if idx != -1:
+            break
+        if not block:
+            return
+    header, pending = data[:idx], [data[idx:]]
+    size = len(pending[0])
+
+    while True:
+        block = f.read(read_size)
+        if block:
+            pending.append(block)
+            size += len(block)
+            if size < shard_size:
+                continue
+        data = ''.join(pending)
+        if not block:
+            ## last shard: remove the closing root tag
+            end = data.rfind('</mediawiki>')
+            if end != -1:
+                data = data[:end]
+            if data.find('<page>') != -1:
+                yield header + data + footer
+            return
+
+        cut = data.rfind('</page>')
+        if cut == -1:
+            pending = [data]
+            continue
+        cut += len('</page>')
+        if data[cut:cut + 1] == '\n':
+            cut += 1
+        yield header + data[:cut] + footer
+        pending = [data[cut:]]
+        size = len(pending[0])
+        del data
+
+
+def forward(f, pos, offset, read_size=READ_SIZE):
+    """
+    Moves the stream f from pos to offset. Uses f.seek() if f is seekable,
+    otherwise the bytes in between are read and discarded. Returns offset.
+    """
+    try:
+        f.seek(offset)
+        return offset
+    except (AttributeError, IOError):
+        pass
+
+    while pos < offset:
+        data = f.read(min(offset - pos, read_size))
+        if not data:
+            raise IOError('Unexpected end of dump')
+        pos += len(data)
+    return pos
+
+
+def write_checkpoint(fn, checkpoint):
+    """
+    Saves checkpoint (a picklable dict) in fn, atomically: a crash while
+    writing leaves the previous checkpoint in place.
+    """
+    import os
+    import gzip
+    import cPickle as pickle
+
+    tmp = fn + '.tmp'
+    out = gzip.open(tmp, 'wb')
+    try:
+        pickle.dump(checkpoint, out, pickle.HIGHEST_PROTOCOL)
+    finally:
+        out.close()
+    os.rename(tmp, fn)
+    logging.info('CHECKPOINT: %d pages - offset %d', checkpoint['pages'],
+                 checkpoint['offset'])
+
+
+def read_checkpoint(fn):
+    """
+    Returns the checkpoint saved by write_checkpoint() in fn
+    """
+    import gzip
+    import cPickle as pickle
+
+    f = gzip.open(fn, 'rb')
+    try:
+        return pickle.load(f)
+    finally:
+        f.close()
+
+
+def _parse_shards(processor, shards, results):
+    """
+    Worker loop used by PageProcessor.start_parallel(): parse every shard
+    found in the shards queue and put the partial result of this worker in the
+    results queue.
+    """
+    from cStringIO import StringIO
+
+    try:
+        while True:
+            shard = shards.get()
+            if shard is None:
+                break
+            if hasattr(shard, 'open'):
+                ## see sonet.chunked.ChunkShard
+                processor.parse(shard.open())
+            else:
+                processor.parse(StringIO(shard))
+            del shard
+        results.put(processor.partial())
+    except Exception:
+        logging.exception('Worker failed')
+        results.put(None)
+        raise
+
+
+def _check_workers(workers):
+    """
+    Raises RuntimeError if a worker of PageProcessor.start_parallel() died
+    (killed by a signal, or failed processing the dump)
+    """
+    for worker in workers:
+        if worker.exitcode:
+            raise RuntimeError('A worker failed processing the dump (exit '
+                               'code %d)' % (worker.exitcode, ))
+
+
+def _put(queue, item, workers, timeout=WORKER_POLL):
+    """
+    queue.put(item) that raises RuntimeError instead of blocking forever if
+    the workers reading queue died
+    """
+    from Queue import Full
+
+    while True:
+        try:
+            return queue.put(item, timeout=timeout)
+        except Full:
+            _check_workers(workers)
+
+
+def _get(queue, workers, timeout=WORKER_POLL):
+    """
+    queue.get() that raises RuntimeError instead of blocking forever if the
+    workers writing in queue died
+    """
+    from Queue import Empty
+
+    while True:
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            _check_workers(workers)
+            if not any(worker.is_alive() for worker in workers):
+                ## the last result could have been sent in the meantime
+                try:
+                    return queue.get(timeout=timeout)
+                except Empty:
+                    raise RuntimeError('The workers exited without sending '
+                                       'their results')
+
 
 class PageProcessor(object):
     count = 0
@@ -12,48 +213,458 @@ class PageProcessor(object):
     user_talk_names = None
     search = None
     lang = None
+    ## skip the raw bytes of the pages discarded by process_title() (see
+    ## parse_fast_forward())
+    fast_forward = False
+    bytes_parsed = 0
+    bytes_skipped = 0
+    ## save a checkpoint in this file every checkpoint_interval seconds (see
+    ## parse_checkpointed())
+    checkpoint = None
+    checkpoint_interval = 600
+    pages_parsed = 0
+    _resume = None
     _skip = False
 
     def __init__(self, **kwargs):
         self.__dict__ = kwargs
 
-    def _create_gen(self, context, dfunc, tag_page):
-        for _, elem in context:
-            if elem.tag in dfunc and (elem.tag == tag_page or not self._skip):
-                yield elem
-            else:
-                elem.clear()
+    @classmethod
+    def handlers(cls):
+        """
+        Returns a dict {tag name: method name} of the process_* methods of
+        this class. Methods with names starting with "process_" (such as
+        "process_title") get automatically called at the end of the
+        equivalent tag (</title>).
+
+        The table is built once per class and then cached.
+        """
+        try:
+            return cls.__dict__['_handlers']
+        except KeyError:
+            pass
 
-    def start(self, f):
         import inspect
-        dfunc = {}
+        handlers = {}
+        for name in dir(cls):
+            if name.startswith('process_') and \
+               inspect.ismethod(getattr(cls, name)):
+                handlers[name[8:]] = name
+        cls._handlers = handlers
+        return handlers
+
+    def dispatch_table(self):
+        """
+        Returns a dict {namespaced tag: bound method} used by parse()
+        """
         tag = self.tag
-        tag_page = tag['page']
-
-        ## FIND PROCESS METHODS
-        ## power of introspection: methods with names starting with "process_"
-        ## (such as "process_title") are made available and get automatically
-        ## called when the equivalent
-        for member_name, _ in inspect.getmembers(self):
-            if not member_name.startswith('process_'):
+        return dict((tag[name], getattr(self, method))
+                    for name, method in self.handlers().iteritems())
+
+    def delattr(self, attrs):
+        """
+        Resets the instance attributes attrs to their class default values.
+        The defaults are computed once per class and attrs (use a tuple!) and
+        restored with a single dict update.
+        """
+        cls = type(self)
+        try:
+            defaults, missing = cls.__dict__['_defaults'][attrs]
+        except KeyError:
+            cache = cls.__dict__.get('_defaults')
+            if cache is None:
+                cache = cls._defaults = {}
+            defaults, missing = {}, []
+            for attr in attrs:
+                try:
+                    defaults[attr] = getattr(cls, attr)
+                except AttributeError:
+                    missing.append(attr)
+            defaults, missing = cache[attrs] = (defaults, tuple(missing))
+
+        self.__dict__.update(defaults)
+        for attr in missing:
+            self.__dict__.pop(attr, None)
+
+    def start(self, f, index=None, namespaces=None, titles=None):
+        """
+        Parses the dump f and calls end().
+
+        If index (a list of sonet.mediawiki.pageindex.PageEntry of this dump)
+        is given, only the pages in namespaces (a list of keys) and with one
+        of the titles are parsed (see parse_index()).
+        """
+        if index is None:
+            self.parse(f)
+        else:
+            self.parse_index(f, index, namespaces, titles)
+        self.end()
+
+    def start_parallel(self, f, processes=None, shard_size=SHARD_SIZE):
+        """
+        Like start() but the dump is split in shards made of complete pages
+        (see iter_page_shards()) and the shards are parsed by a pool of
+        processes. Every worker is a (forked) copy of this processor: when the
+        dump is over the worker sends its partial() result to the parent
+        that merges it calling reduce().
+
+        Subclasses have to implement partial() and reduce() to collect the
+        results they compute.
+
+        Raises RuntimeError if a worker dies (e.g. killed because it's out of
+        memory): the other workers are terminated.
+
+        If f has an iter_shards() method (like sonet.chunked.ChunkedFile) the
+        shards are read and decompressed by the workers.
+        """
+        from multiprocessing import Process, Queue, cpu_count
+
+        if not processes:
+            processes = cpu_count()
+
+        shards, results = Queue(2 * processes), Queue()
+        workers = [Process(target=_parse_shards, args=(self, shards, results))
+                   for _ in xrange(processes)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            counter = 0
+            if hasattr(f, 'iter_shards'):
+                iter_shards = f.iter_shards(shard_size)
+            else:
+                iter_shards = iter_page_shards(f, shard_size)
+            for shard in iter_shards:
+                _put(shards, shard, workers)
+                counter += 1
+                logging.debug('Shard %d sent to workers', counter)
+            for _ in workers:
+                _put(shards, None, workers)
+
+            for _ in workers:
+                partial = _get(results, workers)
+                if partial is None:
+                    raise RuntimeError('A worker failed processing the dump')
+                self.reduce(partial)
+        except:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            raise
+        for worker in workers:
+            worker.join()
+        self.end()
+
+    def partial(self):
+        """
+        Returns the (picklable) results computed by a worker of
+        start_parallel(). They are merged into the parent processor by
+        reduce().
+        """
+        return {'count': self.count, 'count_archive': self.count_archive,
+                'bytes_parsed': self.bytes_parsed,
+                'bytes_skipped': self.bytes_skipped}
+
+    def reduce(self, partial):
+        """
+        Merges the partial() result of a worker into this processor.
+        """
+        self.count += partial['count']
+        self.count_archive += partial['count_archive']
+        self.bytes_parsed += partial['bytes_parsed']
+        self.bytes_skipped += partial['bytes_skipped']
+
+    def resume(self, checkpoint):
+        """
+        Restores the state saved in checkpoint (see read_checkpoint()): the
+        next parse() starts from the page following the checkpoint.
+        """
+        self.reduce(checkpoint['partial'])
+        self.pages_parsed = checkpoint['pages']
+        self._resume = checkpoint
+
+    def make_checkpoint(self, offset):
+        """
+        Returns the checkpoint of the processor, with offset the position (in
+        the decompressed dump) of the end of the last page parsed. The state
+        of the processor is the one sent to the parent by the workers of
+        start_parallel() (see partial()), restored by reduce().
+        """
+        return {'offset': offset, 'pages': self.pages_parsed,
+                'partial': self.partial()}
+
+    def write_checkpoint(self, checkpoint):
+        """
+        Saves checkpoint. Subclasses whose state lives somewhere else (i.e. in
+        another process) can override this.
+        """
+        write_checkpoint(self.checkpoint, checkpoint)
+
+    def parse(self, f):
+        if (self.checkpoint or self._resume) and lxml:
+            self.parse_checkpointed(f)
+            return
+        if self.fast_forward and lxml:
+            self.parse_fast_forward(f)
+            return
+
+        tag_page = self.tag['page']
+        dfunc = self.dispatch_table()
+
+        ## iterate over tags. With lxml only the tags in dfunc (and the page
+        ## and revision tags, needed to free memory) are returned by the
+        ## parser.
+        if lxml:
+            context = etree.iterparse(f, tag=self._event_tags(dfunc),
+                                      huge_tree=True)
+        else:
+            context = etree.iterparse(f)
+        self._dispatch(context, dfunc, tag_page)
+        del context
+
+    def parse_checkpointed(self, f, read_size=READ_SIZE):
+        """
+        Like parse(), but the dump is fed to the parser up to the end of a
+        page at a time, so that after every page the position in the dump is
+        known. Every checkpoint_interval seconds a checkpoint is saved (see
+        make_checkpoint()).
+
+        If the processor has been resumed, the pages before the checkpoint
+        are skipped: with f.seek() if f is seekable, otherwise discarding the
+        decompressed bytes without parsing them.
+
+        Requires lxml.
+        """
+        import time
+        from collections import deque
+
+        assert lxml, 'parse_checkpointed() requires lxml'
+
+        tag_page = self.tag['page']
+        dfunc = self.dispatch_table()
+        parser = etree.XMLPullParser(events=('end',),
+                                     tag=self._event_tags(dfunc),
+                                     huge_tree=True)
+
+        ## the header ends where the first page starts
+        data = ''
+        while True:
+            block = f.read(read_size)
+            data += block
+            idx = data.find('<page>')
+            if idx != -1 or not block:
+                break
+        if idx == -1:
+            idx = len(data)
+        parser.feed(data[:idx])
+        pos, data = idx, data[idx:]
+
+        if self._resume is not None:
+            offset = self._resume['offset']
+            if offset - pos <= len(data):
+                data = data[offset - pos:]
+            else:
+                forward(f, pos + len(data), offset, read_size)
+                data = ''
+            self.bytes_skipped += offset - pos
+            pos = offset
+            self._resume = None
+            logging.info('RESUMED: %d pages - offset %d', self.pages_parsed,
+                         pos)
+
+        ## ends (offsets) of the pages fed to the parser but not processed
+        ends = deque()
+        pages = self.pages_parsed
+        last = time.time()
+        while True:
+            block = f.read(read_size)
+            data += block
+            cut = data.rfind('</page>')
+            if block and cut == -1:
                 continue
-            member = self.__getattribute__(member_name)
-            if not inspect.ismethod(member):
+            cut = len(data) if not block else cut + len('</page>')
+
+            i = data.find('</page>')
+            while i != -1 and i < cut:
+                ends.append(pos + i + len('</page>'))
+                i = data.find('</page>', i + 1)
+            parser.feed(data[:cut])
+            self.bytes_parsed += cut
+            pos += cut
+            data = data[cut:]
+            if not block:
+                break
+            self._dispatch(parser.read_events(), dfunc, tag_page)
+
+            offset = None
+            while ends and pages < self.pages_parsed:
+                offset = ends.popleft()
+                pages += 1
+            if offset is not None and self.checkpoint and \
+               time.time() - last >= self.checkpoint_interval:
+                self.write_checkpoint(self.make_checkpoint(offset))
+                last = time.time()
+
+        parser.close()
+        self._dispatch(parser.read_events(), dfunc, tag_page)
+
+    def parse_fast_forward(self, f, read_size=READ_SIZE):
+        """
+        Like parse() but the dump is fed to the parser one page at a time: as
+        soon as process_title() sets self._skip, the raw bytes of the page
+        are discarded up to the next </page> without being parsed at all.
+
+        The number of bytes parsed and skipped are stored in
+        self.bytes_parsed and self.bytes_skipped.
+
+        Requires lxml.
+        """
+        tag_page = self.tag['page']
+        dfunc = self.dispatch_table()
+        parser = etree.XMLPullParser(events=('end',),
+                                     tag=self._event_tags(dfunc),
+                                     huge_tree=True)
+
+        ## states: looking for </title>, feeding the page up to </page>,
+        ## skipping the page up to </page>
+        TITLE, PAGE, SKIP = 0, 1, 2
+        markers = {TITLE: '</title>', PAGE: '</page>', SKIP: '</page>'}
+        state, buf, pos = TITLE, '', 0
+        while True:
+            marker = markers[state]
+            idx = buf.find(marker, pos)
+            if idx == -1:
+                ## keep the tail of the buffer: it can contain the beginning
+                ## of the marker
+                block = f.read(read_size)
+                end = max(pos, len(buf) - len(marker) + 1) if block \
+                      else len(buf)
+                if state == SKIP:
+                    self.bytes_skipped += end - pos
+                else:
+                    parser.feed(buf[pos:end])
+                    self.bytes_parsed += end - pos
+                    self._dispatch(parser.read_events(), dfunc, tag_page)
+                if not block:
+                    break
+                buf, pos = buf[end:] + block, 0
                 continue
-            dfunc[tag[member_name[8:]]] = member
-
-        ## iterate over tags. skip if not in dfunc.
-        ## self._skip is set by process_*() methods if all the tags have to be
-        ## discarded up to the next page-tag (</page>)
-        context = etree.iterparse(f)
-        context = iter(context)
-        gen = self._create_gen(context, dfunc, tag_page)
-        for elem in gen:
-            dfunc[elem.tag](elem)
+
+            if state == SKIP:
+                ## </page> will be fed in PAGE state
+                self.bytes_skipped += idx - pos
+                state, pos = PAGE, idx
+                continue
+
+            end = idx + len(marker)
+            parser.feed(buf[pos:end])
+            self.bytes_parsed += end - pos
+            pos = end
+            self._dispatch(parser.read_events(), dfunc, tag_page)
+            if state == PAGE:
+                state = TITLE
+            else:
+                state = SKIP if self._skip else PAGE
+
+        parser.close()
+        logging.info('PARSED: %d bytes - SKIPPED: %d bytes',
+                     self.bytes_parsed, self.bytes_skipped)
+
+    def parse_index(self, f, index, namespaces=None, titles=None,
+                    read_size=READ_SIZE):
+        """
+        Parses only the pages of the index in namespaces and with one of the
+        titles. The stream goes straight to the wanted pages: with f.seek() if
+        f is seekable (an uncompressed dump or a bzip2 dump with a block
+        table, see sonet.bz2blocks), otherwise discarding the bytes in between
+        without parsing them.
+
+        Requires lxml.
+        """
+        from sonet.mediawiki.pageindex import select
+
+        assert lxml, 'parse_index() requires lxml'
+        if not index:
+            return
+
+        tag_page = self.tag['page']
+        dfunc = self.dispatch_table()
+        parser = etree.XMLPullParser(events=('end',),
+                                     tag=self._event_tags(dfunc),
+                                     huge_tree=True)
+
+        ## the header ends where the first page starts
+        header = f.read(index[0].offset)
+        parser.feed(header)
+        pos = len(header)
+        del header
+
+        wanted = select(index, namespaces, titles)
+        logging.info('PAGES: %d of %d selected', len(wanted), len(index))
+        for entry in wanted:
+            self.bytes_skipped += entry.offset - pos
+            pos = forward(f, pos, entry.offset, read_size)
+            left = entry.length
+            while left:
+                data = f.read(min(left, read_size))
+                if not data:
+                    raise IOError('Unexpected end of dump, is the index '
+                                  'up to date?')
+                parser.feed(data)
+                left -= len(data)
+                self._dispatch(parser.read_events(), dfunc, tag_page)
+            pos += entry.length
+            self.bytes_parsed += entry.length
+
+        parser.feed('</mediawiki>')
+        parser.close()
+        self._dispatch(parser.read_events(), dfunc, tag_page)
+        logging.info('PARSED: %d bytes - SKIPPED: %d bytes',
+                     self.bytes_parsed, self.bytes_skipped)
+
+    def _event_tags(self, dfunc):
+        """
+        Returns the tags whose end is returned by the lxml parsers: the ones
+        in dfunc, <page> and <revision>. Children of a revision without a
+        handler (like <text> if nobody reads it) don't get an end event:
+        they're freed at the end of their revision, not of the page.
+        """
+        tag_page = self.tag['page']
+        tag_revision = tag_page[:-len('page')] + 'revision'
+        return list(set(dfunc.keys() + [tag_page, tag_revision]))
+
+    def _dispatch(self, events, dfunc, tag_page):
+        """
+        Calls the process_* method of every element in events.
+
+        self._skip is set by process_*() methods if all the tags have to be
+        discarded up to the next page-tag (</page>)
+        """
+        handler_page = dfunc.get(tag_page)
+        tag_revision = tag_page[:-len('page')] + 'revision'
+        get = dfunc.get
+        for _, elem in events:
+            if elem.tag == tag_page:
+                if handler_page is not None:
+                    handler_page(elem)
+                self.pages_parsed += 1
+                elem.clear()
+                if lxml:
+                    ## remove already processed pages from the tree
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+                continue
+            if not self._skip:
+                handler = get(elem.tag)
+                if handler is not None:
+                    handler(elem)
             elem.clear()
-        del context
-        del gen
-        self.end()
+            if lxml and elem.tag == tag_revision:
+                ## remove the revisions already processed (and what comes
+                ## before them in the page) from the tree
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
 
     def end(self):
         pass
@@ -99,13 +710,6 @@ class HistoryPageProcessor(PageProcessor):
         except TypeError:
             return False
 
-    def delattr(self, attrs):
-        for attr in attrs:
-            try:
-                delattr(self, attr)
-            except AttributeError:
-                pass
-
     def save(self):
         raise NotImplementedError("save() method has not been implemented")
 
@@ -102,3 +102,40 @@ def get_contributions_table(engine=None):
     conn = engine.connect()
 
     return (table, conn)
+
+class LongitudinalStats(Base):
+    """
+    Statistics of a time window of a graph (see sonet.sliding.METRICS),
+    written by graph_longitudinal_analysis.py
+    """
+    __tablename__ = 'wikinetwork_longitudinalstats'
+
+    id = Column(Integer, Sequence('wikinetwork_longitudinalstats_id_seq'),
+                primary_key=True)
+    lang = Column(String)
+    start = Column(DateTime)
+    end = Column(DateTime)
+    nodes = Column(Integer)
+    edges = Column(Integer)
+    messages = Column(Integer)
+    mean_degree = Column(Float)
+    max_indegree = Column(Integer)
+    max_outdegree = Column(Integer)
+    density = Column(Float)
+    reciprocity = Column(Float)
+    clusters = Column(Integer)
+    giant = Column(Integer)
+    mean_pagerank = Column(Float)
+    stddev_pagerank = Column(Float)
+    max_pagerank = Column(Float)
+
+def get_longitudinal_table(engine=None):
+    if engine is None:
+        engine = get_engine()
+    Base.metadata.bind = engine
+
+    table = LongitudinalStats.__table__
+    Base.metadata.create_all()
+    conn = engine.connect()
+
+    return (table, conn)
@@ -0,0 +1,285 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Columnar cache of the metadata of the revisions of a dump.
+
+RevisionExtractorPageProcessor extracts, in one pass over a (stub) dump,
+page id, title and namespace of every page and revision id, timestamp,
+contributor (name or ip, and id), minor flag and comment length of every
+revision. They are saved as one NumPy file per column (see
+write_revision_table()), while titles and contributor names are saved once
+in text files and referenced by index.
+
+RevisionTable memory-maps the columns: revisions can be filtered with
+vectorised masks without parsing the dump again.
+"""
+
+import os
+import logging
+from array import array
+from calendar import timegm
+from collections import namedtuple
+
+import numpy
+
+from sonet.mediawiki.pageprocessor import PageProcessor
+from sonet.mediawiki.pageindex import get_namespace
+
+## column name, array typecode
+PAGE_COLUMNS = (('page_id', 'l'), ('page_ns', 'h'))
+REVISION_COLUMNS = (('rev_page', 'i'), ('rev_id', 'l'), ('timestamp', 'l'),
+                    ('user', 'i'), ('user_id', 'i'), ('minor', 'b'),
+                    ('comment_length', 'i'))
+TAGS = 'page,title,ns,id,revision,timestamp,username,ip,minor,comment'
+
+Revision = namedtuple('Revision', 'title ns page_id rev_id timestamp user '
+                                  'user_id minor comment_length')
+
+
+def revision_table_dirname(fn):
+    """
+    >>> revision_table_dirname('/tmp/itwiki-20100218-stub-meta-history.xml.gz')
+    '/tmp/itwiki-20100218-stub-meta-history.xml.gz.revisions'
+    """
+    return fn + '.revisions'
+
+
+def ts2epoch(timestamp):
+    """
+    Wiki timestamp to seconds since the epoch
+
+    >>> ts2epoch('2005-10-24T13:59:33Z')
+    1130162373
+    """
+    return timegm((int(timestamp[:4]), int(timestamp[5:7]),
+                   int(timestamp[8:10]), int(timestamp[11:13]),
+                   int(timestamp[14:16]), int(timestamp[17:19])))
+
+
+class RevisionExtractorPageProcessor(PageProcessor):
+    """
+    Collects the columns of the revision table. tag has to contain TAGS.
+
+    namespaces ({namespace name: key}) is used to find the namespace of the
+    pages in dumps without the <ns> tag.
+    """
+    namespaces = None
+    _title = None
+    _ns = None
+    _page_id = None
+    _rev_id = None
+    _timestamp = None
+    _user = None
+    _user_id = -1
+    _minor = 0
+    _comment_length = 0
+
+    def __init__(self, **kwargs):
+        super(RevisionExtractorPageProcessor, self).__init__(**kwargs)
+        self.columns = dict((name, array(typecode)) for name, typecode in
+                            PAGE_COLUMNS + REVISION_COLUMNS)
+        self.titles = []
+        self.users = []
+        self._users = {}
+
+    def process_title(self, elem):
+        self._title = elem.text
+
+    def process_ns(self, elem):
+        self._ns = int(elem.text)
+
+    def process_id(self, elem):
+        ## page id, then revision id, then (in <contributor>) user id
+        if self._page_id is None:
+            self._page_id = int(elem.text)
+        elif self._rev_id is None:
+            self._rev_id = int(elem.text)
+        else:
+            self._user_id = int(elem.text)
+
+    def process_timestamp(self, elem):
+        self._timestamp = ts2epoch(elem.text)
+
+    def process_username(self, elem):
+        self._user = elem.text
+
+    def process_ip(self, elem):
+        self._user = elem.text
+
+    def process_minor(self, _):
+        self._minor = 1
+
+    def process_comment(self, elem):
+        self._comment_length = len(elem.text or '')
+
+    def process_revision(self, _):
+        columns = self.columns
+        if self._user is None:  # deleted contributor
+            user = -1
+        else:
+            try:
+                user = self._users[self._user]
+            except KeyError:
+                user = self._users[self._user] = len(self.users)
+                self.users.append(self._user)
+
+        columns['rev_page'].append(len(self.titles))
+        columns['rev_id'].append(self._rev_id)
+        columns['timestamp'].append(self._timestamp)
+        columns['user'].append(user)
+        columns['user_id'].append(self._user_id)
+        columns['minor'].append(self._minor)
+        columns['comment_length'].append(self._comment_length)
+        self.delattr(("_rev_id", "_timestamp", "_user", "_user_id", "_minor",
+                      "_comment_length"))
+
+    def process_page(self, _):
+        ns = self._ns
+        if ns is None:
+            ns = get_namespace(self._title, self.namespaces or {})
+        self.columns['page_id'].append(self._page_id)
+        self.columns['page_ns'].append(ns)
+        self.titles.append(self._title)
+        self.count += 1
+        if not self.count % 10000:
+            logging.info('Pages: %d', self.count)
+        self.delattr(("_title", "_ns", "_page_id"))
+
+    def end(self):
+        logging.info('PAGES: %d - REVISIONS: %d', self.count,
+                     len(self.columns['rev_id']))
+
+
+def _write_strings(fn, strings):
+    with open(fn, 'wb') as out:
+        for s in strings:
+            out.write(s.encode('utf-8') + '\n')
+
+
+def _read_strings(fn):
+    with open(fn, 'rb') as f:
+        return [line[:-1].decode('utf-8') for line in f]
+
+
+def write_revision_table(path, processor):
+    """
+    Saves the columns collected by processor (a
+    RevisionExtractorPageProcessor) in the directory path
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    for name, typecode in PAGE_COLUMNS + REVISION_COLUMNS:
+        numpy.save(os.path.join(path, name + '.npy'),
+                   numpy.frombuffer(processor.columns[name],
+                                    dtype=numpy.dtype(typecode)))
+    _write_strings(os.path.join(path, 'titles.txt'), processor.titles)
+    _write_strings(os.path.join(path, 'users.txt'), processor.users)
+
+
+class RevisionTable(object):
+    """
+    Revision table saved by write_revision_table(). Every column is an
+    attribute (a NumPy array, memory-mapped by default): page_id, page_ns
+    (one row per page) and rev_page (row of the page), rev_id, timestamp
+    (seconds since the epoch, UTC), user (index in users, -1 if deleted),
+    user_id (-1 for anonymous users), minor and comment_length (one row per
+    revision).
+    """
+    _titles = None
+    _users = None
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        for name, _ in PAGE_COLUMNS + REVISION_COLUMNS:
+            setattr(self, name, numpy.load(os.path.join(path, name + '.npy'),
+                                           mmap_mode=mmap_mode))
+
+    def __len__(self):
+        return len(self.rev_id)
+
+    @property
+    def titles(self):
+        if self._titles is None:
+            self._titles = _read_strings(os.path.join(self.path,
+                                                      'titles.txt'))
+        return self._titles
+
+    @property
+    def users(self):
+        if self._users is None:
+            self._users = _read_strings(os.path.join(self.path, 'users.txt'))
+        return self._users
+
+    @property
+    def ns(self):
+        """
+        Namespace of every revision
+        """
+        return self.page_ns[self.rev_page]
+
+    def user_index(self, name):
+        """
+        Returns the index of the user name (-1 if not found)
+        """
+        try:
+            return self.users.index(name)
+        except ValueError:
+            return -1
+
+    def mask(self, namespaces=None, start=None, end=None, anonymous=None,
+             minor=None):
+        """
+        Returns a boolean array selecting the revisions in namespaces (a list
+        of keys), made in [start, end) (datetime), by anonymous users (if
+        anonymous is True) or registered users (if False) and minor or not.
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        if namespaces is not None:
+            mask &= numpy.in1d(self.ns, list(namespaces))
+        if start is not None:
+            mask &= self.timestamp >= timegm(start.utctimetuple())
+        if end is not None:
+            mask &= self.timestamp < timegm(end.utctimetuple())
+        if anonymous is not None:
+            registered = self.user_id >= 0
+            mask &= ~registered if anonymous else registered
+        if minor is not None:
+            mask &= (self.minor != 0) == minor
+        return mask
+
+    def edits_per_user(self, mask=None):
+        """
+        Returns an array with the number of revisions (selected by mask) of
+        every user, indexed like users
+        """
+        user = self.user if mask is None else self.user[mask]
+        return numpy.bincount(user[user >= 0], minlength=len(self.users))
+
+    def revisions(self, mask=None):
+        """
+        Yields a Revision for every revision selected by mask
+        """
+        from datetime import datetime
+
+        rows = xrange(len(self)) if mask is None else numpy.flatnonzero(mask)
+        titles, users = self.titles, self.users
+        for i in rows:
+            page = self.rev_page[i]
+            user = self.user[i]
+            yield Revision(titles[page], int(self.page_ns[page]),
+                           int(self.page_id[page]), int(self.rev_id[i]),
+                           datetime.utcfromtimestamp(self.timestamp[i]),
+                           users[user] if user >= 0 else None,
+                           int(self.user_id[i]), bool(self.minor[i]),
+                           int(self.comment_length[i]))
@@ -0,0 +1,134 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Roles of the vertices of a graph (bot, sysop, anonymous, ...): every
+boolean vertex attribute is read once and stored as a bit of a per vertex
+bitmask, so groups of users defined by conditions on the roles (like the
+keyword arguments of VertexSeq.select(): {'sysop': True, 'bot_ne': True})
+are evaluated on the distinct bitmasks only, without scanning the vertices.
+"""
+
+import numpy
+
+## suffixes of the keyword arguments of VertexSeq.select()
+OPERATORS = ('eq', 'ne', 'lt', 'gt', 'le', 'ge', 'in', 'notin')
+
+
+class Roles(object):
+    """
+    Bitmask of the boolean attributes of the vertices of g (a vertex has a
+    role if its attribute is True). Attributes are read when first used: don't
+    change the vertices of g after.
+
+    >>> import igraph as ig
+    >>> g = ig.Graph(n=5)
+    >>> g.vs['bot'] = [True, False, False, True, False]
+    >>> g.vs['sysop'] = [False, True, None, True, False]
+    >>> roles = Roles(g)
+    >>> roles.select({'sysop': True, 'bot_ne': True}).tolist()
+    [1]
+    >>> roles.select({'bot_ne': True}).tolist()
+    [1, 2, 4]
+    >>> roles.first(('bot', 'sysop')).tolist()
+    ['bot', 'sysop', 'normal user', 'bot', 'normal user']
+    """
+    ## at most 64 roles
+    dtype = numpy.uint64
+
+    def __init__(self, g):
+        self.g = g
+        self.bits = {}
+        self.masks = numpy.zeros(len(g.vs), dtype=self.dtype)
+        self._codes = None
+
+    def bit(self, attr):
+        """
+        Returns the bit of the role attr, reading the attribute if it's new
+        """
+        try:
+            return self.bits[attr]
+        except KeyError:
+            pass
+        if len(self.bits) == 8 * self.masks.itemsize:
+            raise ValueError('Too many roles: %s' % (attr, ))
+        values = self.g.vs[attr]
+        has_role = numpy.array(values)
+        if has_role.dtype != bool:
+            has_role = numpy.fromiter((v == True for v in values), bool,
+                                      len(values))
+        bit = self.bits[attr] = self.dtype(1) << self.dtype(len(self.bits))
+        self.masks[has_role] |= bit
+        self._codes = None
+        return bit
+
+    def codes(self):
+        """
+        Returns unique, codes: the distinct bitmasks and the index in unique
+        of the bitmask of every vertex
+        """
+        if self._codes is None:
+            self._codes = numpy.unique(self.masks, return_inverse=True)
+        return self._codes
+
+    def condition(self, conditions):
+        """
+        Returns mask, value: a vertex meets conditions (a dict like
+        {'bot': True, 'sysop_ne': True}) if its bitmask & mask == value.
+        Raises ValueError if a condition isn't on a role.
+        """
+        mask = value = self.dtype(0)
+        for key, expected in conditions.iteritems():
+            attr, op = key, 'eq'
+            if '_' in key and key.rsplit('_', 1)[1] in OPERATORS:
+                attr, op = key.rsplit('_', 1)
+            if (op not in ('eq', 'ne') or not attr or attr.startswith('_')
+                    or not isinstance(expected, bool)):
+                raise ValueError('Not a role condition: %s=%r' % (key,
+                                                                 expected))
+            bit = self.bit(attr)
+            has_role = (op == 'eq') == expected
+            if mask & bit and bool(value & bit) != has_role:
+                ## contradictory conditions: no vertex meets them
+                return self.dtype(0), self.dtype(1)
+            mask |= bit
+            if has_role:
+                value |= bit
+        return mask, value
+
+    def matches(self, conditions):
+        """
+        Returns a boolean array: True for the vertices that meet conditions
+        """
+        mask, value = self.condition(conditions)
+        unique, codes = self.codes()
+        return ((unique & mask) == value)[codes]
+
+    def select(self, conditions):
+        """
+        Returns the indices of the vertices that meet conditions
+        """
+        return numpy.flatnonzero(self.matches(conditions))
+
+    def first(self, roles, default='normal user'):
+        """
+        Returns an array with the first role in roles of every vertex
+        (default if it has none of them)
+        """
+        bits = [self.bit(attr) for attr in roles]
+        unique, codes = self.codes()
+        names = numpy.empty(len(unique), dtype=object)
+        names[:] = default
+        for attr, bit in reversed(zip(roles, bits)):
+            names[(unique & bit) != 0] = attr
+        return names[codes]
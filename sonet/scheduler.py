@@ -0,0 +1,361 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Runs jobs (e.g. the graph, enrich and analysis steps of a wiki) on one
+machine: the steps of a job run one after the other, in a subprocess, and
+up to processes jobs run at the same time, as long as their estimated memory
+fits in the budget. The largest jobs are started first, so that the last
+ones to finish are small: when the next job doesn't fit, no smaller job
+is started before it (small jobs would keep filling the memory freed by
+the running ones, and delay it until the end).
+
+A step is skipped if its outputs are newer than its inputs (like make) and
+its last run, recorded in the status file, didn't fail.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import sys
+from time import time, sleep
+
+from sonet.mediawiki import explode_dump_filename
+
+## status of a step in the status file
+RUNNING, DONE, FAILED, SKIPPED = 'running', 'done', 'failed', 'skipped'
+
+
+class Step(object):
+    """
+    A command (args, run in cwd) making outputs from inputs (file names).
+    Its standard output is saved in stdout (if not None) when it succeeds;
+    the standard error, and the output if stdout is None, go to log.
+    """
+
+    def __init__(self, name, args, inputs, outputs, cwd=None, stdout=None,
+                 log=None):
+        self.name = name
+        self.args = args
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cwd = cwd
+        self.stdout = stdout
+        self.log = log
+
+    def up_to_date(self):
+        """
+        True if every output exists and is newer than every input (never
+        if there are no outputs)
+        """
+        if not self.outputs:
+            return False
+        try:
+            oldest = min(os.path.getmtime(fn) for fn in self.outputs)
+        except OSError:
+            return False
+        return all(os.path.getmtime(fn) <= oldest for fn in self.inputs
+                   if os.path.exists(fn))
+
+    def start(self):
+        """
+        Starts the command: returns its subprocess.Popen
+        """
+        log = open(self.log, 'a') if self.log else None
+        out = open(self.stdout + '.tmp', 'w') if self.stdout else log
+        try:
+            return subprocess.Popen(self.args, cwd=self.cwd, stdout=out,
+                                    stderr=log, close_fds=True)
+        finally:
+            for f in set((log, out)):
+                if f is not None:
+                    f.close()
+
+    def finish(self, returncode):
+        """
+        Called when the command exits: saves the standard output if it
+        succeeded
+        """
+        if not self.stdout:
+            return
+        if returncode == 0:
+            os.rename(self.stdout + '.tmp', self.stdout)
+        elif os.path.exists(self.stdout + '.tmp'):
+            os.remove(self.stdout + '.tmp')
+
+
+class Job(object):
+    """
+    Steps to run in order, named name: size (e.g. of the input file, in
+    bytes) orders the jobs and estimates the memory they use
+    """
+
+    def __init__(self, name, steps, size=0):
+        self.name = name
+        self.steps = steps
+        self.size = size
+
+
+def load_status(fn):
+    """
+    Returns the status saved by save_status() in fn (empty if fn doesn't
+    exist)
+    """
+    if not os.path.exists(fn):
+        return {}
+    with open(fn) as f:
+        return json.load(f)
+
+
+def save_status(fn, status):
+    """
+    Saves status in fn, atomically: a crash while writing leaves the
+    previous status in place
+    """
+    tmp = fn + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(status, f, indent=1, sort_keys=True)
+    os.rename(tmp, fn)
+
+
+def physical_memory():
+    """
+    Bytes of physical memory of this machine
+    """
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+class Scheduler(object):
+    """
+    Runs jobs (see run()) with up to processes jobs at a time (one per core
+    if None) whose estimated memory (memory_factor times their size) fits
+    in memory bytes (the physical memory if None): a job larger than memory
+    runs alone, as soon as the jobs before it finish. status_fn is the file
+    where the status of every step is saved.
+    """
+
+    def __init__(self, status_fn, processes=None, memory=None,
+                 memory_factor=1., poll=1.):
+        if processes is None:
+            from multiprocessing import cpu_count
+            processes = cpu_count()
+        self.processes = processes
+        self.memory = physical_memory() if memory is None else memory
+        self.memory_factor = memory_factor
+        self.status_fn = status_fn
+        self.status = load_status(status_fn)
+        self.poll = poll
+
+    def estimate(self, job):
+        return self.memory_factor * job.size
+
+    def _set(self, job, step, status, **kwargs):
+        steps = self.status.setdefault(job.name, {})
+        steps[step.name] = dict(kwargs, status=status)
+        save_status(self.status_fn, self.status)
+
+    def _next_step(self, job, steps):
+        """
+        Starts the first step of steps (removing the ones before it) that
+        isn't up to date: returns it and its Popen, or None if there's none
+        left. Raises OSError if the command can't be started.
+        """
+        while steps:
+            step = steps.pop(0)
+            last = self.status.get(job.name, {}).get(step.name, {})
+            if step.up_to_date() and last.get('status') in (None, DONE,
+                                                            SKIPPED):
+                logging.info('%s: %s is up to date', job.name, step.name)
+                if last.get('status') is None:
+                    self._set(job, step, SKIPPED)
+                continue
+            logging.info('%s: starting %s', job.name, step.name)
+            start = time()
+            self._set(job, step, RUNNING, start=start)
+            try:
+                return step, step.start()
+            except OSError, e:
+                logging.error('%s: %s: %s', job.name, step.name, e)
+                self._set(job, step, FAILED, start=start, end=time(),
+                          error=str(e))
+                raise
+        return None
+
+    def _finish(self, job, step, returncode):
+        step.finish(returncode)
+        status = FAILED if returncode else DONE
+        if returncode:
+            logging.error('%s: %s failed (exit status %s)', job.name,
+                          step.name, returncode)
+        else:
+            logging.info('%s: %s done', job.name, step.name)
+        start = self.status[job.name][step.name].get('start')
+        self._set(job, step, status, start=start, end=time(),
+                  returncode=returncode)
+
+    def run(self, jobs):
+        """
+        Runs jobs, the largest first: returns the names of the jobs that
+        failed
+        """
+        queue = sorted(jobs, key=lambda job: job.size, reverse=True)
+        ## job -> [step, Popen, steps left]
+        running = {}
+        failed = []
+
+        def advance(job, steps):
+            try:
+                started = self._next_step(job, steps)
+            except OSError:
+                failed.append(job.name)
+                running.pop(job, None)
+                return
+            if started is None:
+                running.pop(job, None)
+            else:
+                running[job] = list(started) + [steps]
+
+        try:
+            while queue or running:
+                used = sum(self.estimate(job) for job in running)
+                while queue:
+                    job = queue[0]
+                    if len(running) >= self.processes:
+                        break
+                    if running and used + self.estimate(job) > self.memory:
+                        ## wait for memory for this job, not for the
+                        ## smaller ones
+                        break
+                    queue.pop(0)
+                    advance(job, list(job.steps))
+                    if job in running:
+                        used += self.estimate(job)
+
+                if running:
+                    sleep(self.poll)
+
+                for job, (step, process, steps) in running.items():
+                    returncode = process.poll()
+                    if returncode is None:
+                        continue
+                    self._finish(job, step, returncode)
+                    if returncode:
+                        failed.append(job.name)
+                        del running[job]
+                    else:
+                        advance(job, steps)
+        finally:
+            ## interrupted: the steps still running failed
+            for job, (step, process, _) in running.items():
+                if process.poll() is None:
+                    process.terminate()
+                    process.wait()
+                self._finish(job, step, process.returncode)
+        return failed
+
+
+def graph_format(options):
+    """
+    Format of the graph saved by utpedits2graph.py run with options (the
+    value of its -f/--format option)
+
+    >>> graph_format(['-v', '-f', 'binary']), graph_format(['-fbinary'])
+    ('binary', 'binary')
+    >>> graph_format(['--format=binary']), graph_format([])
+    ('binary', 'pickle')
+    """
+    format_ = 'pickle'
+    options = list(options)
+    for i, opt in enumerate(options):
+        if opt in ('-f', '--format') and i + 1 < len(options):
+            format_ = options[i + 1]
+        elif opt.startswith('--format='):
+            format_ = opt[len('--format='):]
+        elif opt.startswith('-f') and not opt.startswith('--'):
+            format_ = opt[2:]
+    return format_
+
+
+def _size(fn):
+    """
+    Size of the file fn, or of the files in the directory fn (a graph
+    saved by sonet.graphstore), 0 if it doesn't exist
+    """
+    if os.path.isdir(fn):
+        return sum(os.path.getsize(os.path.join(fn, name))
+                   for name in os.listdir(fn))
+    return os.path.getsize(fn) if os.path.exists(fn) else 0
+
+
+def wiki_job(fn, source=None, graph_options=(), enrich_options=(),
+             analysis_options=()):
+    """
+    Returns the Job making the graph (utpedits2graph.py), the rich graph
+    (graph_enrich.py) and the analysis (graph_analysis.py, its output saved
+    in a -analysis.txt file) of the wiki of fn, a dump or a graph: the
+    files are in the directory of fn and the scripts in source (the
+    directory of this repository if None). Graphs are pickles, or
+    directories of sonet.graphstore if fn is one or if graph_options save
+    the graph with -f binary.
+
+    >>> job = wiki_job('/data/vecwiki-20100307-stub-meta-history.pickle')
+    >>> job.name, [step.name for step in job.steps]
+    ('vecwiki-20100307-stub-meta-history', ['enrich', 'analysis'])
+    >>> job.steps[1].outputs
+    ['/data/vecwiki-20100307-stub-meta-history-analysis.txt']
+    >>> job = wiki_job('/data/vecwiki-20100307-stub-meta-history.graph')
+    >>> job.steps[1].inputs
+    ['/data/vecwiki-20100307-stub-meta-history_rich.graph/graph.json']
+    """
+    if source is None:
+        source = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = lambda name: [sys.executable, os.path.join(source, name)]
+
+    fn = os.path.abspath(fn)
+    lang, date, type_ = explode_dump_filename(fn)
+    rich = type_.endswith('_rich')
+    if rich:
+        type_ = type_[:-len('_rich')]
+    name = '%swiki-%s%s' % (lang, date, type_)
+    cwd = os.path.dirname(fn)
+    path = lambda suffix: os.path.join(cwd, name + suffix)
+    is_graph = fn.endswith('.pickle') or fn.endswith('.graph')
+    if is_graph:
+        suffix = os.path.splitext(fn)[1]
+    elif graph_format(graph_options) == 'binary':
+        suffix = '.graph'
+    else:
+        suffix = '.pickle'
+    graph, rich_graph = path(suffix), path('_rich' + suffix)
+    ## a directory is not newer when its files are rewritten: graph.json is
+    ## (written last, see sonet.graphstore.write_graph())
+    target = lambda fn: (os.path.join(fn, 'graph.json')
+                         if fn.endswith('.graph') else fn)
+
+    steps = []
+    if not is_graph:
+        steps.append(Step('graph', script('utpedits2graph.py') +
+                          list(graph_options) + [fn], [fn], [target(graph)],
+                          cwd=cwd, log=path('-graph.log')))
+    if not rich:
+        steps.append(Step('enrich', script('graph_enrich.py') +
+                          list(enrich_options) + [graph], [target(graph)],
+                          [target(rich_graph)], cwd=cwd,
+                          log=path('-enrich.log')))
+    steps.append(Step('analysis', script('graph_analysis.py') +
+                      list(analysis_options) + [rich_graph],
+                      [target(rich_graph)], [path('-analysis.txt')],
+                      cwd=cwd, stdout=path('-analysis.txt'),
+                      log=path('-analysis.log')))
+    return Job(name, steps, _size(fn))
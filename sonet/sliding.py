@@ -0,0 +1,368 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Sliding window over the messages of a temporal graph (a
+sonet.timeline.TimeIndex): all the messages are sorted by time once, and
+moving the window adds the messages entering it and expires the ones
+leaving it, updating the weights of the edges, the degrees of the vertices
+and the number of reciprocated edges. The statistics of every window are
+computed from them, without creating its subgraph.
+
+Metrics that need the whole graph of a window (clusters, pagerank) are
+computed by window_stats() on the graph of the window, built from the
+messages of the window only: windows are independent, parallel_windows()
+shares them among forked processes.
+"""
+
+from itertools import izip
+
+import numpy
+
+from sonet.timeline import to_epoch
+
+## statistics of a window, in the order used by SlidingWindow.stats()
+STATS = ('nodes', 'edges', 'messages', 'density', 'reciprocity',
+         'mean_degree', 'max_indegree', 'max_outdegree')
+
+## statistics of every metric computed by window_stats()
+METRICS = {
+    'degree': ('mean_degree', 'max_indegree', 'max_outdegree'),
+    'density': ('density', ),
+    'reciprocity': ('reciprocity', ),
+    'clusters': ('clusters', 'giant'),
+    'pagerank': ('mean_pagerank', 'stddev_pagerank', 'max_pagerank'),
+}
+ALL_METRICS = ('degree', 'density', 'reciprocity', 'clusters', 'pagerank')
+## metrics computed by SlidingWindow.stats()
+SLIDING_METRICS = ('degree', 'density', 'reciprocity')
+
+
+def get_columns(metrics):
+    """
+    Statistics computed for the metrics, in order
+
+    >>> get_columns(['density', 'clusters'])
+    ('nodes', 'edges', 'messages', 'density', 'clusters', 'giant')
+    """
+    columns = ('nodes', 'edges', 'messages')
+    for metric in metrics:
+        columns += METRICS[metric]
+    return columns
+
+
+def reverse_edges(sources, targets):
+    """
+    Returns the id of the reverse of every edge (-1 if there's none, the
+    edge itself for loops)
+
+    >>> reverse_edges([0, 1, 1, 2], [1, 0, 2, 2]).tolist()
+    [1, 0, -1, 3]
+    """
+    sources = numpy.asarray(sources, dtype=numpy.int64)
+    targets = numpy.asarray(targets, dtype=numpy.int64)
+    if not len(sources):
+        return numpy.zeros(0, dtype=numpy.int64)
+    n = max(sources.max(), targets.max()) + 1
+    keys = sources * n + targets
+    order = numpy.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    reverse = targets * n + sources
+    pos = numpy.minimum(numpy.searchsorted(sorted_keys, reverse),
+                        len(keys) - 1)
+    return numpy.where(sorted_keys[pos] == reverse, order[pos], -1)
+
+
+class Messages(object):
+    """
+    All the messages of a sonet.timeline.TimeIndex sorted by time: message i
+    was sent at times[i] on the edge edges[i]. The messages of a window are
+    contiguous.
+
+    >>> from sonet.timeline import TimeIndex
+    >>> index = TimeIndex([0, 1, 1], [1, 0, 2], [1, 5, 2, 3, 9],
+    ...                   [0, 2, 4, 5])
+    >>> messages = Messages(index)
+    >>> messages.edges.tolist()
+    [0, 1, 1, 0, 2]
+    >>> eids, weights = messages.window(1, 9)
+    >>> eids.tolist(), weights.tolist()
+    ([0, 1], [1, 2])
+    """
+    def __init__(self, index):
+        self.index = index
+        edges = numpy.repeat(numpy.arange(len(index), dtype=numpy.int64),
+                             numpy.diff(index.offsets))
+        order = numpy.argsort(index.times)
+        self.times = numpy.asarray(index.times)[order]
+        self.edges = edges[order]
+
+    def bounds(self, start=None, end=None):
+        """
+        Returns lo, hi: the messages strictly between start and end
+        (datetime or seconds since the epoch, None means no limit) are in
+        [lo, hi)
+        """
+        ## keys of the same type as times, or they're all converted
+        key = self.times.dtype.type
+        lo = 0 if start is None else numpy.searchsorted(
+            self.times, key(to_epoch(start)), side='right')
+        hi = len(self.times) if end is None else numpy.searchsorted(
+            self.times, key(to_epoch(end)), side='left')
+        return lo, max(hi, lo)
+
+    def window(self, start=None, end=None):
+        """
+        Returns the ids of the edges with messages in the window (sorted)
+        and the number of their messages
+        """
+        lo, hi = self.bounds(start, end)
+        eids, inverse = numpy.unique(self.edges[lo:hi], return_inverse=True)
+        return eids, numpy.bincount(inverse, minlength=len(eids))
+
+    def graph(self, start=None, end=None, weight_label='weight'):
+        """
+        Returns a new directed igraph.Graph with the edges having messages
+        in the window, weighted with their number, and their vertices (in
+        the order of their ids in the index)
+        """
+        import igraph as ig
+
+        eids, weights = self.window(start, end)
+        n = len(eids)
+        _, inverse = numpy.unique(
+            numpy.concatenate((self.index.sources[eids],
+                               self.index.targets[eids])),
+            return_inverse=True)
+        g = ig.Graph(n=inverse.max() + 1 if n else 0,
+                     edges=zip(inverse[:n].tolist(), inverse[n:].tolist()),
+                     directed=True)
+        g.es[weight_label] = weights.tolist()
+        return g
+
+
+class SlidingWindow(object):
+    """
+    Window of the messages (between start and end, excluded) of the graph
+    indexed by index. Call move() to change the window: its start and its end
+    can only move forward.
+
+    >>> from sonet.timeline import TimeIndex
+    >>> ## 0 -> 1 at 1 and 5, 1 -> 0 at 2 and 3, 1 -> 2 at 9
+    >>> index = TimeIndex([0, 1, 1], [1, 0, 2], [1, 5, 2, 3, 9],
+    ...                   [0, 2, 4, 5])
+    >>> w = SlidingWindow(index)
+    >>> w.move(0, 4)
+    >>> w.weights.tolist(), w.stats()['reciprocity']
+    ([1, 2, 0], 1.0)
+    >>> w.move(2, 10)
+    >>> w.weights.tolist(), w.stats()['nodes'], w.stats()['reciprocity']
+    ([1, 1, 1], 3, 0.6666666666666666)
+    """
+    def __init__(self, index, messages=None):
+        """
+        messages: Messages of index (created if None)
+        """
+        self.index = index
+        if messages is None:
+            messages = Messages(index)
+        self.messages = messages
+        self.times, self.edges = messages.times, messages.edges
+        n_edges = len(index)
+
+        self.reverse = reverse_edges(index.sources, index.targets)
+        self.loops = index.sources == index.targets
+        n_vertices = (max(index.sources.max(), index.targets.max()) + 1
+                      if n_edges else 0)
+
+        self.weights = numpy.zeros(n_edges, dtype=numpy.int64)
+        self.indegree = numpy.zeros(n_vertices, dtype=numpy.int64)
+        self.outdegree = numpy.zeros(n_vertices, dtype=numpy.int64)
+        self.n_edges = 0       # edges with messages in the window
+        self.n_loops = 0
+        self.n_vertices = 0    # vertices with edges in the window
+        self.n_mutual = 0      # reciprocated edges (not loops)
+        self.n_messages = 0
+        self._lo = self._hi = 0
+        self.start = self.end = None
+
+    def move(self, start=None, end=None):
+        """
+        Moves the window to the messages strictly between start and end
+        (datetime or seconds since the epoch, None means no limit)
+        """
+        lo, hi = self.messages.bounds(start, end)
+        if lo < self._lo or hi < self._hi:
+            raise ValueError('The window can only move forward')
+
+        ## net change of the weights of the edges with messages entering
+        ## (+1) or leaving (-1) the window
+        moved = numpy.concatenate((self.edges[self._hi:hi],
+                                   self.edges[self._lo:lo]))
+        sign = numpy.ones(len(moved))
+        sign[hi - self._hi:] = -1
+        changed, inverse = numpy.unique(moved, return_inverse=True)
+        dw = numpy.bincount(inverse, weights=sign).astype(numpy.int64)
+        del moved, sign, inverse
+        self.weights[changed] += dw
+        self.n_messages += int(dw.sum())
+
+        after = self.weights[changed]
+        before = after - dw
+        delta = (after > 0).astype(numpy.int64) - (before > 0)
+
+        ## reciprocated edges: the ones of changed and their reverse (counted
+        ## twice, if they didn't change)
+        rev = self.reverse[changed]
+        ok = (rev >= 0) & ~self.loops[changed]
+        eids, rev, after, before = (changed[ok], rev[ok], after[ok],
+                                    before[ok])
+        pos = numpy.minimum(numpy.searchsorted(changed, rev),
+                            len(changed) - 1)
+        rev_changed = changed[pos] == rev
+        rev_after = self.weights[rev]
+        rev_before = rev_after - numpy.where(rev_changed, dw[pos], 0)
+        mutual = (((after > 0) & (rev_after > 0)).astype(numpy.int64) -
+                  ((before > 0) & (rev_before > 0)))
+        self.n_mutual += int((mutual * (2 - rev_changed)).sum())
+
+        ## edges entering (+1) and leaving (-1) the window
+        moved = delta != 0
+        eids, delta = changed[moved], delta[moved]
+        self.n_edges += int(delta.sum())
+        self.n_loops += int(delta[self.loops[eids]].sum())
+
+        ## degrees of their vertices
+        sources = self.index.sources[eids]
+        touched, inverse = numpy.unique(
+            numpy.concatenate((sources, self.index.targets[eids])),
+            return_inverse=True)
+        n = len(sources)
+        was_active = (self.indegree[touched] + self.outdegree[touched]) > 0
+        self.outdegree[touched] += numpy.bincount(
+            inverse[:n], weights=delta, minlength=len(touched)).astype(
+                numpy.int64)
+        self.indegree[touched] += numpy.bincount(
+            inverse[n:], weights=delta, minlength=len(touched)).astype(
+                numpy.int64)
+        is_active = (self.indegree[touched] + self.outdegree[touched]) > 0
+        self.n_vertices += int(is_active.sum()) - int(was_active.sum())
+
+        self._lo, self._hi = lo, hi
+        self.start, self.end = start, end
+
+    def stats(self):
+        """
+        Statistics of the subgraph of the window (edges with messages in the
+        window and their vertices): density and reciprocity as computed by
+        igraph (without loops), degrees are not weighted.
+        """
+        n, m = self.n_vertices, self.n_edges
+        not_loops = m - self.n_loops
+        return {'nodes': n, 'edges': m, 'messages': self.n_messages,
+                'density': float(m) / (n * (n - 1)) if n > 1 else 0.,
+                'reciprocity': (float(self.n_mutual) / not_loops
+                                if not_loops else 0.),
+                'mean_degree': float(m) / n if n else 0.,
+                'max_indegree': int(self.indegree.max()) if n else 0,
+                'max_outdegree': int(self.outdegree.max()) if n else 0}
+
+    def windows(self, windows):
+        """
+        Yields (start, end, stats()) for every (start, end) in windows,
+        sorted by start and by end
+        """
+        for start, end in windows:
+            self.move(start, end)
+            yield start, end, self.stats()
+
+
+def window_stats(messages, start, end, metrics=ALL_METRICS):
+    """
+    Statistics (see get_columns()) of the graph of the Messages messages
+    strictly between start and end. Its vertices are the ones with edges in
+    the window, as in SlidingWindow.
+    """
+    g = messages.graph(start, end)
+    n, m = len(g.vs), len(g.es)
+    stats = {'nodes': n, 'edges': m, 'messages': sum(g.es['weight'])}
+
+    if 'degree' in metrics:
+        stats['mean_degree'] = float(m) / n if n else 0.
+        ## loops counted, as in graph_analysis.py (maxdegree() doesn't)
+        stats['max_indegree'] = max(g.indegree()) if n else 0
+        stats['max_outdegree'] = max(g.outdegree()) if n else 0
+    if 'density' in metrics:
+        stats['density'] = g.density() if n > 1 else 0.
+    if 'reciprocity' in metrics:
+        ## igraph returns NaN for graphs with loops only
+        stats['reciprocity'] = (g.reciprocity() if m > sum(g.is_loop())
+                                else 0.)
+    if 'clusters' in metrics:
+        sizes = g.clusters().sizes()
+        stats['clusters'] = len(sizes)
+        stats['giant'] = max(sizes) if sizes else 0
+    if 'pagerank' in metrics:
+        pagerank = numpy.array(g.pagerank(weights='weight') if n else [0.])
+        stats['mean_pagerank'] = float(numpy.average(pagerank))
+        stats['stddev_pagerank'] = float(numpy.sqrt(numpy.var(pagerank)))
+        stats['max_pagerank'] = float(pagerank.max())
+    return stats
+
+
+## messages of the parent process, shared with its forked workers
+_shared = {}
+
+
+def _window_stats(args):
+    start, end, metrics = args
+    return window_stats(_shared['messages'], start, end, metrics)
+
+
+def parallel_windows(messages, windows, metrics=ALL_METRICS,
+                     processes=None):
+    """
+    Yields (start, end, window_stats()) for every (start, end) in windows,
+    computed by processes workers. They're forked after messages is set:
+    its arrays (and the ones of its index) are shared (read only), not
+    copied or pickled.
+    """
+    from multiprocessing import Pool
+
+    windows = list(windows)
+    _shared['messages'] = messages
+    pool = Pool(processes)
+    try:
+        results = pool.imap(_window_stats, [(start, end, metrics)
+                                            for start, end in windows])
+        for (start, end), stats in izip(windows, results):
+            yield start, end, stats
+        pool.close()
+    finally:
+        pool.terminate()
+        _shared.clear()
+
+
+def iter_windows(index, windows, metrics=SLIDING_METRICS, processes=1):
+    """
+    Yields (start, end, stats) for every (start, end) in windows (sorted by
+    start and by end), with the statistics of the metrics (at least): with
+    a SlidingWindow if they're enough, else with processes workers.
+    """
+    messages = Messages(index)
+    if processes == 1 and set(metrics) <= set(SLIDING_METRICS):
+        return SlidingWindow(index, messages).windows(windows)
+    if processes == 1:
+        return ((start, end, window_stats(messages, start, end, metrics))
+                for start, end in windows)
+    return parallel_windows(messages, windows, metrics, processes)
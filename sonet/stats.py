@@ -0,0 +1,103 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Vertex statistics computed on NumPy arrays: weighted degrees and
+statistics of groups of vertices. Every vertex has a code (e.g.
+its roles) and a group is a set of codes: sums are computed once per code
+and then added up for every group, so overlapping groups cost no more
+passes over the vertices.
+"""
+
+from collections import namedtuple
+
+import igraph as ig
+import numpy
+
+## statistics of the values of a group of vertices: top are the k largest
+GroupStats = namedtuple('GroupStats', 'count mean stddev top')
+
+
+def strength(g, weight='weight', loops=False):
+    """
+    Returns the weighted in-degree and out-degree of the vertices of g (arrays
+    of ints if the weights are ints). Loops are ignored if loops is False.
+
+    >>> import igraph as ig
+    >>> g = ig.Graph([(0, 1), (1, 1), (2, 1)], directed=True)
+    >>> g.es['weight'] = [2, 5, 1]
+    >>> [d.tolist() for d in strength(g)]
+    [[0, 3, 0], [2, 0, 1]]
+    >>> [d.tolist() for d in strength(g, loops=True)]
+    [[0, 8, 0], [2, 5, 1]]
+    """
+    ## igraph sums the weights in C: only the results are converted
+    integers = not weight or numpy.array(g.es[weight]).dtype.kind in 'iub'
+    degrees = []
+    for mode in (ig.IN, ig.OUT):
+        d = numpy.array(g.strength(mode=mode, loops=loops, weights=weight))
+        if integers:
+            d = d.round().astype(numpy.int64)
+        degrees.append(d)
+    return tuple(degrees)
+
+
+def group_stats(values, codes, groups, k=5):
+    """
+    Returns a dict with the GroupStats of the values of every group: values
+    and codes are arrays with an item for every vertex, groups is a dict
+    name -> codes of the vertices in the group. Codes are small ints (see
+    numpy.unique(return_inverse=True)).
+
+    >>> values = numpy.array([3, 1, 4, 1, 5])
+    >>> codes = numpy.array([0, 1, 1, 2, 0])
+    >>> stats = group_stats(values, codes, {'a': [0], 'ab': [0, 1], 'c': []})
+    >>> stats['ab'].count, stats['ab'].mean, stats['ab'].top.tolist()
+    (4, 3.25, [5, 4, 3, 1])
+    >>> stats['a'].stddev, stats['c'].count
+    (1.0, 0)
+    """
+    values = numpy.asarray(values)
+    codes = numpy.asarray(codes, dtype=numpy.int64)
+    m = codes.max() + 1 if len(codes) else 0
+    as_float = values.astype(numpy.float64)
+    counts = numpy.bincount(codes, minlength=m)
+    sums = numpy.bincount(codes, weights=as_float, minlength=m)
+    ## squared deviations from the mean of the code: groups add them up
+    ## with the ones of the means of their codes (no cancellation errors)
+    means = sums / numpy.maximum(counts, 1)
+    deviations = numpy.bincount(codes, weights=(as_float - means[codes]) ** 2,
+                                minlength=m)
+
+    ## by code, the largest values first: the top of a code is at its start
+    order = numpy.lexsort((-as_float, codes))
+    starts = numpy.zeros(m + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=starts[1:])
+
+    stats = {}
+    for name, members in groups.iteritems():
+        members = numpy.asarray(members, dtype=numpy.int64)
+        count = int(counts[members].sum())
+        if not count:
+            stats[name] = GroupStats(0, numpy.nan, numpy.nan, values[:0])
+            continue
+        mean = sums[members].sum() / count
+        variance = (deviations[members].sum() + (
+            counts[members] * (means[members] - mean) ** 2).sum()) / count
+        top = numpy.concatenate([
+            values[order[starts[code]:starts[code] + min(k, counts[code])]]
+            for code in members])
+        top = top[numpy.argsort(-top.astype(numpy.float64),
+                                kind='mergesort')[:k]]
+        stats[name] = GroupStats(count, mean, numpy.sqrt(variance), top)
+    return stats
@@ -0,0 +1,356 @@
+##########################################################################
+#                                                                        #
+#  This program is free software; you can redistribute it and/or modify  #
+#  it under the terms of the GNU General Public License as published by  #
+#  the Free Software Foundation; version 2 of the License.               #
+#                                                                        #
+#  This program is distributed in the hope that it will be useful,       #
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#  GNU General Public License for more details.                          #
+#                                                                        #
+##########################################################################
+
+"""
+Packed timelines of the messages of temporal edges (the timestamp attribute
+of the edges of the graphs created by utpedits2graph.py).
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import timegm
+from datetime import datetime
+
+import numpy
+
+
+def to_epoch(time):
+    """
+    datetime (naive, UTC) to seconds since the epoch. Ints are returned
+    unchanged.
+
+    >>> to_epoch(datetime(2010, 3, 7, 12, 0))
+    1267963200
+    >>> to_epoch(1267963200)
+    1267963200
+    """
+    if isinstance(time, datetime):
+        return timegm(time.utctimetuple())
+    return time
+
+
+class Timeline(object):
+    """
+    Messages of an edge: times (seconds since the epoch, UTC, sorted) packed
+    in an array of int32 and welcome flags in the bits of an int. For the
+    callers expecting lists of mwlib.Message, a Timeline is a sequence of
+    mwlib.Message, created when they're read. Timelines are never changed
+    once created (slices can be the same object).
+
+    >>> from sonet.mediawiki import Message
+    >>> tl = Timeline.from_messages([Message(datetime(2010, 1, 2), False),
+    ...                              Message(datetime(2010, 1, 1), True)])
+    >>> len(tl), tl.welcomes
+    (2, 1)
+    >>> tl[0]
+    Message(time=datetime.datetime(2010, 1, 1, 0, 0), welcome=True)
+    >>> [m.time.day for m in tl]
+    [1, 2]
+    >>> tl.between(start=datetime(2010, 1, 1))
+    Timeline([1262390400], welcomes=0)
+    >>> import cPickle as pickle
+    >>> pickle.loads(pickle.dumps(tl, 2)) == tl
+    True
+    """
+    __slots__ = ('times', 'welcomes')
+
+    def __init__(self, times=None, welcomes=0):
+        """
+        times: array('i') of sorted times, or its bytes
+        welcomes: int, bit i is the welcome flag of message i
+        """
+        if times is None:
+            times = array('i')
+        elif not isinstance(times, array):
+            times = array('i', times)
+        self.times = times
+        self.welcomes = welcomes
+
+    @classmethod
+    def from_messages(cls, messages):
+        """
+        Packs a list of mwlib.Message (in any order)
+        """
+        messages = sorted((to_epoch(m.time), m.welcome) for m in messages)
+        welcomes = 0
+        for i, (_, welcome) in enumerate(messages):
+            if welcome:
+                welcomes |= 1 << i
+        return cls(array('i', [time for time, _ in messages]), welcomes)
+
+    def __reduce__(self):
+        return (Timeline, (self.times.tostring(), self.welcomes))
+
+    def __len__(self):
+        return len(self.times)
+
+    def welcome(self, i):
+        return bool(self.welcomes >> i & 1)
+
+    def __getitem__(self, i):
+        from sonet.mediawiki import Message
+
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                raise ValueError('Timeline slices can not have a step')
+            return self._slice(start, stop)
+        if i < 0:
+            i += len(self)
+        return Message(datetime.utcfromtimestamp(self.times[i]),
+                       self.welcome(i))
+
+    def __iter__(self):
+        from sonet.mediawiki import Message
+
+        utc = datetime.utcfromtimestamp
+        welcomes = self.welcomes
+        for i, time in enumerate(self.times):
+            yield Message(utc(time), bool(welcomes >> i & 1))
+
+    def _slice(self, start, stop):
+        if start == 0 and stop >= len(self):
+            return self
+        if stop <= start:
+            return Timeline()
+        return Timeline(self.times[start:stop],
+                        self.welcomes >> start & ((1 << (stop - start)) - 1))
+
+    def __add__(self, other):
+        """
+        Timeline with the messages of both timelines
+
+        >>> Timeline([1, 2], 1) + Timeline([2, 3], 1)
+        Timeline([1, 2, 2, 3], welcomes=5)
+        """
+        if not len(other):
+            return self
+        if not len(self):
+            return other
+        if other.times[0] >= self.times[-1]:
+            return Timeline(self.times + other.times,
+                            self.welcomes | other.welcomes << len(self))
+        return Timeline.from_messages(list(self) + list(other))
+
+    def between(self, start=None, end=None):
+        """
+        Returns the Timeline of the messages strictly between start and end
+        (datetime or seconds since the epoch, None means no limit)
+        """
+        lo = 0 if start is None else bisect_right(self.times,
+                                                  to_epoch(start))
+        hi = len(self) if end is None else bisect_left(self.times,
+                                                       to_epoch(end))
+        return self._slice(lo, hi)
+
+    def __eq__(self, other):
+        return (isinstance(other, Timeline) and self.times == other.times and
+                self.welcomes == other.welcomes)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Timeline(%r, welcomes=%d)' % (self.times.tolist(),
+                                              self.welcomes)
+
+
+def pack_timelines(g, time_label='timestamp'):
+    """
+    Packs the timelines of graphs saved by older versions (lists of
+    mwlib.Message) in place
+    """
+    timelines = g.es[time_label]
+    if len(timelines) and not isinstance(timelines[0], Timeline):
+        g.es[time_label] = [Timeline.from_messages(msgs)
+                            for msgs in timelines]
+
+
+def from_arrays(times, welcomes, offsets):
+    """
+    Returns the list of Timeline of the edges, given the times (sorted for
+    every edge) and the welcome flags of all the messages (NumPy arrays):
+    the messages of edge i are in [offsets[i], offsets[i + 1]).
+
+    >>> from_arrays(numpy.array([1, 2, 3]), numpy.array([0, 0, 1]),
+    ...             numpy.array([0, 2, 3]))
+    [Timeline([1, 2], welcomes=0), Timeline([3], welcomes=1)]
+    """
+    starts = numpy.asarray(offsets[:-1])
+
+    ## welcome flags are rare: set the bits of the messages having it
+    bits = {}
+    welcomes = numpy.flatnonzero(welcomes)
+    edges = numpy.searchsorted(starts, welcomes, side='right') - 1
+    for edge, i in zip(edges.tolist(), (welcomes - starts[edges]).tolist()):
+        bits[edge] = bits.get(edge, 0) | 1 << i
+    del welcomes, edges
+
+    ## slicing a string is much faster than slicing a NumPy array
+    data = numpy.asarray(times, dtype=numpy.int32).tostring()
+    offsets = (numpy.asarray(offsets) * 4).tolist()
+    return [Timeline(array('i', data[start:end]), bits.get(edge, 0))
+            for edge, (start, end) in enumerate(zip(offsets[:-1],
+                                                     offsets[1:]))]
+
+
+def to_arrays(timelines):
+    """
+    Inverse of from_arrays(): returns times, welcome flags and offsets of
+    the list of Timeline timelines
+
+    >>> times, welcomes, offsets = to_arrays(
+    ...     [Timeline([1, 2]), Timeline([3], 1)])
+    >>> times.tolist(), welcomes.tolist(), offsets.tolist()
+    ([1, 2, 3], [False, False, True], [0, 2, 3])
+    """
+    offsets = numpy.zeros(len(timelines) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(tl) for tl in timelines], out=offsets[1:])
+    times = numpy.frombuffer(''.join(tl.times.tostring() for tl in timelines),
+                             dtype=numpy.int32)
+    welcomes = numpy.zeros(len(times), dtype=bool)
+    for start, tl in zip(offsets.tolist(), timelines):
+        bits, i = tl.welcomes, start
+        while bits:
+            if bits & 1:
+                welcomes[i] = True
+            bits >>= 1
+            i += 1
+    return times, welcomes, offsets
+
+
+class TimeIndex(object):
+    """
+    Index of the messages of all the edges of a graph, for time slices
+    computed without touching the graph: edge i goes from sources[i] to
+    targets[i] and its messages (sorted) are times[offsets[i]:offsets[i + 1]].
+
+    Every time is shifted by the position of its edge, so that all the
+    messages are sorted in one array: a slice is a single searchsorted().
+
+    >>> index = TimeIndex([0, 1, 1], [1, 0, 2], [1, 5, 2, 3, 9],
+    ...                   [0, 2, 4, 5])
+    >>> index.slice(start=1).weights.tolist()
+    [1, 2, 1]
+    >>> s = index.slice(start=2, end=9)
+    >>> s.weights.tolist(), s.eids.tolist(), s.vertices.tolist()
+    ([1, 1, 0], [0, 1], [0, 1])
+    """
+    def __init__(self, sources, targets, times, offsets):
+        self.sources = numpy.asarray(sources, dtype=numpy.int32)
+        self.targets = numpy.asarray(targets, dtype=numpy.int32)
+        self.times = numpy.asarray(times, dtype=numpy.int32)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        if len(self.times):
+            self.start = int(self.times.min())
+            self.end = int(self.times.max())
+        else:
+            self.start = self.end = 0
+        ## times of edge i are in [i * span, (i + 1) * span)
+        self.span = self.end - self.start + 3
+        edges = numpy.repeat(numpy.arange(len(self.sources),
+                                          dtype=numpy.int64),
+                             numpy.diff(self.offsets))
+        self.keys = edges * self.span + (self.times - self.start + 1)
+        del edges
+
+    @classmethod
+    def from_graph(cls, g, time_label='timestamp'):
+        """
+        Index of the igraph.Graph g, whose time_label edge attribute is made
+        of Timeline. Edge ids are the ones of g.
+        """
+        edges = numpy.array(g.get_edgelist(), dtype=numpy.int32).reshape(-1,
+                                                                          2)
+        times, _, offsets = to_arrays(g.es[time_label])
+        return cls(edges[:, 0], edges[:, 1], times, offsets)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _key(self, time, default):
+        """
+        Position of time in the span of every edge
+        """
+        if time is None:
+            return default
+        return min(max(to_epoch(time) - self.start + 1, 0), self.span - 1)
+
+    def slice(self, start=None, end=None):
+        """
+        Returns the TimeSlice of the messages strictly between start and end
+        (datetime or seconds since the epoch, None means no limit)
+        """
+        base = numpy.arange(len(self), dtype=numpy.int64) * self.span
+        lo = numpy.searchsorted(self.keys, base + self._key(start, 0),
+                                side='right')
+        hi = numpy.searchsorted(self.keys,
+                                base + self._key(end, self.span - 1),
+                                side='left')
+        return TimeSlice(self, lo, hi)
+
+
+class TimeSlice(object):
+    """
+    Messages of the edges of a TimeIndex in a time window: for edge i they
+    are index.times[lo[i]:hi[i]]. It's a view: the graph and the index are
+    not changed or copied.
+    """
+    def __init__(self, index, lo, hi):
+        self.index = index
+        self.lo = lo
+        self.hi = hi
+        self.weights = hi - lo
+
+    @property
+    def eids(self):
+        """
+        Ids of the edges with messages in the window
+        """
+        return numpy.flatnonzero(self.weights)
+
+    @property
+    def vertices(self):
+        """
+        Ids of the vertices with edges in the window
+        """
+        eids = self.eids
+        return numpy.union1d(self.index.sources[eids],
+                             self.index.targets[eids])
+
+    def times(self, eid):
+        """
+        Times of the messages of edge eid in the window
+        """
+        return self.index.times[self.lo[eid]:self.hi[eid]]
+
+    def subgraph(self, g, weight_label='weight', time_label='timestamp'):
+        """
+        Returns a new igraph.Graph with the edges of g (the indexed graph)
+        having messages in the window, weighted with their number. Like
+        Graph.time_slice_subgraph(), their time_label attribute (if g has
+        it) keeps the messages in the window only.
+        """
+        eids = self.eids
+        h = g.subgraph_edges(eids.tolist(), delete_vertices=True)
+        h.es[weight_label] = self.weights[eids].tolist()
+        if time_label in h.es.attributes():
+            ## positions of the window in the timeline of every edge
+            offsets = self.index.offsets[eids]
+            h.es[time_label] = [
+                tl[lo:hi] for tl, lo, hi in zip(
+                    h.es[time_label], (self.lo[eids] - offsets).tolist(),
+                    (self.hi[eids] - offsets).tolist())]
+        return h
@@ -0,0 +1,63 @@
+from sonet.distance import all_pairs, average_distance, efficiency, estimate
+from sonet.graph import Graph
+import igraph as ig
+import numpy
+import random
+import unittest
+
+
+class TestDistance(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)  # igraph uses the random module
+        g = ig.Graph.Erdos_Renyi(n=200, m=600, directed=True)
+        g.es['length'] = [random.uniform(0.1, 2.) for _ in g.es]
+        self.g = g
+        self.n = len(g.vs)
+
+    def _matrix(self, weight=None):
+        m = numpy.array(self.g.shortest_paths(weights=weight), dtype=float)
+        numpy.fill_diagonal(m, numpy.inf)
+        return m
+
+    def test_exact(self):
+        for weight in (None, 'length'):
+            m = self._matrix(weight)
+            finite = numpy.isfinite(m)
+            self.assertAlmostEquals(average_distance(self.g, weight),
+                                    m[finite].mean())
+            self.assertAlmostEquals(efficiency(self.g, weight),
+                                    (1. / m).sum() / (self.n * (self.n - 1)))
+        self.assertAlmostEquals(average_distance(self.g),
+                                self.g.average_path_length())
+
+    def test_parallel(self):
+        for value, expected in zip(all_pairs(self.g, 'length', processes=3,
+                                             block=7),
+                                   all_pairs(self.g, 'length')):
+            self.assertAlmostEquals(value, expected)
+        self.assertAlmostEquals(Graph(self.g).averageDistance(processes=2),
+                                average_distance(self.g))
+
+    def test_estimate(self):
+        exact = average_distance(self.g, 'length')
+        e = estimate(self.g, 'distance', 'length', seed=0)
+        self.assertEquals(e.samples, self.n)
+        self.assertAlmostEquals(e.value, exact)
+        self.assertAlmostEquals(e.low, e.high)
+
+        e = estimate(self.g, 'distance', 'length', samples=60, seed=0)
+        self.assertEquals(e.samples, 60)
+        self.assertTrue(e.low < exact < e.high)
+
+        exact = efficiency(self.g)
+        e = estimate(self.g, 'efficiency', accuracy=.05, seed=0, processes=2)
+        self.assertTrue(e.samples < self.n)
+        self.assertTrue(e.high - e.low <= .1 * e.value)
+        self.assertTrue(e.low < exact < e.high)
+
+        self.assertRaises(ValueError, estimate, self.g, 'diameter')
+
+
+if __name__ == '__main__':
+    unittest.main()
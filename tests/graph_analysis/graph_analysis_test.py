@@ -0,0 +1,89 @@
+from graph_analysis import Analysis, analyse, batch, create_option_parser
+import igraph as ig
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)  # igraph uses the random module
+        g = ig.Graph.Erdos_Renyi(n=100, m=400, directed=True)
+        g.es['weight'] = [random.randint(1, 9) for _ in g.es]
+        g.vs['username'] = ['U%d' % (i, ) for i in xrange(len(g.vs))]
+        for attr in ('anonymous', 'bot', 'bureaucrat', 'founder', 'steward',
+                     'sysop', 'blocked'):
+            g.vs[attr] = [random.random() < .2 for _ in g.vs]
+        self.dir = tempfile.mkdtemp()
+        self.fns = [os.path.join(self.dir, '%swiki-20100307-stub-meta-'
+                                 'history.pickle' % (lang, ))
+                    for lang in ('vec', 'it')]
+        for fn in self.fns:
+            g.write_pickle(fn)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _options(self, args):
+        options, _ = create_option_parser().parse_args(args.split())
+        return options
+
+    def test_batch(self):
+        metric_sets = [self._options('--group -der --distance'),
+                       self._options('-c all'),
+                       self._options('--group -c degree -d')]
+        results = list(batch(self.fns, metric_sets))
+        self.assertEquals([(fn, options) for fn, options, _ in results],
+                          [(fn, options) for fn in self.fns
+                           for options in metric_sets])
+
+        for fn, options, r in results:
+            expected = analyse(Analysis(fn), options)
+            self.assertEquals(list(r.lines()), list(expected.lines()))
+
+        r = results[0][2]
+        self.assertEquals(r.get('lang'), 'vec')
+        self.assertEquals(r.get('nodes number'), 100)
+        self.assertEquals(r.get('nodes number', 'all'), 100)
+        self.assertTrue(0 < r.get('density', 'bot') < 1)
+        self.assertRaises(KeyError, r.get, 'density')
+        ## without --group only 'all' is analysed
+        self.assertEquals(set(item[0] for item in results[1][2].items
+                              if item[0] is not None), set(['all']))
+
+    def test_sampled(self):
+        a = Analysis(self.fns[0])
+        interval = 'average distance in the giant component (95% confidence ' \
+                   'interval)'
+        for args in ('--samples 10', '--accuracy 0.5', '--time-budget 0'):
+            r = analyse(a, self._options('--distance ' + args))
+            ## --save-db can't save the intervals
+            self.assertFalse([l for l in r.lines(table=True)
+                              if 'interval' in l])
+            self.assertEquals(len(list(r.lines(table=False))), 2)
+            self.assertTrue(r.get(interval)[2] > 0)
+        r = analyse(a, self._options('--distance'))
+        self.assertRaises(KeyError, r.get, interval)
+
+    def test_shared(self):
+        a = Analysis(self.fns[0])
+        analyse(a, self._options('--distance -c all'))
+        giant, bw = a.giant(), a.g.g.vs['bw']
+        a.g.g.vs['bw'] = [0] * len(bw)
+        cwd = os.getcwd()
+        os.chdir(self.dir)  # the matrices are written there
+        try:
+            r = analyse(a, self._options('-a -c betweenness'))
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(a.giant() is giant)
+        self.assertEquals(r.get('average betweenness', 'all'), 0)
+        self.assertEquals(r.files, ['vecwiki-20100307-adj.csv',
+                                    'vecwiki-20100307-rec.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
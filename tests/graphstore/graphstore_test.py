@@ -0,0 +1,66 @@
+from sonet.graphstore import write_graph, read_graph, is_graph_dir
+from sonet.graph import load
+from sonet.timeline import Timeline
+import igraph as ig
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def edges(g):
+    return sorted((g.vs[e.source]['username'], g.vs[e.target]['username'],
+                   e['weight'], e['timestamp'], e['template'])
+                  for e in g.es)
+
+
+class TestGraphStore(unittest.TestCase):
+
+    def setUp(self):
+        g = ig.Graph(n=5, edges=[(2, 1), (0, 1), (2, 0), (3, 3)],
+                     directed=True)
+        g.vs['username'] = ['A', 'B\xc3\xa8', 'C', '10.0.0.1', 'E']
+        g.vs['bot'] = [True, None, False, False, True]
+        g.vs['anonymous'] = [False, False, False, True, False]
+        g.es['weight'] = [2, 1, 0, 3]
+        g.es['timestamp'] = [Timeline([1, 2], 2), Timeline([3]),
+                             Timeline(), Timeline([5, 6, 7], 5)]
+        g.es['template'] = [u'yes', u'no \xe8', u'', u'no']
+        g['lang'] = 'vec'
+        self.g = g
+
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'vecwiki-20100307.graph')
+        write_graph(g, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_read(self):
+        self.assertTrue(is_graph_dir(self.path))
+        g = read_graph(self.path)
+        self.assertTrue(g.is_directed())
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(g['lang'], 'vec')
+        for attr in ('username', 'bot', 'anonymous'):
+            self.assertEquals(g.vs[attr], self.g.vs[attr])
+        self.assertEquals(edges(g), edges(self.g))
+
+    def test_read_attributes(self):
+        g = load(self.path, vertex_attributes=('username', ),
+                 edge_attributes=('weight', 'missing')).g
+        self.assertEquals(g.vs.attributes(), ['username'])
+        self.assertEquals(g.es.attributes(), ['weight'])
+        self.assertEquals(sorted(g.es['weight']), [0, 1, 2, 3])
+
+    def test_undirected(self):
+        g = self.g.as_undirected(combine_edges='first')
+        write_graph(g, self.path)
+        self.assertFalse(read_graph(self.path).is_directed())
+        self.assertEquals(len(read_graph(self.path).es), len(g.es))
+
+
+if __name__ == "__main__":
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestGraphStore)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
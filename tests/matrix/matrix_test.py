@@ -0,0 +1,95 @@
+from sonet.matrix import adjacency, reciprocity, write_dense, write_matrix
+from sonet.graph import Graph
+from StringIO import StringIO
+import igraph as ig
+import numpy
+import os
+import random
+import tempfile
+import unittest
+
+
+class TestMatrix(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)  # igraph uses the random module
+        g = ig.Graph.Erdos_Renyi(n=50, m=300, directed=True)
+        g.add_edges([(0, 0), (3, 3)])
+        g.es['weight'] = [random.randint(1, 9) for _ in g.es]
+        g.vs['username'] = ['U%d' % (i, ) for i in xrange(len(g.vs))]
+        self.g = g
+        self.n = len(g.vs)
+
+    def _dense(self, rows, cols, values):
+        m = numpy.zeros((self.n, self.n), dtype=values.dtype)
+        m[rows, cols] = values
+        return m
+
+    def test_adjacency(self):
+        expected = numpy.array(self.g.get_adjacency(
+            ig.GET_ADJACENCY_BOTH, 'weight', 0).data)
+        m = self._dense(*adjacency(self.g, 'weight'))
+        self.assertTrue((m == expected).all())
+
+        u = self.g.as_undirected(mode='each')
+        m = self._dense(*adjacency(u))
+        self.assertTrue((m == m.T).all())
+        self.assertEquals(m.sum() - m.trace(), 2 * (len(u.es) - 2))
+
+    def test_reciprocity(self):
+        a = self._dense(*adjacency(self.g)) > 0
+        m = self._dense(*reciprocity(self.g))
+        self.assertTrue((m == (a & a.T)).all())
+        self.assertEquals(m[0, 0], 1)
+
+    def test_dense(self):
+        rows, cols, values = adjacency(self.g, 'weight')
+        m = self._dense(rows, cols, values)
+        f = StringIO()
+        write_dense(f, self.g.vs['username'], rows, cols, values, block=7)
+        lines = f.getvalue().splitlines()
+        self.assertEquals(len(lines), self.n + 2)
+        self.assertEquals(lines[0].split(',')[-1], 'TOTAL')
+        self.assertEquals(lines[5].split(','),
+                          ['U4'] + [str(v) for v in m[4]] + [str(m[4].sum())])
+        self.assertEquals(lines[-1].split(','), ['TOTAL'] +
+                          [str(v) for v in m.sum(axis=0)] + [str(m.sum())])
+
+    def test_sparse(self):
+        rows, cols, values = adjacency(self.g, 'weight')
+        d = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(d, 'adj.npz')
+            Graph(self.g).writeAdjacencyMatrix(fn, 'username', fmt='npz')
+            npz = numpy.load(fn)
+            self.assertEquals(npz['shape'].tolist(), [self.n, self.n])
+            self.assertEquals(npz['indices'].tolist(), cols.tolist())
+            self.assertEquals(npz['data'].tolist(), values.tolist())
+            self.assertEquals(npz['indptr'][1:].tolist(), numpy.searchsorted(
+                rows, numpy.arange(self.n), side='right').tolist())
+
+            fn = os.path.join(d, 'adj.mtx')
+            Graph(self.g).writeAdjacencyMatrix(fn, 'username', fmt='mtx')
+            lines = open(fn).read().splitlines()
+            self.assertEquals(lines[1], '%d %d %d' % (self.n, self.n,
+                                                      len(values)))
+            self.assertEquals(lines[2], '%d %d %d' % (rows[0] + 1,
+                                                      cols[0] + 1, values[0]))
+
+            fn = os.path.join(d, 'adj.csv')
+            Graph(self.g).writeAdjacencyMatrix(fn, 'username', fmt='coo')
+            lines = open(fn).read().splitlines()
+            self.assertEquals(len(lines), len(values))
+            self.assertEquals(lines[0], 'U%d,U%d,%d' % (rows[0], cols[0],
+                                                        values[0]))
+        finally:
+            for name in os.listdir(d):
+                os.remove(os.path.join(d, name))
+            os.rmdir(d)
+
+        self.assertRaises(ValueError, write_matrix, None, [], rows, cols,
+                          values, 'xls')
+
+
+if __name__ == '__main__':
+    unittest.main()
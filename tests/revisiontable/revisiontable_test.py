@@ -0,0 +1,68 @@
+from sonet.revisiontable import RevisionExtractorPageProcessor, \
+     RevisionTable, write_revision_table, TAGS
+import sonet.mediawiki as mwlib
+from sonet.lib import open_dump
+from datetime import datetime
+import shutil
+import tempfile
+import unittest
+
+
+class TestRevisionTable(unittest.TestCase):
+
+    def setUp(self):
+        xml = "tests/utpedits2graph/" + \
+              "vecwiki-20100307-stub-meta-history-TEST.xml.bz2"
+        src = open_dump(xml)
+        tag = mwlib.get_tags(src, tags=TAGS)
+        namespaces = dict((name.decode('utf-8'), int(key))
+                          for key, name in mwlib.get_namespaces(src))
+        processor = RevisionExtractorPageProcessor(tag=tag,
+                                                   namespaces=namespaces)
+        processor.start(src)
+
+        self.path = tempfile.mkdtemp()
+        write_revision_table(self.path, processor)
+        self.table = RevisionTable(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_columns(self):
+        table = self.table
+        self.assertEquals(len(table.page_id), 4)
+        self.assertEquals(list(table.page_ns), [3] * 4)
+        self.assertEquals(table.page_id[0], 9)
+        self.assertEquals(len(table), len(table.timestamp))
+
+        first = table.revisions().next()
+        self.assertEquals(first.title, u'Discussion utente:Skafa')
+        self.assertEquals(first.rev_id, 13)
+        self.assertEquals(first.timestamp, datetime(2005, 10, 24, 13, 59, 33))
+        self.assertEquals((first.user, first.user_id), (u'Skafa', 4))
+        self.assertFalse(first.minor)
+
+    def test_mask(self):
+        table = self.table
+        anonymous = list(table.revisions(table.mask(anonymous=True)))
+        self.assertTrue(anonymous)
+        self.assertTrue(all(r.user_id == -1 for r in anonymous))
+        self.assertEquals(anonymous[0].user, u'147.162.44.54')
+
+        self.assertEquals(table.mask(namespaces=(0,)).sum(), 0)
+        self.assertEquals(table.mask(end=datetime(2005, 10, 24, 14)).sum(), 1)
+        minor = table.mask(minor=True)
+        self.assertTrue(all(r.minor for r in table.revisions(minor)))
+
+        edits = table.edits_per_user()
+        self.assertEquals(edits.sum(), (table.user >= 0).sum())
+        self.assertEquals(edits[table.user_index(u'Skafa')],
+                          sum(1 for r in table.revisions()
+                              if r.user == u'Skafa'))
+
+
+if __name__ == "__main__":
+    suite = unittest.defaultTestLoader.loadTestsFromTestCase(
+        TestRevisionTable)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
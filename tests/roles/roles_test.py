@@ -0,0 +1,63 @@
+from sonet.graph import Graph
+from sonet.roles import Roles
+import igraph as ig
+import random
+import unittest
+
+ROLES = ('anonymous', 'bot', 'bureaucrat', 'founder', 'steward', 'sysop',
+         'blocked')
+
+
+class TestRoles(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(0)
+        g = ig.Graph(n=500, directed=True)
+        for attr in ROLES:
+            g.vs[attr] = [rnd.random() < .2 for _ in g.vs]
+        g.vs['username'] = ['U%d' % (i, ) for i in xrange(len(g.vs))]
+        self.g = g
+
+    def test_select(self):
+        from graph_analysis import groups
+
+        roles = Roles(self.g)
+        for name, attr in groups.iteritems():
+            self.assertEquals(roles.select(attr).tolist(),
+                              self.g.vs.select(**attr).indices, name)
+        self.assertEquals(roles.select({'bot': True, 'bot_ne': True}).size,
+                          0)
+        self.assertEquals(roles.select({'bot_ne': False}).tolist(),
+                          self.g.vs.select(bot=True).indices)
+        for attr in ({'_degree': 0}, {'bot_gt': True}, {'bot': 1}):
+            self.assertRaises(ValueError, roles.select, attr)
+        self.assertRaises(KeyError, roles.select, {'nothere': True})
+
+    def test_graph(self):
+        g = Graph(self.g)
+        classes = ('anonymous', 'bot', 'bureaucrat', 'sysop')
+        expected = []
+        for v in self.g.vs:
+            cls = [c for c in classes if v[c]]
+            expected.append((v['username'],
+                             cls[0] if cls else 'normal user'))
+        self.assertEquals(list(g.get_user_class('username', classes)),
+                          expected)
+
+        g.set_role(classes)
+        self.assertEquals(self.g.vs['role'], [cls for _, cls in expected])
+
+        g.defineClass('sysop', {'sysop': True, 'bot_ne': True})
+        g.defineClass('big', {'_indegree': 0, 'bot': True})
+        self.assertEquals(g.classes['sysop'].indices,
+                          self.g.vs.select(sysop=True, bot_ne=True).indices)
+        self.assertEquals(g.classes['big'].indices,
+                          self.g.vs.select(bot=True).indices)
+
+        g.remove_if(('bot', ))
+        self.assertEquals(len(g.g.vs), len(self.g.vs.select(bot_ne=True)))
+        self.assertEquals(len(g.select({'bot': True})), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+from sonet.scheduler import Job, Scheduler, Step, load_status, wiki_job
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.status = self.path('status.json')
+        self.order = self.path('order.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def step(self, name, inputs, outputs, code='', exit=0, stdout=None):
+        """
+        A step appending name to the order file and writing its outputs
+        (but stdout)
+        """
+        files = [fn for fn in outputs if fn != stdout]
+        code = ("import sys\n"
+                "open(%r, 'a').write(%r + '\\n')\n"
+                "for fn in %r: open(fn, 'w').write('x')\n"
+                "%s\n"
+                "sys.exit(%d)\n" % (self.order, name, files, code, exit))
+        return Step(name, [sys.executable, '-c', code], inputs, outputs,
+                    stdout=stdout)
+
+    def job(self, name, size, exit=0):
+        inp, out = self.path(name + '.in'), self.path(name + '.out')
+        open(inp, 'w').write('x')
+        return Job(name, [self.step(name + '-1', [inp], [out]),
+                          self.step(name + '-2', [out],
+                                    [self.path(name + '.txt')],
+                                    'print "hello"', exit,
+                                    stdout=self.path(name + '.txt'))], size)
+
+    def run_jobs(self, jobs, **kwargs):
+        if os.path.exists(self.order):
+            os.remove(self.order)
+        kwargs.setdefault('poll', .01)
+        failed = Scheduler(self.status, **kwargs).run(jobs)
+        if not os.path.exists(self.order):
+            return failed, []
+        return failed, open(self.order).read().split()
+
+    def test_order(self):
+        jobs = [self.job('small', 1), self.job('big', 3),
+                self.job('medium', 2)]
+        failed, order = self.run_jobs(jobs, processes=1)
+        self.assertEquals(failed, [])
+        self.assertEquals(order, ['big-1', 'big-2', 'medium-1', 'medium-2',
+                                  'small-1', 'small-2'])
+        self.assertEquals(open(self.path('big.txt')).read(), 'hello\n')
+
+        status = load_status(self.status)
+        self.assertEquals(sorted(status), ['big', 'medium', 'small'])
+        self.assertEquals(status['big']['big-2']['status'], 'done')
+
+        ## all up to date
+        failed, order = self.run_jobs(jobs, processes=2)
+        self.assertEquals(order, [])
+        os.utime(self.path('medium.out'), None)
+        failed, order = self.run_jobs(jobs, processes=2)
+        self.assertEquals(order, ['medium-2'])
+
+    def test_memory(self):
+        jobs = [self.job('a', 10), self.job('b', 6), self.job('c', 5)]
+        self.run_jobs(jobs, processes=3, memory=12)
+        status = load_status(self.status)
+        start = lambda name: status[name][name + '-1']['start']
+        end = lambda name: status[name][name + '-2']['end']
+        ## b and c fit together, a runs alone
+        self.assertTrue(end('a') <= start('b'))
+        self.assertTrue(end('a') <= start('c'))
+        self.assertTrue(start('c') < end('b') and start('b') < end('c'))
+
+    def test_blocked(self):
+        jobs = [self.job('huge', 20), self.job('a', 6), self.job('b', 5)] + \
+               [self.job('s%d' % (i, ), 1) for i in xrange(6)]
+        self.run_jobs(jobs, processes=4, memory=10)
+        status = load_status(self.status)
+        start = lambda name: status[name][name + '-1']['start']
+        end = lambda name: status[name][name + '-2']['end']
+        small = ['s%d' % (i, ) for i in xrange(6)]
+        ## huge is larger than the memory: it runs alone, first
+        self.assertTrue(all(end('huge') <= start(name)
+                            for name in ['a', 'b'] + small))
+        ## b doesn't fit with a: the small jobs wait for it
+        self.assertTrue(end('a') <= start('b'))
+        self.assertTrue(all(start('b') <= start(name) for name in small))
+
+    def test_failure(self):
+        jobs = [self.job('ok', 1), self.job('ko', 2, exit=3)]
+        failed, order = self.run_jobs(jobs, processes=2)
+        self.assertEquals(failed, ['ko'])
+        self.assertFalse(os.path.exists(self.path('ko.txt')))
+        status = load_status(self.status)
+        self.assertEquals(status['ko']['ko-2']['status'], 'failed')
+        self.assertEquals(status['ko']['ko-2']['returncode'], 3)
+
+        ## failed steps run again
+        failed, order = self.run_jobs(jobs, processes=2)
+        self.assertEquals(order, ['ko-2'])
+
+        job = Job('missing', [Step('x', [self.path('nothere')], [], [])])
+        failed, _ = self.run_jobs([job])
+        self.assertEquals(failed, ['missing'])
+
+    def test_wiki_job(self):
+        fn = self.path('vecwiki-20100307-stub-meta-history.xml.bz2')
+        open(fn, 'w').write('dump')
+        job = wiki_job(fn, source='/src')
+        self.assertEquals(job.size, 4)
+        self.assertEquals([step.name for step in job.steps],
+                          ['graph', 'enrich', 'analysis'])
+        graph, enrich, analysis = job.steps
+        self.assertEquals(graph.args[1:], ['/src/utpedits2graph.py', fn])
+        self.assertEquals(graph.outputs, enrich.inputs)
+        self.assertEquals(enrich.outputs, analysis.inputs)
+        self.assertEquals(analysis.inputs, [self.path(
+            'vecwiki-20100307-stub-meta-history_rich.pickle')])
+
+        job = wiki_job(analysis.inputs[0], analysis_options=['-d'])
+        self.assertEquals([step.name for step in job.steps], ['analysis'])
+        self.assertEquals(job.steps[0].args[2:], ['-d', analysis.inputs[0]])
+
+        ## graphs saved by utpedits2graph.py -f binary are directories
+        job = wiki_job(fn, graph_options=['-f', 'binary'])
+        graph, enrich, analysis = job.steps
+        rich = self.path('vecwiki-20100307-stub-meta-history_rich.graph')
+        self.assertEquals(enrich.args[-1], self.path(
+            'vecwiki-20100307-stub-meta-history.graph'))
+        self.assertEquals(graph.outputs, enrich.inputs)
+        self.assertEquals(enrich.outputs, analysis.inputs)
+        self.assertEquals(analysis.inputs, [os.path.join(rich, 'graph.json')])
+        self.assertEquals(analysis.args[-1], rich)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,36 @@
-from utpedits2graph import HistoryPageProcessor
+from utpedits2graph import HistoryPageProcessor, update_graph, latest_time
 import sonet.mediawiki as mwlib
-from sonet.lib import find_open_for_this_file
+import sonet.bz2blocks
+from sonet.lib import find_open_for_this_file, open_dump, \
+     BZ2SeekableFileExt
+from sonet.mediawiki.pageindex import iter_index, read_index, \
+     index_filename
+from sonet.bz2blocks import build_block_table, BZ2SeekableFile, \
+     write_block_table, block_table_filename
+from sonet.chunked import convert
+from sonet.mediawiki.pageprocessor import read_checkpoint
+from sonet.edgecache import EdgeCache, ArrayEdgeCache, SpillingEdgeCache
+from sonet.timeline import Timeline
+from sonet.graph import Graph
+from sonet.graphstore import write_graph, read_graph, read_time_index
+from sonet.sliding import SlidingWindow, Messages, window_stats, \
+     parallel_windows, SLIDING_METRICS
+import cPickle as pickle
 from collections import defaultdict
+from datetime import timedelta
+import os
+import shutil
+import signal
+import tempfile
 from django.utils.encoding import smart_str
 import unittest
 
 
+def edges(g):
+    return sorted((g.vs[e.source]['username'], g.vs[e.target]['username'],
+                   e['timestamp']) for e in g.es)
+
+
 class TestUTPEdits(unittest.TestCase):
 
     def setUp(self):
@@ -17,10 +42,7 @@ class TestUTPEdits(unittest.TestCase):
         welcome = defaultdict(str)
         welcome.update({'it': r'Benvenut',
                         'en': r'Welcome'})
-        if _lineno:
-            src = deflate(xml, 51)  # Read first 51 lines to extract namespaces
-        else:
-            src = deflate(xml)
+        src = open_dump(xml)
         tag = mwlib.get_tags(src,
                         tags='page,title,revision,timestamp,contributor,'
                                   'username,ip,comment,id')
@@ -32,14 +54,18 @@ class TestUTPEdits(unittest.TestCase):
         except UnicodeDecodeError:
             lang_user = smart_str(translations['User'])
             lang_user_talk = smart_str(translations['User talk'])
-        src.close()
-        src = deflate(xml)
+        self.xml, self.deflate = xml, deflate
         self.processor = HistoryPageProcessor(tag=tag,
                          user_talk_names=(lang_user_talk, u"User talk"))
         self.processor.welcome_pattern = welcome[self.lang]
+        ## the header has been sniffed, the same stream is parsed
         self.processor.start(src)
         self.g = self.processor.get_network()
 
+        self.parallel_processor = HistoryPageProcessor(tag=tag,
+                         user_talk_names=(lang_user_talk, u"User talk"))
+        self.parallel_processor.welcome_pattern = welcome[self.lang]
+
     def test_graph(self):
         self.assertEquals(len(self.g.vs), 7)  # Nodes
         self.assertEquals(len(self.g.es), 9)  # Edges
@@ -49,6 +75,374 @@ class TestUTPEdits(unittest.TestCase):
         # Self-loop
         self.assertEquals(1, len([edge for edge in self.g.es \
                                   if edge.target == edge.source]))
+        self.assertEquals(self.g.es['weight'],
+                          [len(ts) for ts in self.g.es['timestamp']])
+
+    def test_fast_forward(self):
+        # Every page of the test dump is a UTP
+        self.assertEquals(self.processor.bytes_skipped, 0)
+        processor = HistoryPageProcessor(tag=self.processor.tag,
+                                         user_talk_names=(u"User talk",))
+        processor.start(self.deflate(self.xml))
+        self.assertEquals(processor.count, 0)
+        self.assertTrue(processor.bytes_skipped > processor.bytes_parsed)
+
+        processor = self.parallel_processor
+        processor.fast_forward = False
+        processor.start(self.deflate(self.xml))
+        g = processor.get_network()
+        self.assertEquals(processor.bytes_skipped, 0)
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(len(g.es), len(self.g.es))
+        self.assertEquals(processor.count, self.processor.count)
+
+    def test_index(self):
+        index = list(iter_index(self.deflate(self.xml)))
+        self.assertEquals(len(index), 4)
+        self.assertEquals(set(entry.ns for entry in index), set([3]))
+
+        ## every UTP is followed by a copy in the Discussion namespace
+        data = self.deflate(self.xml).read()
+        first, footer = data.index('  <page>'), data.rindex('</mediawiki>')
+        pages = ['  <page>' + page
+                 for page in data[first:footer].split('  <page>')[1:]]
+        data = data[:first] + ''.join(
+            page + page.replace('<title>Discussion utente:',
+                                '<title>Discussion:')
+            for page in pages) + data[footer:]
+        from cStringIO import StringIO
+        index = list(iter_index(StringIO(data)))
+        self.assertEquals([entry.ns for entry in index], [3, 1] * 4)
+
+        processor = self.parallel_processor
+        processor.start(StringIO(data), index=index, namespaces=(3,))
+        g = processor.get_network()
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(len(g.es), len(self.g.es))
+        self.assertEquals(processor.count, self.processor.count)
+        ## the Discussion pages are not even parsed
+        self.assertEquals(processor.pages_parsed, 4)
+        self.assertEquals(processor.bytes_parsed,
+                          sum(entry.length for entry in index
+                              if entry.ns == 3))
+        self.assertTrue(processor.bytes_skipped >= sum(
+            entry.length for entry in index[:-1] if entry.ns == 1))
+
+    def test_tree_freed(self):
+        from cStringIO import StringIO
+        from sonet.mediawiki.pageprocessor import PageProcessor
+        xml = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.4/">'
+               '\n<siteinfo></siteinfo>\n<page>\n<title>A</title>\n' +
+               ''.join('<revision><id>%d</id><timestamp>2010-01-01T00:00:00Z'
+                       '</timestamp><text>%s</text></revision>\n' % (
+                           i, 'x' * 1000) for i in xrange(50)) +
+               '</page>\n</mediawiki>\n')
+        tag = mwlib.get_tags(StringIO(xml), 'page,revision,timestamp,text')
+        kept = []
+
+        class Processor(PageProcessor):
+            ## <text> has no handler
+            def process_timestamp(self, elem):
+                revision = elem.getparent()
+                kept.append(sum(len(text.text or '')
+                                for previous in revision.itersiblings(
+                                    preceding=True)
+                                for text in previous.iter(tag['text'])))
+
+        Processor(tag=tag).start(StringIO(xml))
+        self.assertEquals(len(kept), 50)
+        ## the text of the revisions already parsed is freed
+        self.assertEquals(max(kept), 0)
+
+    def test_block_table(self):
+        blocks = build_block_table(self.xml)
+        src = BZ2SeekableFile(self.xml, blocks)
+        self.assertEquals(src.read(), self.deflate(self.xml).read())
+
+        index = list(iter_index(self.deflate(self.xml)))
+        processor = self.parallel_processor
+        processor.start(BZ2SeekableFile(self.xml, blocks), index=index,
+                        titles=[entry.title for entry in index[2:]])
+        self.assertEquals(processor.count, 2)
+
+        ## magics found by chance in the compressed data of the first block
+        find_magic = sonet.bz2blocks.find_magic
+
+        def false_magics(f, magic):
+            offsets = list(find_magic(f, magic))
+            if magic == sonet.bz2blocks.BLOCK_MAGIC:
+                offsets.append(blocks[0].bit_offset + 1000)
+            else:
+                offsets.append(blocks[0].bit_offset + 2000)
+            return iter(sorted(offsets))
+
+        sonet.bz2blocks.find_magic = false_magics
+        try:
+            self.assertEquals(build_block_table(self.xml), blocks)
+        finally:
+            sonet.bz2blocks.find_magic = find_magic
+
+        ## the table is used only to seek: sequential reads use lbzip2
+        tmp = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmp, os.path.basename(self.xml))
+            shutil.copy(self.xml, fn)
+            write_block_table(block_table_filename(fn), blocks)
+            self.assertNotEquals(find_open_for_this_file(fn)[0],
+                                 BZ2SeekableFileExt)
+            self.assertEquals(find_open_for_this_file(fn, seek=True)[0],
+                              BZ2SeekableFileExt)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_native(self):
+        processor = self.parallel_processor
+        processor.start(open_dump(self.xml, native=True))
+        g = processor.get_network()
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(len(g.es), len(self.g.es))
+        self.assertEquals(processor.count, self.processor.count)
+
+    def test_chunked(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            fn = os.path.join(tmp, os.path.basename(self.xml)[:-4] + '.gz')
+            chunks = convert(self.deflate(self.xml), fn, pages=1)
+            self.assertEquals(len(chunks), 6)  # header, 4 pages, footer
+
+            for parallel in (False, True):
+                processor = HistoryPageProcessor(tag=self.processor.tag,
+                    user_talk_names=self.processor.user_talk_names)
+                if parallel:
+                    processor.start_parallel(open_dump(fn), processes=2,
+                                             shard_size=1)
+                else:
+                    processor.start(open_dump(fn),
+                        index=read_index(index_filename(fn)), namespaces=(3,))
+                g = processor.get_network()
+                self.assertEquals(len(g.vs), len(self.g.vs))
+                self.assertEquals(len(g.es), len(self.g.es))
+                self.assertEquals(processor.count, self.processor.count)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_checkpoint(self):
+        fn = tempfile.mktemp()
+        processor = HistoryPageProcessor(tag=self.processor.tag,
+            user_talk_names=self.processor.user_talk_names)
+        processor.checkpoint, processor.checkpoint_interval = fn, 0
+
+        class Crash(Exception):
+            pass
+
+        process_page = processor.process_page
+
+        def crash(elem):
+            if processor.pages_parsed == 2:
+                raise Crash
+            process_page(elem)
+        processor.process_page = crash
+
+        try:
+            self.assertRaises(Crash, processor.parse_checkpointed,
+                              self.deflate(self.xml), 512)
+            checkpoint = read_checkpoint(fn)
+        finally:
+            os.remove(fn)
+        self.assertTrue(0 < checkpoint['pages'] <= 2)
+
+        processor = self.parallel_processor
+        processor.resume(checkpoint)
+        processor.start(self.deflate(self.xml))
+        g = processor.get_network()
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(len(g.es), len(self.g.es))
+        self.assertEquals(processor.count, self.processor.count)
+        self.assertEquals(processor.pages_parsed, 4)
+
+    def test_parallel(self):
+        processor = self.parallel_processor
+        processor.start_parallel(self.deflate(self.xml), processes=2,
+                                 shard_size=1024)
+        g = processor.get_network()
+        self.assertEquals(len(g.vs), len(self.g.vs))
+        self.assertEquals(len(g.es), len(self.g.es))
+        self.assertEquals(processor.count, self.processor.count)
+        self.assertEquals(sorted(g.vs['username']),
+                          sorted(self.g.vs['username']))
+        self.assertEquals(sorted(len(ts) for ts in g.es['timestamp']),
+                          sorted(len(ts) for ts in self.g.es['timestamp']))
+
+    def test_parallel_worker_killed(self):
+        processor = self.parallel_processor
+
+        def kill(elem):
+            ## pages are parsed by the workers only
+            os.kill(os.getpid(), signal.SIGKILL)
+        processor.process_page = kill
+        self.assertRaises(RuntimeError, processor.start_parallel,
+                          self.deflate(self.xml), processes=2, shard_size=1)
+
+    def test_timelines(self):
+        self.assertTrue(all(isinstance(ts, Timeline)
+                            for ts in self.g.es['timestamp']))
+        g = pickle.loads(pickle.dumps(self.g, pickle.HIGHEST_PROTOCOL))
+        self.assertEquals(edges(g), edges(self.g))
+
+        ## graphs saved by older versions have lists of mwlib.Message
+        old = self.g.copy()
+        old.es['timestamp'] = [list(ts) for ts in old.es['timestamp']]
+
+        times = sorted(m.time for ts in self.g.es['timestamp'] for m in ts)
+        start, end = times[len(times) / 4], times[-len(times) / 4]
+        sliced = []
+        for g in (self.g.copy(), old):
+            graph = Graph(g)
+            graph.time_slice_subgraph(start=start, end=end)
+            sliced.append(graph.g)
+        self.assertTrue(0 < len(sliced[0].es) < len(self.g.es))
+        self.assertEquals(sliced[0].es['weight'], sliced[1].es['weight'])
+        self.assertEquals([list(ts) for ts in sliced[0].es['timestamp']],
+                          sliced[1].es['timestamp'])
+
+    def test_time_index(self):
+        times = sorted(m.time for ts in self.g.es['timestamp'] for m in ts)
+        start, end = times[len(times) / 4], times[-len(times) / 4]
+
+        graph = Graph(self.g.copy())
+        view = graph.time_slice(start=start, end=end)
+        sliced = view.subgraph(graph.g)
+        self.assertEquals(len(graph.g.es), len(self.g.es))  # not changed
+        self.assertEquals(len(view.vertices), len(sliced.vs))
+
+        graph.time_slice_subgraph(start=start, end=end)
+        weights = lambda g: sorted((g.vs[e.source]['username'],
+                                    g.vs[e.target]['username'], e['weight'])
+                                   for e in g.es)
+        self.assertEquals(weights(sliced), weights(graph.g))
+        timelines = lambda g: sorted((g.vs[e.source]['username'],
+                                      g.vs[e.target]['username'],
+                                      list(e['timestamp'])) for e in g.es)
+        self.assertEquals(timelines(sliced), timelines(graph.g))
+        ## the index of the whole graph is not used any more
+        self.assertEquals(len(graph.time_index()), len(graph.g.es))
+        self.assertEquals(
+            graph.time_slice().weights.tolist(), graph.g.es['weight'])
+
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'vecwiki-20100307.graph')
+            write_graph(self.g, path)
+            view = read_time_index(path).slice(start=start, end=end)
+            self.assertEquals(weights(view.subgraph(read_graph(path))),
+                              weights(sliced))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_sliding_window(self):
+        graph = Graph(self.g.copy())
+        index = graph.time_index()
+        times = sorted(m.time for ts in self.g.es['timestamp'] for m in ts)
+        windows = [(times[i], times[i + len(times) / 3])
+                   for i in range(0, 2 * len(times) / 3, len(times) / 10)]
+
+        for start, end, stats in SlidingWindow(index).windows(windows):
+            view = graph.time_slice(start=start, end=end)
+            g = view.subgraph(graph.g)
+            self.assertEquals(stats['nodes'], len(g.vs))
+            self.assertEquals(stats['edges'], len(g.es))
+            self.assertEquals(stats['messages'], sum(g.es['weight']))
+            self.assertAlmostEquals(stats['density'], g.density())
+            self.assertAlmostEquals(stats['reciprocity'], g.reciprocity())
+            self.assertEquals(stats['max_indegree'], max(g.indegree()))
+            self.assertEquals(stats['max_outdegree'], max(g.outdegree()))
+
+        sliding = SlidingWindow(index)
+        sliding.move(start=times[1])
+        self.assertRaises(ValueError, sliding.move, start=times[0])
+
+    def test_window_stats(self):
+        index = Graph(self.g.copy()).time_index()
+        messages = Messages(index)
+        times = sorted(m.time for ts in self.g.es['timestamp'] for m in ts)
+        windows = [(times[i], times[i + len(times) / 3])
+                   for i in range(0, 2 * len(times) / 3, len(times) / 10)]
+
+        serial = [(start, end, window_stats(messages, start, end))
+                  for start, end in windows]
+        for (_, _, stats), (_, _, expected) in zip(
+            serial, SlidingWindow(index).windows(windows)):
+            for name in expected:
+                self.assertAlmostEquals(stats[name], expected[name])
+            self.assertTrue(0 < stats['giant'] <= stats['nodes'])
+            self.assertAlmostEquals(stats['mean_pagerank'],
+                                    1. / stats['nodes'])
+
+        self.assertEquals(list(parallel_windows(messages, windows,
+                                                processes=2)), serial)
+        self.assertEquals(list(parallel_windows(messages, windows,
+                                                SLIDING_METRICS, 2)),
+                          [(start, end, window_stats(messages, start, end,
+                                                     SLIDING_METRICS))
+                           for start, end in windows])
+
+    def test_update(self):
+        times = sorted(m.time for ts in self.g.es['timestamp'] for m in ts)
+        middle = times[len(times) / 2]
+
+        processor = HistoryPageProcessor(tag=self.processor.tag,
+            user_talk_names=self.processor.user_talk_names)
+        processor.welcome_pattern = self.processor.welcome_pattern
+        processor.time_end = middle
+        processor.start(self.deflate(self.xml))
+        g = processor.get_network()
+        self.assertTrue(0 < len(g.es) < len(self.g.es))
+        self.assertEquals(latest_time(g), middle)
+
+        for cache in (EdgeCache, ArrayEdgeCache):
+            ecache = cache()
+            ecache.set_nodes([name.decode('utf-8')
+                              for name in g.vs['username']])
+            processor = HistoryPageProcessor(tag=self.processor.tag,
+                user_talk_names=self.processor.user_talk_names,
+                ecache=ecache)
+            processor.welcome_pattern = self.processor.welcome_pattern
+            processor.time_start = middle + timedelta(seconds=1)
+            processor.start(self.deflate(self.xml))
+            new = processor.get_network()
+
+            updated = g.copy()
+            update_graph(updated, new)
+            self.assertEquals(sorted(updated.vs['username']),
+                              sorted(self.g.vs['username']))
+            self.assertEquals(edges(updated), edges(self.g))
+            self.assertEquals(updated.es['weight'],
+                              [len(ts) for ts in updated.es['timestamp']])
+
+    def test_array_cache(self):
+        self._test_cache(ArrayEdgeCache)
+
+    def test_spilling_cache(self):
+        self._test_cache(SpillingEdgeCache, max_size=2)
+
+    def _test_cache(self, cache, **kwargs):
+        for parallel in (False, True):
+            processor = HistoryPageProcessor(tag=self.processor.tag,
+                user_talk_names=self.processor.user_talk_names,
+                ecache=cache(**kwargs))
+            processor.welcome_pattern = self.processor.welcome_pattern
+            if parallel:
+                processor.start_parallel(self.deflate(self.xml), processes=2,
+                                         shard_size=1024)
+            else:
+                processor.start(self.deflate(self.xml))
+            g = processor.get_network()
+            self.assertEquals(sorted(g.vs['username']),
+                              sorted(self.g.vs['username']))
+            self.assertEquals(edges(g), edges(self.g))
+            self.assertEquals(g.es['weight'],
+                              [len(ts) for ts in g.es['timestamp']])
+            self.assertFalse(getattr(processor.ecache, 'runs', None))
 
 
 if __name__ == "__main__":
@@ -32,9 +32,10 @@ from django.utils.encoding import smart_str
 
 ## PROJECT LIBS
 import sonet.mediawiki as mwlib
-from sonet.lib import find_open_for_this_file
+from sonet.lib import open_dump
+from sonet.mediawiki.pageprocessor import write_checkpoint, read_checkpoint
 from sonet.timr import Timr
-from multiprocessing import Process, Pipe
+from multiprocessing import Process, Pipe, Lock
 
 ## DATABASE
 from sonet.models import get_contributions_table
@@ -296,11 +297,21 @@ class ContribDict(dict):
             self.connection.execute(self.insert, data)
 
 
-def use_contrib_dict(receiver, namespaces, lang):
+def use_contrib_dict(receiver, namespaces, lang, contributions=None):
     cd = ContribDict(namespaces, lang)
+    if contributions:
+        ## resumed from a checkpoint
+        cd.update(contributions)
 
     while 1:
         rev = receiver.recv()
+        if isinstance(rev, dict):
+            ## checkpoint sent by the processor: all the revisions before it
+            ## have been received
+            fn = rev.pop('file')
+            rev['contributions'] = dict(cd)
+            write_checkpoint(fn, rev)
+            continue
         try:
             cd.append(*rev)
         except TypeError:
@@ -337,6 +348,7 @@ class UserContributionsPageProcessor(mwlib.PageProcessor):
     _re_welcome = None
     __welcome_pattern = None
     sender = None ## multiprocessing Connection object
+    sender_lock = None ## multiprocessing Lock, used by start_parallel()
     __namespaces = None
     count_revision = 0
 
@@ -454,8 +466,13 @@ class UserContributionsPageProcessor(mwlib.PageProcessor):
         assert self._sender is not None, "Sender still not defined"
         assert self._title is not None, "Page title not defined"
         assert self._time is not None, "time not defined"
-        self.sender.send((self._sender, self._title, self._time,
-                          comment, minor))
+        if self.sender_lock is None:
+            self.sender.send((self._sender, self._title, self._time,
+                              comment, minor))
+        else:
+            with self.sender_lock:
+                self.sender.send((self._sender, self._title, self._time,
+                                  comment, minor))
 
         self._sender = None
         self._id = None
@@ -474,6 +491,21 @@ class UserContributionsPageProcessor(mwlib.PageProcessor):
             #with Timr('guppy'):
             #    logging.debug(guppy.hpy().heap())
 
+    def partial(self):
+        partial = super(UserContributionsPageProcessor, self).partial()
+        partial['count_revision'] = self.count_revision
+        return partial
+
+    def reduce(self, partial):
+        super(UserContributionsPageProcessor, self).reduce(partial)
+        self.count_revision += partial['count_revision']
+
+    def write_checkpoint(self, checkpoint):
+        ## the contributions are in the process running use_contrib_dict():
+        ## the checkpoint is saved there, together with them
+        checkpoint['file'] = self.checkpoint
+        self.sender.send(checkpoint)
+
     #def end(self):
     #    with Timr('save'):
     #        self.contribution.save(self.lang)
@@ -493,6 +525,19 @@ def opt_parse():
     p.add_option('-e', '--end', action="store",
         dest='end', type="yyyymmdd", metavar="YYYYMMDD", default=None,
         help="Look for revisions until this date")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+        default=1, metavar="N",
+        help="Parse the dump with N processes (default: %default)")
+    p.add_option('-c', '--checkpoint', action="store", dest="checkpoint",
+        default=None, metavar="FILE",
+        help="Save the state of the processing in FILE every "
+             "--checkpoint-interval seconds")
+    p.add_option('--checkpoint-interval', action="store",
+        dest="checkpoint_interval", type="int", default=600,
+        metavar="SECONDS", help="(default: %default)")
+    p.add_option('-r', '--resume', action="store_true", dest="resume",
+        default=False, help="Resume the processing from the checkpoint "
+                            "FILE, if it exists (see --checkpoint)")
     opts, args = p.parse_args()
 
     ## CHECK IF OPTIONS ARE OK
@@ -500,6 +545,10 @@ def opt_parse():
         p.error("Wrong number of arguments")
     if not os.path.exists(args[0]):
         p.error("Dump file does not exist (%s)" % (args[0],))
+    if opts.resume and not opts.checkpoint:
+        p.error("--resume requires --checkpoint")
+    if opts.checkpoint and opts.jobs > 1:
+        p.error("--checkpoint can't be used with --jobs")
     return (opts, args)
 
 
@@ -517,12 +566,7 @@ def main():
     ## SET UP FOR PROCESSING
     lang, _, _ = mwlib.explode_dump_filename(xml)
 
-    deflate, _lineno = find_open_for_this_file(xml)
-
-    if _lineno:
-        src = deflate(xml, 51)   # Read first 51 lines to extract namespaces
-    else:
-        src = deflate(xml)
+    src = open_dump(xml)
 
     tag = mwlib.get_tags(src,
         tags='page,title,revision,timestamp,contributor,username,ip'+ \
@@ -530,9 +574,7 @@ def main():
 
     namespaces = [(0, "Normal")]+mwlib.get_namespaces(src)
 
-    src.close()
     logging.info("BEGIN PARSING")
-    src = deflate(xml)
 
     processor = UserContributionsPageProcessor(tag=tag, lang=lang)
     processor.sender = sender
@@ -540,17 +582,34 @@ def main():
     processor.time_end = opts.end
     ##TODO: only works on it.wikipedia.org! :-)
     processor.welcome_pattern = r'Benvenut'
+    processor.checkpoint = opts.checkpoint
+    processor.checkpoint_interval = opts.checkpoint_interval
+
+    contributions = None
+    if opts.resume and os.path.exists(opts.checkpoint):
+        checkpoint = read_checkpoint(opts.checkpoint)
+        contributions = checkpoint.pop('contributions')
+        processor.resume(checkpoint)
 
     p = Process(target=use_contrib_dict, args=(receiver, processor.namespaces,
-                                               lang))
+                                               lang, contributions))
     p.start()
+    del contributions
 
     with Timr('PROCESSING'):
-        processor.start(src) ## PROCESSING
+        if opts.jobs > 1:
+            ## workers share the same pipe
+            processor.sender_lock = Lock()
+            processor.start_parallel(src, processes=opts.jobs)
+        else:
+            processor.start(src) ## PROCESSING
 
     sender.send(None)
     p.join() ## wait until save is complete
 
+    if opts.checkpoint and os.path.exists(opts.checkpoint):
+        os.remove(opts.checkpoint)
+
 
 if __name__ == "__main__":
     main()
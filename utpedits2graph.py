@@ -22,12 +22,18 @@ import logging
 from django.utils.encoding import smart_str
 
 ## PROJECT LIBS
-from sonet.edgecache import EdgeCache
+from sonet.edgecache import EdgeCache, ArrayEdgeCache, SpillingEdgeCache
+from sonet.timeline import pack_timelines
+from sonet.graphstore import write_graph
+from sonet.graph import load
 import sonet.mediawiki as mwlib
-from sonet.lib import find_open_for_this_file
+from sonet.lib import open_dump
+from sonet.mediawiki.pageindex import index_filename, read_index
+from sonet.mediawiki.pageprocessor import read_checkpoint
 from sonet.timr import Timr
 
 from collections import defaultdict
+from datetime import datetime, timedelta
 
 
 class HistoryPageProcessor(mwlib.PageProcessor):
@@ -57,6 +63,8 @@ class HistoryPageProcessor(mwlib.PageProcessor):
     # to limit the extraction to changes after a datetime
     time_start = None
     counter_deleted = 0
+    ## only User Talk Pages are parsed
+    fast_forward = True
     _re_welcome = None
     __welcome_pattern = None
 
@@ -165,13 +173,6 @@ class HistoryPageProcessor(mwlib.PageProcessor):
             logging.info("Counter: %d", self.count)
             print os.popen("ps v %d|awk '{print $8}'|tail -1" % os.getpid()).readline()
 
-    def delattr(self, attrs):
-        for attr in attrs:
-            try:
-                delattr(self, attr)
-            except AttributeError:
-                pass
-
     def process_comment(self, elem):
         if self._skip_revision:
             return
@@ -199,10 +200,26 @@ class HistoryPageProcessor(mwlib.PageProcessor):
             return
         self._id = elem.text
 
+    def partial(self):
+        partial = super(HistoryPageProcessor, self).partial()
+        partial['counter_deleted'] = self.counter_deleted
+        partial['ecache'] = self.ecache.partial()
+        return partial
+
+    def reduce(self, partial):
+        super(HistoryPageProcessor, self).reduce(partial)
+        self.counter_deleted += partial['counter_deleted']
+        self.ecache.reduce(partial['ecache'])
+
     def get_network(self):
         with Timr('Flushing'):
             self.ecache.flush()
-        return self.ecache.get_network(edge_label='timestamp')
+        g = self.ecache.get_network(edge_label='timestamp',
+                                    weight_label='weight')
+        ## ArrayEdgeCache packs the timelines already
+        with Timr('Packing timelines'):
+            pack_timelines(g)
+        return g
 
     def end(self):
         logging.info('TOTAL UTP: %d', self.count)
@@ -210,16 +227,62 @@ class HistoryPageProcessor(mwlib.PageProcessor):
         logging.info('DELETED: %d', self.counter_deleted)
 
 
-def save_graph(g, lang, type_, date_):
+def latest_time(g, time_label='timestamp'):
+    """
+    Returns the time (datetime) of the latest message of the graph g (None
+    if it has no messages)
+    """
+    times = [tl.times[-1] for tl in g.es[time_label] if len(tl)]
+    if not times:
+        return None
+    return datetime.utcfromtimestamp(max(times))
+
+
+def update_graph(g, new, time_label='timestamp', weight_label='weight'):
+    """
+    Adds to g, in place, the vertices and the messages of the graph new, whose
+    first vertices are the ones of g (see EdgeCache.set_nodes()). Edges of g
+    get the messages of the same edge of new.
+    """
+    n = len(g.vs)
+    names = new.vs['username']
+    if names[:n] != g.vs['username']:
+        raise ValueError('The vertices of the graphs do not match')
+    g.add_vertices(len(names) - n)
+    g.vs['username'] = names
+    del names
+
+    pairs = new.get_edgelist()
+    eids = g.get_eids(pairs=pairs, directed=True, error=False)
+    timelines = g.es[time_label]
+    added_pairs, added_timelines = [], []
+    for eid, pair, tl in zip(eids, pairs, new.es[time_label]):
+        if eid < 0:
+            added_pairs.append(pair)
+            added_timelines.append(tl)
+        else:
+            timelines[eid] = timelines[eid] + tl
+    del pairs, eids
+    logging.info('UPDATED EDGES: %d - NEW EDGES: %d',
+                 len(new.es) - len(added_pairs), len(added_pairs))
+
+    g.add_edges(added_pairs)
+    timelines.extend(added_timelines)
+    g.es[time_label] = timelines
+    g.es[weight_label] = [len(tl) for tl in timelines]
+
+
+def save_graph(g, lang, type_, date_, format_='pickle'):
 
-    counter = 0
-    with Timr('Setting weight attribute on edges'):
-        for e in g.es:
-            e['weight'] = len(e['timestamp'])
-            #e['timestamp'] = str(e['timestamp'])
-            counter += 1
-            if not counter % 10000:
-                logging.debug(counter)
+    ## HistoryPageProcessor.get_network() sets the weights already
+    if 'weight' not in g.es.attributes():
+        with Timr('Setting weight attribute on edges'):
+            g.es['weight'] = [len(ts) for ts in g.es['timestamp']]
+
+    if format_ == 'binary':
+        with Timr('Saving'):
+            write_graph(g, "%swiki-%s%s.graph" % (lang, date_, type_))
+        return
 
     with Timr('Pickling'):
         g.write("%swiki-%s%s.pickle" % (lang, date_, type_), format="pickle")
@@ -243,6 +306,38 @@ def opt_parse():
     p.add_option('-e', '--end', action="store",
         dest='end', type="yyyymmdd", metavar="YYYYMMDD", default=None,
         help="Look for revisions until this date")
+    p.add_option('-j', '--jobs', action="store", dest="jobs", type="int",
+        default=1, metavar="N",
+        help="Parse the dump with N processes (default: %default)")
+    p.add_option('-i', '--index', action="store_true", dest="index",
+        default=False, help="Parse only the User Talk Pages found in the "
+                            "page index of the dump (see dump_index.py)")
+    p.add_option('-c', '--checkpoint', action="store", dest="checkpoint",
+        default=None, metavar="FILE",
+        help="Save the state of the processing in FILE every "
+             "--checkpoint-interval seconds")
+    p.add_option('--checkpoint-interval', action="store",
+        dest="checkpoint_interval", type="int", default=600,
+        metavar="SECONDS", help="(default: %default)")
+    p.add_option('-r', '--resume', action="store_true", dest="resume",
+        default=False, help="Resume the processing from the checkpoint "
+                            "FILE, if it exists (see --checkpoint)")
+    p.add_option('-a', '--array-cache', action="store_true",
+        dest="array_cache", default=False,
+        help="Keep the edges in typed arrays instead of dicts (much less "
+             "memory, see sonet.edgecache.ArrayEdgeCache)")
+    p.add_option('-f', '--format', action="store", dest="format",
+        type="choice", choices=('pickle', 'binary'), default='pickle',
+        help="Save the graph as a pickled iGraph object or in the binary "
+             "format of sonet.graphstore (default: %default)")
+    p.add_option('-u', '--update', action="store", dest="update",
+        default=None, metavar="GRAPH",
+        help="Add to GRAPH (created from an older dump) only the revisions "
+             "made after its latest one")
+    p.add_option('--spill', action="store", dest="spill", type="int",
+        default=None, metavar="N",
+        help="Keep at most N messages in memory, writing the others to "
+             "temporary files (in $TMPDIR) merged at the end")
     opts, args = p.parse_args()
 
     ## CHECK IF OPTIONS ARE OK
@@ -250,6 +345,23 @@ def opt_parse():
         p.error("Wrong number of arguments")
     if not os.path.exists(args[0]):
         p.error("Dump file does not exist (%s)" % (args[0], ))
+    if opts.index and not os.path.exists(index_filename(args[0])):
+        p.error("Page index does not exist (%s), create it with "
+                "dump_index.py" % (index_filename(args[0]), ))
+    if opts.index and opts.jobs > 1:
+        p.error("--index and --jobs can't be used together")
+    if opts.resume and not opts.checkpoint:
+        p.error("--resume requires --checkpoint")
+    if opts.checkpoint and (opts.index or opts.jobs > 1):
+        p.error("--checkpoint can't be used with --index or --jobs")
+    if opts.update and not os.path.exists(opts.update):
+        p.error("Graph does not exist (%s)" % (opts.update, ))
+    if opts.update and opts.start:
+        p.error("--update and --start can't be used together")
+    if opts.array_cache and opts.spill:
+        p.error("--array-cache and --spill can't be used together")
+    if opts.spill is not None and opts.spill < 1:
+        p.error("--spill must be positive")
     return (opts, args)
 
 
@@ -266,17 +378,14 @@ def main():
     ## SET UP FOR PROCESSING
     lang, date_, type_ = mwlib.explode_dump_filename(xml)
 
-    deflate, _lineno = find_open_for_this_file(xml)
-
     welcome = defaultdict(str)
 
     welcome.update({'it': r'Benvenut',
                     'en': r'Welcome'})
 
-    if _lineno:
-        src = deflate(xml, 51)   # Read first 51 lines to extract namespaces
-    else:
-        src = deflate(xml)
+    ## the index and the checkpoint seek in the dump
+    src = open_dump(xml, seek=bool(opts.index or (
+        opts.resume and os.path.exists(opts.checkpoint))))
 
     tag = mwlib.get_tags(src,
                          tags='page,title,revision,timestamp,contributor,'
@@ -294,26 +403,61 @@ def main():
     assert lang_user, "User namespace not found"
     assert lang_user_talk, "User Talk namespace not found"
 
-    src.close()
-    src = deflate(xml)
+    if opts.array_cache:
+        ecache = ArrayEdgeCache()
+    elif opts.spill:
+        ecache = SpillingEdgeCache(max_size=opts.spill)
+    else:
+        ecache = EdgeCache()
 
     processor = HistoryPageProcessor(tag=tag,
-        user_talk_names=(lang_user_talk, u"User talk"))
+        user_talk_names=(lang_user_talk, u"User talk"), ecache=ecache)
     processor.time_start = opts.start
+    if opts.update:
+        with Timr('Loading graph to update'):
+            old = load(opts.update).g
+            pack_timelines(old)
+        ## revisions are in seconds
+        latest = latest_time(old)
+        if latest:
+            processor.time_start = latest + timedelta(seconds=1)
+        logging.info('Updating graph: revisions since %s',
+                     processor.time_start)
+        ecache.set_nodes([name.decode('utf-8')
+                          for name in old.vs['username']])
     processor.time_end = opts.end
     processor.welcome_pattern = welcome[lang]
+    processor.checkpoint = opts.checkpoint
+    processor.checkpoint_interval = opts.checkpoint_interval
+    if opts.resume and os.path.exists(opts.checkpoint):
+        processor.resume(read_checkpoint(opts.checkpoint))
 
     with Timr('Processing'):
-        processor.start(src) ## PROCESSING
+        if opts.index:
+            ## User Talk namespace
+            processor.start(src, index=read_index(index_filename(xml)),
+                            namespaces=(3,))
+        elif opts.jobs > 1:
+            processor.start_parallel(src, processes=opts.jobs)
+        else:
+            processor.start(src) ## PROCESSING
 
     with Timr('Getting network'):
         g = processor.get_network()
 
+    if opts.update:
+        with Timr('Updating graph'):
+            update_graph(old, g)
+        g = old
+
     logging.info("Nodes: %d", len(g.vs))
     logging.info("Edges: %d", len(g.es))
 
     with Timr('Saving graph'):
-        save_graph(g, lang, type_, date_)
+        save_graph(g, lang, type_, date_, opts.format)
+
+    if opts.checkpoint and os.path.exists(opts.checkpoint):
+        os.remove(opts.checkpoint)
 
 if __name__ == "__main__":
     main()